@@ -0,0 +1,389 @@
+import re
+import time
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
+from heapq import nlargest
+from operator import itemgetter
+
+logger = logging.getLogger('twitch_bot')
+
+# Seconds of chat the statistics cover
+WINDOW = 60.0
+# Counts are brought up to date this often; commands read the last result
+REFRESH_INTERVAL = 1.0
+# Messages held per channel; a channel that outruns this covers less than WINDOW
+CHANNEL_CAPACITY = 65536
+# Words are counted in buckets of this many seconds; top lists are ranked again as each one closes
+BUCKET = 5.0
+# Entries kept in each top list
+TOP_N = 5
+# A raid-like spike: the last SPIKE_WINDOW seconds run at SPIKE_FACTOR times the rate before them...
+SPIKE_WINDOW = 10.0
+SPIKE_FACTOR = 3.0
+# ...with at least this many messages
+SPIKE_MIN_MESSAGES = 30
+# Too common to be interesting in a top list
+STOPWORDS = frozenset((
+    'a', 'an', 'the', 'and', 'or', 'but', 'is', 'are', 'was', 'be', 'it', 'its', "it's", 'i', "i'm", 'im',
+    'me', 'my', 'you', 'your', 'u', 'he', 'she', 'we', 'they', 'this', 'that', 'to', 'of', 'in', 'on', 'at',
+    'for', 'with', 'so', 'do', 'if', 'just', 'not', 'no', 'yes', 'what', 'have', 'can', 'all', 'like',
+))
+
+# Emote IDs in emotes tags joined with '/': id:start-end,start-end/id:start-end
+_EMOTE_ID = re.compile(r'(?:^|/)([^/:]+):')
+
+
+def _subtract(totals, counts):
+    """Take counts out of totals, dropping keys that reach zero"""
+    for key, count in counts.items():
+        left = totals[key] - count
+        if left:
+            totals[key] = left
+        else:
+            del totals[key]
+
+
+class MessageRing:
+    """Arrival times and chatter ids of messages in two typed arrays that wrap around at `capacity`.
+
+    Messages are addressed by row, the number of messages appended before
+    them, so a row keeps its number while the arrays wrap.
+    """
+
+    __slots__ = ('times', 'users', 'capacity', 'end')
+
+    def __init__(self, capacity):
+        self.times = array('d')
+        self.users = array('l')
+        self.capacity = capacity
+        self.end = 0
+
+    def append(self, at, user):
+        end = self.end
+        if end < self.capacity:
+            self.times.append(at)
+            self.users.append(user)
+        else:
+            slot = end % self.capacity
+            self.times[slot] = at
+            self.users[slot] = user
+        self.end = end + 1
+
+    def time(self, row):
+        return self.times[row % self.capacity]
+
+    def rows(self, column, start, stop):
+        """Rows start..stop-1 of a column as one array"""
+        first = start % self.capacity
+        last = first + stop - start
+        if last <= self.capacity:
+            return column[first:last]
+        return column[first:] + column[:last - self.capacity]
+
+    def bisect(self, at, start, stop):
+        """The first of rows start..stop-1 that arrived at or after `at`, or stop"""
+        times, capacity = self.times, self.capacity
+        first = start % capacity
+        last = first + stop - start
+        if last <= capacity:
+            return start + bisect_left(times, at, first, last) - first
+        # Wrapped: the part up to the end of the arrays, then the part from their start
+        if times[capacity - 1] >= at:
+            return start + bisect_left(times, at, first, capacity) - first
+        return start + capacity - first + bisect_left(times, at, 0, last - capacity)
+
+
+class ChannelStats:
+    """A channel's statistics as of the last refresh; top lists are (name, count) pairs"""
+
+    __slots__ = ('channel', 'span', 'messages', 'chatters', 'per_minute', 'top_words', 'top_emotes',
+                 'top_chatters', 'spiking')
+
+    def __init__(self, channel, span, messages, chatters, top_words, top_emotes, top_chatters, spiking):
+        self.channel = channel
+        self.span = span
+        self.messages = messages
+        self.chatters = chatters
+        self.per_minute = messages / span * 60
+        self.top_words = top_words
+        self.top_emotes = top_emotes
+        self.top_chatters = top_chatters
+        self.spiking = spiking
+
+
+class ChannelWindow:
+    """Sliding-window chat statistics for one channel.
+
+    A message only appends its arrival time and interned chatter id to a
+    MessageRing, and its text to a list. refresh() folds everything new
+    into the counts in one batched pass, expires what fell out of the
+    window and precomputes a ChannelStats. Message and chatter counts are
+    exact to the window; words cover it in whole buckets, and emotes are
+    counted from the words they are typed as, names learnt from the tags.
+    """
+
+    def __init__(self, name, window, capacity, now, top_n=TOP_N):
+        self.name = name
+        self.window = window
+        self.capacity = capacity
+        self.top_n = top_n
+        # Start of the time covered; moves up if the ring overflows
+        self.since = now
+        self.ring = MessageRing(capacity)
+        # Rows start..counted-1 are in the counts, counted..end-1 arrived since the last refresh
+        self.start = 0
+        self.counted = 0
+        self.user_ids = {}
+        self.user_names = []
+        self._free_ids = []
+        self.chatters = Counter()
+        # Words of the closed buckets still in the window, and of each of those buckets
+        self.words = Counter()
+        self._buckets = deque()
+        self._bucket = Counter()
+        self._bucket_number = int(now // BUCKET)
+        # Emote ID -> name, and lowercased name (as counted in words) -> name
+        self.emote_ids = {}
+        self.emote_words = {}
+        self._text = []
+        self._emote_tags = []
+        self._ranked = None
+        self.spiking = False
+        self.overflows = 0
+        self.snapshot = None
+
+    @property
+    def empty(self):
+        return self.start == self.ring.end and not self._buckets and not self._bucket
+
+    def add(self, at, user, content, emotes=None):
+        if self.ring.end - self.start >= self.capacity:
+            self._make_room()
+        user_id = self.user_ids.get(user)
+        if user_id is None:
+            user_id = self._intern(user)
+        self.ring.append(at, user_id)
+        # Commands are counted as messages but kept out of the words
+        if content and content[0] != '!':
+            self._text.append(content)
+            if emotes:
+                self._emote_tags.append((content, emotes))
+
+    def _intern(self, user):
+        if self._free_ids:
+            user_id = self._free_ids.pop()
+            self.user_names[user_id] = user
+        else:
+            user_id = len(self.user_names)
+            self.user_names.append(user)
+        self.user_ids[user] = user_id
+        return user_id
+
+    def chatter_count(self, user):
+        """Messages from a chatter in the window as of the last refresh"""
+        user_id = self.user_ids.get(user)
+        return self.chatters.get(user_id, 0) if user_id is not None else 0
+
+    def _make_room(self):
+        """Chat outran the ring: drop its oldest quarter from the window early"""
+        self.overflows += 1
+        self._count()
+        self._evict(self.start + self.capacity // 4)
+        self.since = self.ring.time(self.start)
+
+    def _count(self):
+        ring = self.ring
+        if self.counted < ring.end:
+            self.chatters.update(ring.rows(ring.users, self.counted, ring.end))
+            self.counted = ring.end
+
+    def _evict(self, cut):
+        # Every row is counted by now, so an id whose count reaches zero is referenced nowhere
+        chatters = self.chatters
+        for user_id, count in Counter(self.ring.rows(self.ring.users, self.start, cut)).items():
+            left = chatters[user_id] - count
+            if left:
+                chatters[user_id] = left
+            else:
+                del chatters[user_id]
+                del self.user_ids[self.user_names[user_id]]
+                self.user_names[user_id] = None
+                self._free_ids.append(user_id)
+        self.start = cut
+
+    def _count_text(self, now):
+        number = int(now // BUCKET)
+        if number != self._bucket_number:
+            # Buckets join and leave the window totals whole: a loop over distinct words, not over messages
+            if self._bucket:
+                self.words.update(self._bucket)
+                self._buckets.append((self._bucket_number, self._bucket))
+                self._bucket = Counter()
+            self._bucket_number = number
+            while self._buckets and (self._buckets[0][0] + 1) * BUCKET <= now - self.window:
+                _subtract(self.words, self._buckets.popleft()[1])
+            self._ranked = None
+        if self._text:
+            self._bucket.update(' '.join(self._text).lower().split())
+            self._text = []
+        if self._emote_tags:
+            self._learn_emotes()
+
+    def _learn_emotes(self):
+        tags, self._emote_tags = self._emote_tags, []
+        # One pass over all the tags finds the IDs; messages are only looked at for new ones
+        if set(_EMOTE_ID.findall('/'.join(tag for _, tag in tags))) <= self.emote_ids.keys():
+            return
+        for content, tag in tags:
+            for emote in tag.split('/'):
+                emote_id, _, ranges = emote.partition(':')
+                if emote_id in self.emote_ids:
+                    continue
+                first, _, last = ranges.partition(',')[0].partition('-')
+                try:
+                    name = content[int(first):int(last) + 1]
+                except ValueError:
+                    continue
+                self.emote_ids[emote_id] = name
+                self.emote_words[name.lower()] = name
+
+    def _spike(self, now):
+        end = self.ring.end
+        recent_start = self.ring.bisect(now - SPIKE_WINDOW, self.start, end)
+        recent = end - recent_start
+        observed = min(self.window, now - self.since) - SPIKE_WINDOW
+        # Too little chat seen before the recent stretch to compare against
+        if observed < SPIKE_WINDOW or recent < SPIKE_MIN_MESSAGES:
+            return False
+        return recent / SPIKE_WINDOW >= SPIKE_FACTOR * (recent_start - self.start) / observed
+
+    def _rank(self):
+        """Top words, emotes and chatters, once per bucket"""
+        top_n, words, emote_words = self.top_n, self.words, self.emote_words
+        # Emotes have their own list; a set intersection finds which of them, and stopwords, to skip
+        skip = words.keys() & (STOPWORDS | emote_words.keys())
+        top_words = [item for item in nlargest(top_n + len(skip), words.items(), key=itemgetter(1))
+                     if item[0] not in skip][:top_n]
+        top_emotes = nlargest(top_n, ((emote_words[word], words[word]) for word in words.keys() & emote_words.keys()),
+                              key=itemgetter(1))
+        names = self.user_names
+        top_chatters = [(names[user_id], count)
+                        for user_id, count in nlargest(top_n, self.chatters.items(), key=itemgetter(1))]
+        return top_words, top_emotes, top_chatters
+
+    def refresh(self, now):
+        """Count what arrived, expire what left the window; returns True when a spike starts"""
+        self._count()
+        self._count_text(now)
+        cut = self.ring.bisect(now - self.window, self.start, self.ring.end)
+        if cut > self.start:
+            self._evict(cut)
+        was_spiking, self.spiking = self.spiking, self._spike(now)
+        if self._ranked is None:
+            self._ranked = self._rank()
+        span = max(1.0, min(self.window, now - self.since))
+        self.snapshot = ChannelStats(self.name, span, self.ring.end - self.start, len(self.chatters),
+                                     *self._ranked, self.spiking)
+        return self.spiking and not was_spiking
+
+
+class ChatAnalytics:
+    """Message listener keeping sliding-window chat statistics for every channel.
+
+    Register it with bot.add_message_listener(analytics). A message is only
+    appended to its channel's columns; every refresh_interval seconds one
+    batched pass per channel brings the counts up to date, and commands
+    read the precomputed ChannelStats through window() and chatter_count().
+    on_spike(stats) is called when a channel's rate jumps the way it does
+    when a raid arrives. With refresh_interval 0 the caller runs refresh().
+    """
+
+    def __init__(self, window=WINDOW, refresh_interval=REFRESH_INTERVAL, capacity=CHANNEL_CAPACITY,
+                 top_n=TOP_N, on_spike=None, clock=time.monotonic):
+        self.window_seconds = window
+        self.refresh_interval = refresh_interval
+        self.capacity = capacity
+        self.top_n = top_n
+        self.on_spike = on_spike
+        self.clock = clock
+        self.channels = {}
+        self._timer = None
+        # Metrics
+        self.messages = 0
+        self.refreshes = 0
+        self.spikes = 0
+        self.refresh_time = 0.0
+        self.max_refresh_time = 0.0
+
+    async def __call__(self, message):
+        if message.author is None or message.channel is None:
+            return
+        self.add(message.channel.name, message.author.name, message.content,
+                 (message.tags or {}).get('emotes'))
+
+    def add(self, channel, user, content, emotes=None):
+        """Record a message; emotes is its IRC emotes tag, if any"""
+        self.messages += 1
+        now = self.clock()
+        window = self.channels.get(channel)
+        if window is None:
+            window = self.channels[channel] = ChannelWindow(channel, self.window_seconds, self.capacity, now,
+                                                            self.top_n)
+            if self._timer is None and self.refresh_interval:
+                self._timer = asyncio.get_running_loop().call_later(self.refresh_interval, self._tick)
+        window.add(now, user, content, emotes)
+
+    def _tick(self):
+        self._timer = None
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Chat analytics refresh failed: {str(e)}")
+        if self.channels:
+            self._timer = asyncio.get_running_loop().call_later(self.refresh_interval, self._tick)
+
+    def refresh(self):
+        """Bring every channel's statistics up to date; channels with nothing left in the window are dropped"""
+        started = time.perf_counter()
+        now = self.clock()
+        for name, window in list(self.channels.items()):
+            spike = window.refresh(now)
+            if window.empty:
+                del self.channels[name]
+            elif spike:
+                self.spikes += 1
+                stats = window.snapshot
+                logger.info(f"Chat spike in #{name}: {stats.per_minute:.0f} messages/min "
+                            f"from {stats.chatters} chatters")
+                if self.on_spike is not None:
+                    self.on_spike(stats)
+        elapsed = time.perf_counter() - started
+        self.refreshes += 1
+        self.refresh_time += elapsed
+        if elapsed > self.max_refresh_time:
+            self.max_refresh_time = elapsed
+
+    def window(self, channel):
+        """The channel's ChannelStats as of the last refresh, or None if it has been quiet"""
+        window = self.channels.get(channel)
+        return window.snapshot if window is not None else None
+
+    def chatter_count(self, channel, user):
+        """Messages from a chatter in the channel's window as of the last refresh"""
+        window = self.channels.get(channel)
+        return window.chatter_count(user) if window is not None else 0
+
+    def stats(self):
+        return {'channels': len(self.channels), 'messages': self.messages, 'refreshes': self.refreshes,
+                'spikes': self.spikes,
+                'overflows': sum(window.overflows for window in self.channels.values()),
+                'avg_refresh_time': self.refresh_time / self.refreshes if self.refreshes else 0.0,
+                'max_refresh_time': self.max_refresh_time}
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -0,0 +1,231 @@
+"""Throughput, memory and query cost of ChatAnalytics at a high chat rate.
+
+    python benchmarks/bench_analytics.py [--rate 5000] [--seconds 120] [--channels 5] [--chatters 20000]
+
+Feeds --seconds of synthetic chat at --rate messages per second (on a
+virtual clock, refreshing once a simulated second) into ChatAnalytics and
+into the naive approach of updating dicts on every message. Reports CPU
+per message and as a share of one core at that rate, memory held at the
+end, and the cost of answering !top. Then a raid multiplies one channel's
+chat by five and reports how long until it is flagged as a spike, and
+five seconds on the real event loop show what the refresh timer does to
+loop lag.
+"""
+import argparse
+import asyncio
+import gc
+import random
+import time
+import tracemalloc
+from collections import Counter, deque
+from heapq import nlargest
+from operator import itemgetter
+
+from common import FakeClock, LoopLagProbe, percentile
+from analytics import ChatAnalytics, TOP_N
+from replay import WORDS
+
+EMOTES = ('Kappa', 'LUL', 'PogChamp', 'monkaS', 'Kreygasm', 'BibleThump', 'ResidentSleeper', 'NotLikeThis')
+
+
+def message_pool(count, seed=1):
+    """Distinct (content, emotes tag) pairs: chat words with an emote now and then"""
+    rng = random.Random(seed)
+    vocabulary = list(WORDS) + [f'word{index}' for index in range(3000)]
+    pool = []
+    for _ in range(count):
+        tokens = rng.choices(vocabulary, k=rng.randint(2, 12))
+        uses = {}
+        if rng.random() < 0.3:
+            for slot in rng.sample(range(len(tokens)), min(len(tokens), rng.randint(1, 3))):
+                tokens[slot] = rng.choice(EMOTES)
+        content = ' '.join(tokens)
+        position = 0
+        for token in tokens:
+            if token in EMOTES:
+                uses.setdefault(EMOTES.index(token), []).append(f'{position}-{position + len(token) - 1}')
+            position += len(token) + 1
+        pool.append((content, '/'.join(f"{emote}:{','.join(spans)}" for emote, spans in uses.items())))
+    return pool
+
+
+def chat(args, pool, seconds, seed=2, raid=None):
+    """Yield one simulated second of (channel, user, content, emotes) at a time"""
+    rng = random.Random(seed)
+    channels = [f'channel{index:02d}' for index in range(args.channels)]
+    users = [f'chatter{index}' for index in range(args.chatters)]
+    for second in range(seconds):
+        batch = []
+        for _ in range(args.rate):
+            content, emotes = rng.choice(pool)
+            batch.append((rng.choice(channels), rng.choice(users), content, emotes))
+        if raid is not None and second >= raid:
+            for _ in range(args.rate // args.channels * 4):
+                content, emotes = rng.choice(pool)
+                batch.append((channels[0], f'raider{rng.randrange(5000)}', content, emotes))
+        yield batch
+
+
+def emote_names(content, tag):
+    """The name of every emote use an IRC emotes tag (id:start-end,start-end/...) describes"""
+    names = []
+    for emote in tag.split('/'):
+        ranges = emote.partition(':')[2]
+        first, _, last = ranges.partition(',')[0].partition('-')
+        names += [content[int(first):int(last) + 1]] * (ranges.count(',') + 1)
+    return names
+
+
+class NaiveAnalytics:
+    """A deque of message records and Counters updated per message, the obvious first implementation"""
+
+    def __init__(self, window, clock):
+        self.window = window
+        self.clock = clock
+        self.channels = {}
+
+    def add(self, channel, user, content, emotes=None):
+        now = self.clock()
+        state = self.channels.get(channel)
+        if state is None:
+            state = self.channels[channel] = (deque(), Counter(), Counter(), Counter())
+        records, chatters, words, emote_counts = state
+        tokens = content.lower().split()
+        names = emote_names(content, emotes) if emotes else []
+        records.append((now, user, tokens, names))
+        chatters[user] += 1
+        words.update(tokens)
+        emote_counts.update(names)
+        cutoff = now - self.window
+        while records[0][0] < cutoff:
+            _, old_user, old_tokens, old_names = records.popleft()
+            chatters[old_user] -= 1
+            if not chatters[old_user]:
+                del chatters[old_user]
+            words.subtract(old_tokens)
+            emote_counts.subtract(old_names)
+
+    def refresh(self):
+        pass
+
+    def top(self, channel):
+        _, chatters, words, emote_counts = self.channels[channel]
+        return (nlargest(TOP_N, words.items(), key=itemgetter(1)),
+                nlargest(TOP_N, emote_counts.items(), key=itemgetter(1)),
+                nlargest(TOP_N, chatters.items(), key=itemgetter(1)))
+
+
+def feed(analytics, clock, batches, refresh_times=None):
+    """Spread each second's messages over it, refreshing at the end of every second"""
+    for batch in batches:
+        step = 1.0 / len(batch)
+        add = analytics.add
+        for channel, user, content, emotes in batch:
+            clock.now += step
+            add(channel, user, content, emotes)
+        started = time.perf_counter()
+        analytics.refresh()
+        if refresh_times is not None:
+            refresh_times.append(time.perf_counter() - started)
+
+
+def measure(name, build, args, pool, query):
+    clock = FakeClock()
+    analytics = build(clock)
+    batches = list(chat(args, pool, args.seconds))
+    refresh_times = []
+    # Timing and memory are separate passes; tracemalloc slows every allocation
+    gc.collect()
+    start = time.perf_counter()
+    feed(analytics, clock, batches, refresh_times)
+    elapsed = time.perf_counter() - start
+    messages = args.rate * args.seconds
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        query(analytics, 'channel00')
+    query_time = (time.perf_counter() - start) / 1000
+
+    del analytics
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    clock = FakeClock()
+    analytics = build(clock)
+    feed(analytics, clock, batches)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    refresh_times.sort()
+    print(f"{name}: {elapsed / messages * 1e9:.0f} ns/msg ({elapsed / args.seconds * 100:.1f}% of a core at "
+          f"{args.rate} msgs/s, {messages / elapsed:,.0f} msgs/s max), {used / 1024 / 1024:.1f} MiB held, "
+          f"!top query {query_time * 1e6:.1f}us; refresh p50 {percentile(refresh_times, 50) * 1000:.2f}ms "
+          f"max {refresh_times[-1] * 1000:.2f}ms")
+    return analytics
+
+
+def raid(args, pool):
+    clock = FakeClock()
+    analytics = ChatAnalytics(refresh_interval=0, clock=clock)
+    flagged = []
+    analytics.on_spike = lambda stats: flagged.append((clock.now, stats))
+    warmup = 90
+    raid_start = None
+    for second, batch in enumerate(chat(args, pool, warmup + 30, seed=3, raid=warmup)):
+        if second == warmup:
+            raid_start = clock.now
+        feed(analytics, clock, [batch])
+        if flagged:
+            break
+    if not flagged:
+        print("raid: not flagged as a spike")
+        return
+    at, stats = flagged[0]
+    print(f"raid: 5x chat in {stats.channel} flagged as a spike {at - raid_start:.0f}s in "
+          f"({stats.per_minute:,.0f} msgs/min, {stats.chatters} chatters); spikes elsewhere: "
+          f"{sum(1 for _, other in flagged if other.channel != stats.channel)}")
+
+
+async def live(args, pool):
+    """The listener on a real clock and loop: the refresh timer's effect on event-loop lag"""
+    analytics = ChatAnalytics()
+    probe = LoopLagProbe()
+    probe.start()
+    for batch in chat(args, pool, 5, seed=4):
+        start = time.perf_counter()
+        for index, (channel, user, content, emotes) in enumerate(batch):
+            analytics.add(channel, user, content, emotes)
+            if index % 50 == 49:
+                await asyncio.sleep(max(0.0, start + (index + 1) / args.rate - time.perf_counter()))
+    await probe.stop()
+    lag = probe.summary()
+    stats = analytics.stats()
+    await analytics.close()
+    print(f"live, {args.rate} msgs/s for 5s: {stats['refreshes']} timer refreshes averaging "
+          f"{stats['avg_refresh_time'] * 1000:.2f}ms, loop lag p99 {lag['p99_ms']:.2f}ms max {lag['max_ms']:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rate', type=int, default=5000)
+    parser.add_argument('--seconds', type=int, default=120)
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--chatters', type=int, default=20000)
+    args = parser.parse_args()
+
+    pool = message_pool(20000)
+    print(f"{args.channels} channels, {args.rate} msgs/s for {args.seconds}s "
+          f"({args.rate * args.seconds:,} messages from {args.chatters:,} chatters), 60s window")
+    measure('naive per-message dicts', lambda clock: NaiveAnalytics(60.0, clock), args, pool,
+            lambda analytics, channel: analytics.top(channel))
+    analytics = measure('ChatAnalytics', lambda clock: ChatAnalytics(refresh_interval=0, clock=clock), args, pool,
+                        lambda analytics, channel: analytics.window(channel))
+    top = analytics.window('channel00')
+    print(f"  channel00: {top.per_minute:,.0f} msgs/min from {top.chatters} chatters; top words {top.top_words}, "
+          f"emotes {top.top_emotes}")
+    raid(args, pool)
+    asyncio.run(live(args, pool))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Join many channels against a fake Twitch IRC server and push chat through every shard.
+
+    python benchmarks/bench_channels.py [--channels 500] [--shard-size 100]
+                                        [--join-limit 2000] [--join-per 10] [--messages 20000]
+
+The default join limit is the verified-bot rate; pass --join-limit 20 to see
+the normal-account rate (500 channels then take about four minutes). The
+fake server records when each channel is joined, so the busiest window shows
+whether the limit was respected.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import aiohttp
+
+from common import make_bot, point_at_stub
+from fake_irc import FakeIRC
+from stub_twitch import StubTwitch
+
+
+async def wait_for(predicate, timeout):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError('benchmark condition not reached in time')
+        await asyncio.sleep(0.005)
+
+
+async def run(args):
+    irc = FakeIRC()
+    stub = StubTwitch(delay=0)
+    os.environ['TWITCH_IRC_URL'] = await irc.start()
+    point_at_stub(await stub.start())
+
+    from send_queue import TokenBucket
+
+    bot = make_bot()
+    manager = bot.channels
+    manager.shard_size = args.shard_size
+    manager.join_bucket = TokenBucket(args.join_limit, args.join_per)
+    names = [f'bench{index:04d}' for index in range(args.channels)]
+    # Every tenth channel runs with greet disabled, to exercise per-channel config
+    manager.join(*names[::10], disabled_commands=['greet'])
+    manager.join(*[name for index, name in enumerate(names) if index % 10])
+
+    received = 0
+
+    async def count(message):
+        nonlocal received
+        received += 1
+    bot.add_message_listener(count, queue_size=0)
+
+    bot._http.nick = 'benchbot'
+    bot._http.session = aiohttp.ClientSession()
+    bot._closing = asyncio.Event()
+    total = len(manager.channels)
+    start = time.perf_counter()
+    await bot._connection._connect()
+    await wait_for(lambda: irc.joined() == total, timeout=max(60.0, total / args.join_limit * args.join_per * 2))
+    joined_in = time.perf_counter() - start
+    stats = manager.stats()
+    print(f"joined {total} channels in {joined_in:.2f}s over {stats['shards']} connections "
+          f"({irc.join_commands} JOIN commands), per shard: {stats['channels_per_shard']}")
+    print(f"busiest {args.join_per:g}s window: {irc.max_joins_in_window(args.join_per)} joins "
+          f"(limit {args.join_limit})")
+    print(f"greet allowed in bench0000: {manager.allows('bench0000', 'greet')}, "
+          f"in bench0001: {manager.allows('bench0001', 'greet')}")
+
+    start = time.perf_counter()
+    for index in range(args.messages):
+        await irc.say(names[index % len(names)], f'hello {index}')
+    await wait_for(lambda: received >= args.messages, timeout=120.0)
+    elapsed = time.perf_counter() - start
+    print(f"{args.messages} messages across {len(names)} channels: {args.messages / elapsed:,.0f} msgs/sec")
+
+    await bot.close()
+    await bot._http.session.close()
+    await irc.stop()
+    await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--channels', type=int, default=500)
+    parser.add_argument('--shard-size', type=int, default=100)
+    parser.add_argument('--join-limit', type=int, default=2000)
+    parser.add_argument('--join-per', type=float, default=10.0)
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
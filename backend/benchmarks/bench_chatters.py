@@ -0,0 +1,151 @@
+"""Memory per chatter and per-message cost of ChatterRegistry.
+
+    python benchmarks/bench_chatters.py [--chatters 100000] [--messages 1000000]
+
+Messages carry twitchio Chatter authors built from realistic tags for
+--chatters distinct chatters. Reports:
+
+1. memory the registry keeps for all of them once the messages are gone,
+   against a dict per chatter of the parsed tags;
+2. per-message cost of the bot's checks: is it the bot, and is the author
+   privileged (moderation's exemption, !perf), done the old way (lowercasing
+   both logins, splitting the badges tag, twitchio's is_mod/is_broadcaster)
+   and through ChatterRegistry.observe;
+3. --messages messages from twice as many chatters as the registry holds:
+   hit rate and evictions of the LRU.
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from twitchio.chatter import Chatter
+
+from common import SAMPLE_TAGS
+from chatters import ChatterRegistry, PRIVILEGED, SELF
+
+BOT_USERNAME = 'BenchBot'
+# Badges tags in roughly the mix a busy channel sees
+BADGES = ([''] * 40 + ['premium/1'] * 10 + [f'subscriber/{months}' for months in (0, 3, 6, 9, 12, 24, 36)] * 5
+          + [f'subscriber/{months},premium/1' for months in (3, 12)] * 3
+          + ['vip/1', 'moderator/1,subscriber/12', 'founder/0', 'glhf-pledge/1', 'subscriber/6,sub-gifter/5'])
+
+
+def build_messages(count, seed=1):
+    rng = random.Random(seed)
+    channel = SimpleNamespace(name='benchchannel')
+    messages = []
+    for index in range(count):
+        login = f'chatter{index}'
+        badges = rng.choice(BADGES)
+        tags = dict(SAMPLE_TAGS, **{'user-id': str(10_000_000 + index), 'display-name': login.capitalize(),
+                                    'badges': badges, 'mod': '1' if 'moderator' in badges else '0',
+                                    'subscriber': '1' if 'subscriber' in badges else '0'})
+        author = Chatter(None, name=login, channel=channel, tags=tags)
+        messages.append(SimpleNamespace(author=author, tags=tags, channel=channel, content='hello'))
+    return messages
+
+
+def old_checks(message):
+    """event_message's self check, moderation's exemption and !perf's check as they were"""
+    author = message.author
+    if author is None or author.name.lower() == BOT_USERNAME.lower():
+        return False
+    badges = (message.tags or {}).get('badges') or ''
+    exempt = bool(getattr(author, 'is_mod', False)) or any(
+        badge.startswith(('broadcaster/', 'vip/')) for badge in badges.split(','))
+    return exempt or author.is_broadcaster or author.is_mod
+
+
+def registry_checks(registry):
+    def checks(message):
+        chatter = registry.observe(message)
+        if chatter is None or chatter.roles & SELF:
+            return False
+        # Moderation observes the same message again, answered from the last-message cache
+        return bool(registry.observe(message).roles & PRIVILEGED) or chatter.is_mod
+    return checks
+
+
+def observe_only(registry):
+    def observe(message):
+        # Forget the last message, so every call is a full lookup
+        registry._last_message = None
+        return registry.observe(message)
+    return observe
+
+
+def naive_record(message):
+    tags = message.tags
+    return {'id': tags['user-id'], 'login': message.author.name, 'display_name': tags['display-name'],
+            'badges': dict(badge.split('/') for badge in tags['badges'].split(',')) if tags['badges'] else {},
+            'mod': tags['mod'] == '1', 'subscriber': tags['subscriber'] == '1'}
+
+
+def held(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return kept, used
+
+
+def per_message(checks, messages, rounds=7):
+    """Nanoseconds per message in the fastest of several rounds, as timeit reports, to keep noise out"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for message in messages:
+            checks(message)
+        best = min(best, time.perf_counter() - start)
+    return best / len(messages) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chatters', type=int, default=100_000)
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    # Messages are built inside the measurement and dropped, so what counts is what outlives them
+    def fill():
+        registry = ChatterRegistry(maxsize=args.chatters, self_login=BOT_USERNAME)
+        for message in build_messages(args.chatters):
+            registry.observe(message)
+        return registry
+    registry, used = held(fill)
+    _, naive_used = held(lambda: {message.tags['user-id']: naive_record(message)
+                                  for message in build_messages(args.chatters)})
+    print(f"{args.chatters:,} chatters: ChatterRegistry {used / 1024 / 1024:.1f} MiB "
+          f"({used / args.chatters:.0f} B/chatter, {registry.stats()['badge_sets']} badge sets parsed); "
+          f"dict of parsed tags per chatter {naive_used / 1024 / 1024:.1f} MiB "
+          f"({naive_used / args.chatters:.0f} B/chatter)")
+
+    sample = build_messages(20_000)
+    print(f"per message, old checks: {per_message(old_checks, sample):.0f} ns; "
+          f"through the registry: {per_message(registry_checks(registry), sample):.0f} ns "
+          f"(observe alone {per_message(observe_only(registry), sample):.0f} ns)")
+
+    # Zipf-like activity: a few chatters send most messages
+    rng = random.Random(2)
+    population = build_messages(args.chatters * 2, seed=3)
+    registry = ChatterRegistry(maxsize=args.chatters, self_login=BOT_USERNAME)
+    picks = [population[min(int(rng.paretovariate(0.8)) - 1, len(population) - 1)] if rng.random() < 0.7
+             else rng.choice(population) for _ in range(args.messages)]
+    start = time.perf_counter()
+    for message in picks:
+        registry.observe(message)
+    elapsed = time.perf_counter() - start
+    stats = registry.stats()
+    # The same chatter twice in a row is answered from the last-message cache, which is neither
+    print(f"{args.messages:,} messages from {len(population):,} chatters into {args.chatters:,} slots: "
+          f"{stats['hits'] / (stats['hits'] + stats['misses']):.0%} hits, {stats['evictions']:,} evictions, "
+          f"{elapsed / args.messages * 1e9:.0f} ns/message")
+
+
+if __name__ == '__main__':
+    main()
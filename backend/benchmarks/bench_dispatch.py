@@ -0,0 +1,129 @@
+"""Replay a chat corpus through command matching: old split('!') scan vs CommandRouter.
+
+    python benchmarks/bench_dispatch.py [--lines 1000000] [--corpus chat.txt] [--rounds 7]
+
+Without --corpus a synthetic corpus is generated: mostly plain chat, some
+lines with '!' in URLs or mid-sentence, and a few real commands.
+"""
+import argparse
+import random
+import tracemalloc
+from types import SimpleNamespace
+
+from common import Timer
+from command_router import CommandRouter
+
+WORDS = ['hello', 'lol', 'pog', 'gg', 'nice', 'play', 'what', 'is', 'this', 'stream', 'KEKW', 'wow']
+COMMANDS = [f'cmd{i}' for i in range(50)] + ['greet']
+
+
+def synthetic_corpus(lines, seed=1):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(lines):
+        roll = rng.random()
+        words = ' '.join(rng.choices(WORDS, k=rng.randint(2, 12)))
+        if roll < 0.05:
+            corpus.append(f'!{rng.choice(COMMANDS)} {words}')
+        elif roll < 0.08:
+            corpus.append(f'!nosuchcommand {words}')
+        elif roll < 0.15:
+            corpus.append(f'{words} wow! amazing! https://example.com/#!/clip {words}')
+        else:
+            corpus.append(words)
+    return corpus
+
+
+def build_commands():
+    commands = {}
+    for name in COMMANDS:
+        commands[name] = SimpleNamespace(name=name, aliases=[f'{name}_alias'])
+    return commands
+
+
+def make_old_match(commands):
+    """The pre-router event_message extraction"""
+    def old_match(content):
+        if '!' in content:
+            parts = content.split('!')
+            if len(parts) > 1:
+                stripped = parts[1].strip()
+                if not stripped:
+                    return None
+                command_name = stripped.split()[0]
+                return commands.get(command_name.lower())
+        return None
+    return old_match
+
+
+def noop(content):
+    return None
+
+
+def transient_bytes(match, lines):
+    """Sum of peak traced bytes above the baseline, one message at a time"""
+    tracemalloc.start()
+    total = 0
+    for line in lines:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        match(line)
+        total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return total
+
+
+def replay(match, corpus):
+    """Seconds to match every line, and how many matched"""
+    with Timer() as timer:
+        hits = 0
+        for line in corpus:
+            if match(line) is not None:
+                hits += 1
+    return timer.elapsed, hits
+
+
+def measure(matchers, corpus, alloc_sample, overhead, rounds):
+    # Rounds alternate between matchers so drift in machine speed hits both
+    # alike; each reports its fastest round, as timeit does
+    best = {name: float('inf') for name in matchers}
+    hits = {}
+    for _ in range(rounds):
+        for name, match in matchers.items():
+            elapsed, hits[name] = replay(match, corpus)
+            best[name] = min(best[name], elapsed)
+
+    for name, match in matchers.items():
+        total = transient_bytes(match, corpus[:alloc_sample]) - overhead
+        rate = len(corpus) / best[name]
+        print(f"{name}: {rate:,.0f} msgs/sec, hits={hits[name]}, alloc={total / alloc_sample:.1f} bytes/msg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=1_000_000)
+    parser.add_argument('--corpus', help='file with one chat line per line')
+    parser.add_argument('--alloc-sample', type=int, default=20_000)
+    parser.add_argument('--rounds', type=int, default=7)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8') as f:
+            corpus = [line.rstrip('\n') for line in f]
+    else:
+        corpus = synthetic_corpus(args.lines)
+    sample = min(args.alloc_sample, len(corpus))
+
+    commands = build_commands()
+    router = CommandRouter(prefix='!')
+    router.rebuild(commands)
+
+    # Measurement overhead of a call that allocates nothing
+    overhead = transient_bytes(noop, corpus[:sample])
+
+    matchers = {'split scan': make_old_match(commands), 'router': router.match}
+    measure(matchers, corpus, sample, overhead, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
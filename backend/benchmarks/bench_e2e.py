@@ -0,0 +1,72 @@
+"""End-to-end benchmark: replay chat into a real CustomBot with its commands loaded.
+
+    python benchmarks/bench_e2e.py [--corpus chat.jsonl] [--speeds 1,10,0]
+                                   [--messages 2000] [--rate 100] [--channels 5]
+                                   [--probe-every 100]
+
+The bot connects to a local fake IRC server (as a moderator, so replies get
+the 100 per 30s limit) with a stub Helix/OAuth API behind it. The corpus is
+--corpus if given (see replay.py to record or synthesize one), otherwise a
+synthetic one of --messages lines at --rate lines/s spread over --channels
+channels, 1% of them !greet. Each speed (1 = recorded timing, 10 = ten
+times faster, 0 = as fast as possible) reports messages/sec handled,
+p50/p99 reply latency of the injected !ping probes, event-loop lag and RSS.
+
+Use this to judge performance changes: run it before and after.
+"""
+import argparse
+import asyncio
+
+from harness import ChatHarness, rss_mb
+from replay import load_corpus, synthetic_corpus
+
+
+def report(speed, stats):
+    latency, lag = stats['reply_latency'], stats['loop_lag']
+    label = 'max speed' if not speed else f'{speed:g}x'
+    print(f"{label:>9}: {stats['received']}/{stats['messages']} messages in {stats['elapsed']:.2f}s "
+          f"= {stats['msgs_per_sec']:,.0f} msgs/sec (played in {stats['played_in']:.2f}s)")
+    print(f"{'':>9}  reply latency p50={latency['p50_ms']:.1f}ms p99={latency['p99_ms']:.1f}ms "
+          f"({stats['replies']}/{stats['probes']} probes answered)")
+    print(f"{'':>9}  loop lag p50={lag['p50_ms']:.2f}ms p99={lag['p99_ms']:.2f}ms max={lag['max_ms']:.1f}ms, "
+          f"RSS {stats['rss_mb']:.1f}MB ({stats['rss_growth_mb']:+.1f}MB)")
+
+
+async def run(args):
+    if args.corpus:
+        lines = load_corpus(args.corpus)
+    else:
+        channels = [f'bench{index:02d}' for index in range(args.channels)]
+        lines = synthetic_corpus(args.messages, channels, args.rate)
+    channels = sorted({line.channel for line in lines})
+
+    harness = ChatHarness()
+    baseline = rss_mb()
+    await harness.start(channels)
+    print(f"{len(lines)} lines over {len(channels)} channels, {lines[-1].t:.1f}s at 1x; "
+          f"commands: {len(harness.loader.instances)} modules imported, {len(harness.loader.stubs)} lazy")
+    print(f"RSS {baseline:.1f}MB before the bot, {rss_mb():.1f}MB connected")
+    try:
+        for speed in [float(value) for value in args.speeds.split(',')]:
+            report(speed, await harness.replay(lines, speed, probe_every=args.probe_every))
+            # --pause 30 lets the chat limit's window pass so each speed starts with the same budget
+            await asyncio.sleep(args.pause)
+    finally:
+        await harness.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--corpus')
+    parser.add_argument('--speeds', default='1,10,0')
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=100.0)
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--probe-every', type=int, default=100)
+    parser.add_argument('--pause', type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""EventSub ingestion against a local fake EventSub server.
+
+    python benchmarks/bench_eventsub.py [--channels 20] [--events 5000] [--rate 2000] [--keepalive 2]
+
+The bot subscribes --channels channels to follows and raids, then:
+
+1. --events follow notifications at --rate per second, a tenth of them
+   sent twice: delivered vs unique, duplicates dropped, latency from the
+   fake's send to the event listener and event-loop lag.
+2. A session_reconnect in the middle of a stream: events lost or doubled
+   across the migration, and subscription requests it cost (should be 0).
+3. The socket cut without warning: time until every subscription is bound
+   again on a new session.
+4. Keepalives stopped: time until the silent socket is given up on and
+   replaced (--keepalive seconds plus the grace period).
+"""
+import argparse
+import asyncio
+import os
+import time
+import zlib
+
+from common import LoopLagProbe, make_bot, point_at_stub, summarize
+from fake_eventsub import FakeEventSub
+from stub_twitch import StubTwitch
+
+
+def user_id(login):
+    # The stub's /users answers with this ID for every login
+    return str(zlib.crc32(login.encode()) % 10 ** 9)
+
+
+class Counter:
+    def __init__(self):
+        self.ids = set()
+        self.events = 0
+        self.latencies = []
+
+    async def __call__(self, event):
+        self.events += 1
+        self.ids.add(event.data['follow_id'])
+        self.latencies.append(time.time() - event.data['sent_at'])
+
+
+async def wait_for(condition, timeout=30.0):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError
+        await asyncio.sleep(0.005)
+    return time.perf_counter() - start
+
+
+async def stream(fake, channels, count, rate, start_id=0, duplicate_every=0):
+    """Send follows round-robin over the channels at `rate` per second"""
+    start = time.perf_counter()
+    for index in range(count):
+        follow_id = start_id + index
+        login = channels[index % len(channels)]
+        await fake.notify('channel.follow', {
+            'broadcaster_user_id': user_id(login), 'broadcaster_user_login': login,
+            'user_id': str(follow_id), 'user_login': f'follower{follow_id}', 'follow_id': follow_id,
+            'sent_at': time.time()}, duplicate=bool(duplicate_every) and index % duplicate_every == 0)
+        if index % 20 == 19:
+            await asyncio.sleep(max(0.0, start + (index + 1) / rate - time.perf_counter()))
+
+
+async def run(args):
+    fake = FakeEventSub(keepalive=args.keepalive)
+    stub = StubTwitch(delay=0.01, eventsub=fake)
+    # Must be pointed at before http_client and eventsub read their base URLs
+    point_at_stub(await stub.start())
+    os.environ['TWITCH_EVENTSUB_URL'] = fake.url
+    bot = make_bot()
+    counter = Counter()
+    bot.add_event_listener(counter, queue_size=0)
+    eventsub = bot.eventsub
+
+    channels = [f'channel{index:03d}' for index in range(args.channels)]
+    start = time.perf_counter()
+    await bot.subscribe_events(*channels)
+    total = len(eventsub.subscriptions)
+    await wait_for(lambda: eventsub.stats()['bound'] == total)
+    print(f"{total} subscriptions over {len(eventsub.sessions)} session(s) bound in "
+          f"{(time.perf_counter() - start) * 1000:.0f}ms ({fake.subscribe_requests} requests)")
+
+    probe = LoopLagProbe()
+    probe.start()
+    start = time.perf_counter()
+    await stream(fake, channels, args.events, args.rate, duplicate_every=10)
+    await wait_for(lambda: len(counter.ids) >= args.events and counter.events >= eventsub.notifications)
+    elapsed = time.perf_counter() - start
+    await probe.stop()
+    latency, lag = summarize(counter.latencies), probe.summary()
+    print(f"stream: {fake.sent} messages sent for {args.events} events in {elapsed:.2f}s; "
+          f"{counter.events} delivered, {len(counter.ids)} unique, {eventsub.duplicates} duplicates dropped")
+    print(f"  latency p50={latency['p50_ms']:.2f}ms p99={latency['p99_ms']:.2f}ms max={latency['max_ms']:.1f}ms, "
+          f"loop lag p99={lag['p99_ms']:.2f}ms")
+
+    counter.__init__()
+    requests_before = fake.subscribe_requests
+    sender = asyncio.ensure_future(stream(fake, channels, 2000, 1000, start_id=10 ** 6))
+    await asyncio.sleep(1.0)
+    await fake.reconnect()
+    await sender
+    await wait_for(lambda: len(counter.ids) >= 2000, timeout=5.0)
+    print(f"migration: {eventsub.migrations} session(s) migrated mid-stream, {len(counter.ids)}/2000 events, "
+          f"{counter.events - len(counter.ids)} doubled, "
+          f"{fake.subscribe_requests - requests_before} subscription requests")
+
+    requests_before = fake.subscribe_requests
+    start = time.perf_counter()
+    await fake.drop()
+    await wait_for(lambda: eventsub.stats()['bound'] < total)
+    await wait_for(lambda: eventsub.stats()['bound'] == total and fake.subscribed() == total)
+    print(f"drop: rebound {total} subscriptions on a new session in {(time.perf_counter() - start) * 1000:.0f}ms "
+          f"({fake.subscribe_requests - requests_before} requests)")
+
+    reconnects = eventsub.reconnects
+    fake.pause_keepalives = True
+    start = time.perf_counter()
+    await wait_for(lambda: eventsub.reconnects > reconnects)
+    fake.pause_keepalives = False
+    print(f"silent socket: replaced after {time.perf_counter() - start:.1f}s "
+          f"(keepalive {args.keepalive}s + grace)")
+    await wait_for(lambda: eventsub.stats()['bound'] == total)
+
+    await eventsub.close()
+    await bot.event_engine.close()
+    await bot.channels.close()
+    await bot.http_client.close()
+    await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--rate', type=float, default=2000.0)
+    parser.add_argument('--keepalive', type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Helix GETs with and without HelixCache against a local stub API.
+
+    python benchmarks/bench_helix_cache.py [--channels 20] [--viewers 10] [--rounds 20]
+                                           [--interval 0.1] [--ttl 0.5] [--delay 0.05]
+
+Every --interval seconds, --viewers chatters in each of --channels channels
+run an !uptime-style GET /streams lookup at the same moment. Each mode runs
+the same rounds:
+
+  direct        one Helix request per lookup (the old behaviour)
+  cache         TTL + coalescing, entries dropped when the TTL runs out
+  cache + SWR   the same, serving stale entries while refetching
+
+Streams' 30s TTL is scaled down to --ttl so expiry happens within the run.
+Latency is reported for the warm rounds, after the first one.
+"""
+import argparse
+import asyncio
+import time
+
+from common import Timer, make_bot, point_at_stub, summarize
+from stub_twitch import StubTwitch
+
+
+async def run_rounds(args, lookup):
+    latencies = []
+
+    async def one(channel):
+        start = time.perf_counter()
+        data = await lookup('streams', {'user_login': channel})
+        latencies.append(time.perf_counter() - start)
+        return data
+
+    channels = [f'channel{index}' for index in range(args.channels)]
+    with Timer() as timer:
+        for index in range(args.rounds):
+            await asyncio.gather(*(one(channel) for channel in channels for _ in range(args.viewers)))
+            if index == 0:
+                # Every mode pays for the first round alike
+                latencies.clear()
+            await asyncio.sleep(args.interval)
+    return timer.elapsed, summarize(latencies)
+
+
+async def run(args):
+    stub = StubTwitch(delay=args.delay)
+    point_at_stub(await stub.start())
+    bot = make_bot()
+
+    from helix_cache import HelixCache
+
+    lookups = args.rounds * args.channels * args.viewers
+    modes = (
+        ('direct', None),
+        ('cache', 0.0),
+        ('cache + SWR', 1.0)
+    )
+    for name, stale_factor in modes:
+        if stale_factor is None:
+            lookup = bot._helix_get
+            cache = None
+        else:
+            cache = HelixCache(bot._helix_get, ttls={'streams': args.ttl}, stale_factor=stale_factor)
+            lookup = cache.get
+        before = stub.stream_lookups
+        elapsed, latency = await run_rounds(args, lookup)
+        print(f"{name:12s} {lookups} lookups in {elapsed:.2f}s: {stub.stream_lookups - before} Helix requests, "
+              f"latency p50={latency['p50_ms']:.2f}ms p99={latency['p99_ms']:.2f}ms max={latency['max_ms']:.2f}ms")
+        if cache is not None:
+            stats = cache.stats()
+            print(f"{'':12s} hits={stats['hits']} stale_hits={stats['stale_hits']} misses={stats['misses']} "
+                  f"coalesced={stats['coalesced']} hit_ratio={stats['hit_ratio']:.3f}")
+            await cache.close()
+
+    await bot.helix.close()
+    await bot.whispers.close()
+    await bot.http_client.close()
+    await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--viewers', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.1)
+    parser.add_argument('--ttl', type=float, default=0.5)
+    parser.add_argument('--delay', type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
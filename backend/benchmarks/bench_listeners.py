@@ -0,0 +1,76 @@
+"""A slow listener next to a fast one: sequential await vs ListenerEngine.
+
+    python benchmarks/bench_listeners.py [--messages 200] [--slow 0.05] [--rate 200]
+
+Messages arrive at --rate per second. Reports how long event_message holds
+the read loop per message and how long the fast listener waits for each
+message, plus the engine's per-listener counters.
+"""
+import argparse
+import asyncio
+import time
+
+from common import Timer, fake_message, make_bot, summarize
+
+
+async def run(count, slow_delay, rate, sequential):
+    bot = make_bot()
+    fast_latency = []
+
+    async def slow_listener(message):
+        # e.g. a moderation check calling an external API
+        await asyncio.sleep(slow_delay)
+
+    async def fast_listener(message):
+        fast_latency.append(time.perf_counter() - message.received)
+
+    if sequential:
+        listeners = [slow_listener, fast_listener]
+
+        async def handle(message):
+            # The pre-engine event_message loop
+            for listener in listeners:
+                await listener(message)
+    else:
+        bot.add_message_listener(slow_listener, concurrency=4, timeout=1.0, queue_size=50, policy='drop_oldest')
+        bot.add_message_listener(fast_listener)
+        handle = bot.event_message
+
+    hold = []
+    interval = 1.0 / rate
+    with Timer() as timer:
+        for i in range(count):
+            message = fake_message(f'message {i}', author=f'user{i % 50}')
+            message.received = time.perf_counter()
+            await handle(message)
+            hold.append(time.perf_counter() - message.received)
+            await asyncio.sleep(max(0.0, interval - hold[-1]))
+        # Give queued work a moment to drain
+        await asyncio.sleep(slow_delay * 2)
+
+    mode = 'sequential' if sequential else 'ListenerEngine'
+    read = summarize(hold)
+    fast = summarize(fast_latency)
+    print(f"{mode}: {count} messages in {timer.elapsed:.2f}s (offered at {rate}/s)")
+    print(f"  read loop held p50={read['p50_ms']:.2f}ms p99={read['p99_ms']:.2f}ms")
+    print(f"  fast listener latency p50={fast['p50_ms']:.2f}ms p99={fast['p99_ms']:.2f}ms")
+    if not sequential:
+        for name, stats in bot.listener_engine.stats().items():
+            print(f"  {name}: calls={stats['calls']} dropped={stats['dropped']} "
+                  f"timeouts={stats['timeouts']} avg={stats['avg_time'] * 1000:.2f}ms")
+    await bot.listener_engine.close()
+    await bot.http_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--slow', type=float, default=0.05)
+    parser.add_argument('--rate', type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.messages, args.slow, args.rate, sequential=True))
+    asyncio.run(run(args.messages, args.slow, args.rate, sequential=False))
+
+
+if __name__ == '__main__':
+    main()
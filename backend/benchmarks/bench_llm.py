@@ -0,0 +1,146 @@
+"""LLMService against a local mock completions server.
+
+    python benchmarks/bench_llm.py [--calls 5] [--duplicates 50] [--distinct 20] [--spam 5]
+
+1. Event-loop lag while --calls completions run: the sync OpenAI client
+   called from a coroutine versus LLMService.
+2. --duplicates concurrent identical prompts, then the same prompt again
+   (deduplication and the response cache).
+3. --distinct different prompts with max_concurrency=4.
+4. One chatter repeating a command --spam times, 50ms apart, with a new
+   prompt each time: only the last answer should be generated to the end.
+5. Time to the first chat message when streaming into chunked messages
+   versus waiting for the whole answer.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from common import LoopLagProbe, Timer
+from stub_openai import StubOpenAI
+from stub_twitch import start_in_thread
+
+
+def reset(stub):
+    stub.requests = stub.completed = stub.aborted = stub.max_active = 0
+
+
+async def loop_lag(stub, calls):
+    from openai import OpenAI
+    from llm import LLMService
+
+    sync_client = OpenAI()
+
+    async def naive_command(index):
+        # What a command calling the sync client does to the loop
+        sync_client.chat.completions.create(model='stub', messages=[{'role': 'user', 'content': f'q{index}'}])
+
+    service = LLMService()
+    # Build both clients up front so only the requests are measured
+    service.client
+    for name, call in (('sync OpenAI client', naive_command),
+                       ('LLMService', lambda index: service.complete(f'q{index}'))):
+        reset(stub)
+        probe = LoopLagProbe()
+        probe.start()
+        with Timer() as timer:
+            await asyncio.gather(*(call(index) for index in range(calls)))
+        # Let the probe record the sleep that the blocking calls held up
+        await asyncio.sleep(0.05)
+        await probe.stop()
+        lag = probe.summary()
+        print(f"{name:18s} {calls} completions in {timer.elapsed:.2f}s, loop lag "
+              f"p99={lag['p99_ms']:.1f}ms max={lag['max_ms']:.1f}ms")
+    await service.close()
+
+
+async def deduplication(stub, duplicates):
+    from llm import LLMService
+
+    service = LLMService()
+    reset(stub)
+    with Timer() as timer:
+        answers = await asyncio.gather(*(service.complete('What game is this?') for _ in range(duplicates)))
+    print(f"{duplicates} identical prompts: {stub.requests} request(s) in {timer.elapsed:.2f}s, "
+          f"{len(set(answers))} distinct answer(s)")
+    with Timer() as timer:
+        await service.complete('  what GAME is this? ')
+    print(f"same prompt again: {stub.requests} request(s) total, answered in {timer.elapsed * 1000:.2f}ms "
+          f"(cache hits {service.cache_hits})")
+    await service.close()
+
+
+async def concurrency(stub, distinct):
+    from llm import LLMService
+
+    service = LLMService(max_concurrency=4)
+    reset(stub)
+    with Timer() as timer:
+        await asyncio.gather(*(service.complete(f'question {index}') for index in range(distinct)))
+    print(f"{distinct} distinct prompts: {stub.requests} requests, at most {stub.max_active} at once, "
+          f"{timer.elapsed:.2f}s")
+    await service.close()
+
+
+async def spam(stub, repeats):
+    from llm import LLMService
+
+    service = LLMService()
+    reset(stub)
+    key = ('ask', 'benchchannel', 'viewer')
+    tasks = []
+    for index in range(repeats):
+        tasks.append(asyncio.ensure_future(service.complete(f'spam {index}', key=key)))
+        await asyncio.sleep(0.05)
+    results = await asyncio.gather(*tasks)
+    await asyncio.sleep(0.2)
+    superseded = sum(result is None for result in results)
+    print(f"{repeats} repeats by one chatter: {superseded} superseded, {stub.completed} answer(s) generated "
+          f"to the end, {stub.aborted} aborted mid-stream")
+    await service.close()
+
+
+async def streaming(stub):
+    from llm import LLMService
+
+    service = LLMService()
+    reset(stub)
+    sent = []
+    start = time.perf_counter()
+
+    async def send(text):
+        sent.append((time.perf_counter() - start, len(text)))
+
+    messages = await service.stream_to_chat(send, 'tell me a story', chunk_length=120, flush_after=0.1)
+    print(f"streamed into {messages} chat messages: first after {sent[0][0] * 1000:.0f}ms, "
+          f"last after {sent[-1][0] * 1000:.0f}ms, lengths {[length for _, length in sent]}")
+    await service.close()
+
+
+async def run(args):
+    stub = StubOpenAI()
+    # Served from its own thread so the sync client's blocking shows up as loop lag, not a deadlock
+    base_url = start_in_thread(stub)
+    os.environ['OPENAI_BASE_URL'] = f'{base_url}/v1'
+    os.environ.setdefault('OPENAI_API_KEY', 'bench-key')
+
+    await loop_lag(stub, args.calls)
+    await deduplication(stub, args.duplicates)
+    await concurrency(stub, args.distinct)
+    await spam(stub, args.spam)
+    await streaming(stub)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=5)
+    parser.add_argument('--duplicates', type=int, default=50)
+    parser.add_argument('--distinct', type=int, default=20)
+    parser.add_argument('--spam', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
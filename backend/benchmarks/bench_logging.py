@@ -0,0 +1,82 @@
+"""Replay chat through CustomBot.event_message with logging enabled.
+
+    python benchmarks/bench_logging.py [--messages 100000] [--sample 100]
+
+Compares the old per-message INFO logging written synchronously to a file
+against the queue-backed setup at INFO and at sampled DEBUG.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+
+from common import Timer, fake_message, make_bot
+from bot_logging import LOG_FORMAT, sampler, setup_logging, stop_logging
+
+WORDS = ['hello', 'lol', 'pog', 'gg', 'nice', 'play', 'what', 'is', 'this', 'stream', 'KEKW', 'wow']
+
+
+def build_corpus(count, seed=1):
+    rng = random.Random(seed)
+    return [fake_message(' '.join(rng.choices(WORDS, k=rng.randint(2, 12))), author=f'user{i % 500}')
+            for i in range(count)]
+
+
+def legacy_logging(log_file):
+    """The old setup: basicConfig-style handlers writing on the calling thread"""
+    stop_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = logging.FileHandler(log_file, encoding='utf-8')
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+async def replay(bot, corpus, legacy):
+    logger = logging.getLogger('twitch_bot')
+    with Timer() as timer:
+        for message in corpus:
+            if legacy:
+                # The three INFO lines the old event_message emitted per message
+                logger.info(f"Received message: {message.content}")
+                logger.info(f"Message author: {message.author.name if message.author else 'None'}")
+                logger.info(f"Message tags: {message.tags}")
+            await bot.event_message(message)
+    return len(corpus) / timer.elapsed
+
+
+async def run(count, sample):
+    bot = make_bot()
+    corpus = build_corpus(count)
+    log_file = os.path.join(tempfile.mkdtemp(), 'bot.log')
+
+    modes = [
+        ('legacy INFO, sync file', lambda: legacy_logging(log_file), True),
+        ('queue INFO', lambda: setup_logging('INFO', log_file, console=False), False),
+        (f'queue DEBUG, 1 in {sample}', lambda: setup_logging('DEBUG', log_file, {'chat': sample}, console=False), False),
+        ('queue DEBUG, every message', lambda: setup_logging('DEBUG', log_file, {'chat': 1}, console=False), False)
+    ]
+    for name, configure, legacy in modes:
+        configure()
+        rate = await replay(bot, corpus, legacy)
+        stop_logging()
+        print(f"{name}: {rate:,.0f} msgs/sec")
+
+    sampler.set_rate('chat', 1)
+    await bot.http_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--sample', type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.messages, args.sample))
+
+
+if __name__ == '__main__':
+    main()
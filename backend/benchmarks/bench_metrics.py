@@ -0,0 +1,135 @@
+"""Cost of the bot's runtime metrics, and what a /metrics scrape returns.
+
+    python benchmarks/bench_metrics.py [--ops 1000000] [--messages 200000] [--show 30]
+
+1. Per-call cost of Counter.inc, a labelled counter's labels(value).inc and
+   Histogram.observe, and the memory they keep after a million calls.
+2. event_message on plain chat and on a command, with the bot's metrics
+   live versus swapped for no-op stand-ins: the overhead per message.
+3. A scrape: Registry.expose() time, and a GET /metrics against a
+   MetricsServer on a free port, printing the first --show lines.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+import aiohttp
+
+from common import fake_message, make_bot
+
+
+class NullMetric:
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def labels(self, *values):
+        return self
+
+
+def per_call(name, call, ops):
+    start = time.perf_counter()
+    for _ in range(ops):
+        call()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(ops):
+        call()
+    kept = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"  {name:<28} {elapsed / ops * 1e9:6.0f}ns per call, {kept} bytes kept after {ops:,} calls")
+
+
+def primitives(ops):
+    from metrics import Registry
+
+    registry = Registry()
+    counter = registry.counter('bench_total', 'bench').labels()
+    labelled = registry.counter('bench_labelled_total', 'bench', ['command'])
+    histogram = registry.histogram('bench_seconds', 'bench').labels()
+    per_call('Counter.inc', counter.inc, ops)
+    per_call("labels('greet').inc", lambda: labelled.labels('greet').inc(), ops)
+    per_call('Histogram.observe(0.003)', lambda: histogram.observe(0.003), ops)
+
+
+async def event_message_cost(messages):
+    bot = make_bot()
+
+    @bot.command(name='bench')
+    async def bench(ctx):
+        pass
+    bot.command_router.rebuild(bot.commands)
+
+    live = (bot._messages_received, bot._commands_dispatched, bot._command_seconds)
+    null = NullMetric()
+    results = {}
+    for content in ('just some chat lol gg', '!bench now'):
+        for label, children in (('no-op', (null, null, null)), ('live', live)):
+            bot._messages_received, bot._commands_dispatched, bot._command_seconds = children
+            message = fake_message(content)
+            for _ in range(1000):
+                await bot.event_message(message)
+            start = time.perf_counter()
+            for _ in range(messages):
+                await bot.event_message(message)
+            results[content, label] = (time.perf_counter() - start) / messages
+        no_op, with_metrics = results[content, 'no-op'], results[content, 'live']
+        print(f"  {content!r:<26} no-op {no_op * 1e6:.2f}us, live {with_metrics * 1e6:.2f}us "
+              f"per message ({(with_metrics - no_op) * 1e9:+.0f}ns)")
+    bot._messages_received, bot._commands_dispatched, bot._command_seconds = live
+    return bot
+
+
+async def scrape(bot, show):
+    from metrics import MetricsServer
+
+    start = time.perf_counter()
+    for _ in range(100):
+        body = bot.metrics.expose()
+    print(f"  Registry.expose(): {(time.perf_counter() - start) / 100 * 1000:.2f}ms, "
+          f"{len(body.splitlines())} lines, {len(body)} bytes")
+
+    server = MetricsServer(bot.metrics, host='127.0.0.1', port=0)
+    await server.start()
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        async with session.get(f'http://127.0.0.1:{server.port}/metrics') as response:
+            text = await response.text()
+            elapsed = time.perf_counter() - start
+            print(f"  GET /metrics: {response.status} {response.headers['Content-Type']} "
+                  f"in {elapsed * 1000:.1f}ms")
+    await server.stop()
+    for line in text.splitlines()[:show]:
+        print(f"    {line}")
+
+
+async def run(args):
+    print("metric primitives:")
+    primitives(args.ops)
+    print("event_message:")
+    bot = await event_message_cost(args.messages)
+    # Give the lag monitor a few samples to report
+    await asyncio.sleep(1.2)
+    print("scrape:")
+    await scrape(bot, args.show)
+    bot.lag_monitor.stop()
+    await bot.listener_engine.close()
+    await bot.channels.close()
+    await bot.http_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ops', type=int, default=1_000_000)
+    parser.add_argument('--messages', type=int, default=200_000)
+    parser.add_argument('--show', type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
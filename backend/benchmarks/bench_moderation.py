@@ -0,0 +1,184 @@
+"""Moderation rule matching cost and batched Helix actions.
+
+    python benchmarks/bench_moderation.py [--rules 100,1000,10000] [--patterns 20]
+                                          [--messages 5000] [--flood 300]
+
+1. Per-message cost of RuleSet.match for each rule count in --rules (plus
+   --patterns regex rules), against a linear loop over the same rules (one
+   substring or regex check per rule). A fifth of the messages break a rule,
+   many of them disguised with look-alike letters, accents or zero-width
+   characters.
+2. The engine as a message listener on a bot at increasing message rates.
+3. A raid of --flood rule-breaking messages from 30 chatters, acted on
+   through the stub Helix API: Helix requests made versus actions queued.
+"""
+import argparse
+import asyncio
+import random
+import re
+import time
+
+from common import SAMPLE_TAGS, Timer, fake_message, make_bot, point_at_stub, summarize
+from stub_twitch import StubTwitch
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+DISGUISES = [
+    lambda word: word.replace('o', '0').replace('e', '3'),
+    lambda word: word.replace('a', 'а').replace('e', 'е'),  # Cyrillic
+    lambda word: word[:2] + '​' + word[2:],
+    lambda word: word.upper(),
+    lambda word: word.replace('e', 'é'),
+]
+
+
+def make_rules(rng, count, patterns):
+    from moderation import Rule
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(LETTERS) for _ in range(rng.randint(4, 10))))
+    rules = [Rule(term=word, action=rng.choice(('delete', 'delete', 'timeout'))) for word in sorted(words)]
+    rules += [Rule(pattern=f"{''.join(rng.choice(LETTERS) for _ in range(4))}\\d+(?:\\.com|\\.net)", action='ban')
+              for _ in range(patterns)]
+    return rules
+
+
+def make_messages(rng, rules, count):
+    vocabulary = ['hello', 'pog', 'gg', 'lol', 'what', 'is', 'this', 'game', 'nice', 'play', 'streamer',
+                  'chat', 'kappa', 'lul', 'love', 'the', 'music', 'when', 'next', 'stream', 'résumé', 'naïve']
+    terms = [rule.term for rule in rules if rule.term]
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(3, 20))]
+        if rng.random() < 0.2:
+            word = rng.choice(terms)
+            if rng.random() < 0.5:
+                word = rng.choice(DISGUISES)(word)
+            words.insert(rng.randrange(len(words) + 1), word)
+        messages.append(' '.join(words))
+    return messages
+
+
+def linear_match(rules, compiled, text):
+    """The per-rule loop a hand-written event_message check ends up as"""
+    text = text.lower()
+    for rule in rules:
+        if rule.term is not None:
+            if rule.term in text:
+                return rule
+        elif compiled[rule.pattern].search(text):
+            return rule
+    return None
+
+
+def matching(args):
+    from moderation import RuleSet
+
+    rng = random.Random(42)
+    for count in [int(value) for value in args.rules.split(',')]:
+        rules = make_rules(rng, count, args.patterns)
+        messages = make_messages(rng, rules, args.messages)
+        start = time.perf_counter()
+        rule_set = RuleSet(rules)
+        build = time.perf_counter() - start
+
+        costs = []
+        hits = 0
+        for text in messages:
+            start = time.perf_counter()
+            hits += rule_set.match(text) is not None
+            costs.append(time.perf_counter() - start)
+        cost = summarize(costs)
+
+        compiled = {rule.pattern: re.compile(rule.pattern) for rule in rules if rule.pattern}
+        sample = messages[:max(1, min(len(messages), 1_000_000 // max(1, count)))]
+        start = time.perf_counter()
+        linear_hits = sum(linear_match(rules, compiled, text) is not None for text in sample)
+        linear = (time.perf_counter() - start) / len(sample)
+
+        print(f"{count:>6} terms + {args.patterns} patterns: build {build * 1000:.0f}ms, "
+              f"{len(rule_set.automaton)} automaton states")
+        print(f"       RuleSet p50={cost['p50_ms'] * 1000:.1f}us p99={cost['p99_ms'] * 1000:.1f}us "
+              f"max={cost['max_ms'] * 1000:.1f}us, caught {hits}/{len(messages)} "
+              f"(~{len(messages) * 0.2:.0f} broke a rule)")
+        print(f"       linear  mean={linear * 1e6:.1f}us over {len(sample)} messages, "
+              f"caught {linear_hits}/{len(sample)} (misses disguised terms)")
+    return rules
+
+
+async def listener_rates(rules, messages_count):
+    from moderation import ModerationEngine, ActionBatcher
+
+    async def transport(action):
+        class Ok:
+            ok = True
+        return Ok()
+
+    rng = random.Random(7)
+    texts = make_messages(rng, rules, messages_count)
+    for rate in (1000, 5000, 20000):
+        bot = make_bot()
+        engine = ModerationEngine(rules, ActionBatcher(transport))
+        bot.add_message_listener(engine)
+        listener = bot.listener_engine.configure(engine)
+        interval = 1.0 / rate
+        start = time.perf_counter()
+        for index, text in enumerate(texts):
+            bot.listener_engine.dispatch(fake_message(text, author=f'user{index % 500}'))
+            if index % 50 == 49:
+                # Offer messages in bursts of 50 at the target rate
+                await asyncio.sleep(max(0.0, start + (index + 1) * interval - time.perf_counter()))
+        while listener.queued:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        stats = listener.stats.as_dict()
+        print(f"  offered at {rate}/s: {messages_count} checked in {elapsed:.2f}s "
+              f"({messages_count / elapsed:.0f}/s), avg {stats['avg_time'] * 1e6:.0f}us per message, "
+              f"dropped {stats['dropped']}, matched {engine.matched}")
+        await engine.actions.close()
+        await bot.listener_engine.close()
+        await bot.channels.close()
+        await bot.http_client.close()
+
+
+async def flood(stub, rules, count):
+    bot = make_bot()
+
+    from moderation import ModerationEngine, ActionBatcher, Rule
+
+    engine = ModerationEngine(rules + [Rule(term='raid spam', action='timeout', duration=300)],
+                              ActionBatcher(bot._moderate))
+    with Timer() as timer:
+        for index in range(count):
+            # Most chatters post the spam several times before their timeout lands
+            tags = {**SAMPLE_TAGS, 'user-id': str(1000 + index % 30), 'id': f'msg-{index}'}
+            await engine(fake_message(f'RAID SPAM {index}', author=f'raider{index % 30}', tags=tags))
+        await engine.actions.close()
+    print(f"{count} spam messages from 30 chatters: {engine.actions.queued} actions queued, "
+          f"{stub.requests} Helix requests ({engine.actions.merged} merged) in {timer.elapsed:.2f}s")
+    await bot.channels.close()
+    await bot.http_client.close()
+
+
+async def run(args):
+    # Must be pointed at before http_client reads its base URLs
+    stub = StubTwitch(delay=0.02)
+    point_at_stub(await stub.start())
+    rules = matching(args)
+    print("listener on the bot, last rule set:")
+    await listener_rates(rules, args.messages)
+    await flood(stub, rules, args.flood)
+    await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rules', default='100,1000,10000')
+    parser.add_argument('--patterns', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--flood', type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Profiler overhead, and what it reports about slow and loop-blocking commands.
+
+    python benchmarks/bench_profiler.py [--messages 100000] [--dump perf_report.json]
+
+1. event_message cost for a trivial command and a trivial listener, with
+   the profiler off and on.
+2. Three misbehaving commands run through event_message with the profiler
+   on: !slowapi awaits a slow (stub) Helix call, !blocking makes a sync
+   requests call inside async def, and !crunch burns CPU. Prints the
+   warnings' gist, the !perf summary line, the captured stacks and where
+   the full report was dumped.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from common import fake_message, make_bot, point_at_stub
+from stub_twitch import StubTwitch, start_in_thread
+
+
+async def overhead(bot, messages):
+    @bot.command(name='bench')
+    async def bench(ctx):
+        pass
+    bot.command_router.rebuild(bot.commands)
+
+    calls = 0
+
+    async def listener(message):
+        nonlocal calls
+        calls += 1
+    bot.add_message_listener(listener, queue_size=0)
+
+    message = fake_message('!bench now')
+    for enabled in (False, True):
+        if enabled:
+            bot.profiler.enable()
+        calls = 0
+        start = time.perf_counter()
+        for index in range(messages):
+            await bot.event_message(message)
+            if index % 100 == 99:
+                await asyncio.sleep(0)
+        while calls < messages:
+            await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+        print(f"  profiler {'on ' if enabled else 'off'}: {elapsed / messages * 1e6:.2f}us per message "
+              f"(command + listener)")
+    stats = {name: stats.as_dict() for name, stats in bot.profiler.stats.items()}
+    print(f"  recorded: !bench {stats['!bench']['calls']} calls avg {stats['!bench']['avg_wall'] * 1e6:.1f}us, "
+          f"listener {stats[listener.__qualname__]['calls']} calls")
+    bot.remove_message_listener(listener)
+    bot.profiler.reset()
+
+
+async def offenders(bot, stub_url):
+    import requests
+
+    @bot.command(name='slowapi')
+    async def slowapi(ctx):
+        await bot.http_client.request('GET', f'{stub_url}/helix/streams', params={'user_login': 'x'})
+
+    @bot.command(name='blocking')
+    async def blocking(ctx):
+        # A sync HTTP call inside async def: the loop stops until it returns
+        requests.get(f'{stub_url}/helix/streams', params={'user_login': 'x'})
+
+    @bot.command(name='crunch')
+    async def crunch(ctx):
+        total = 0
+        for value in range(3_000_000):
+            total += value * value
+        await asyncio.sleep(0)
+    bot.command_router.rebuild(bot.commands)
+
+    for content in ('!slowapi', '!blocking', '!crunch'):
+        await bot.event_message(fake_message(content))
+    # Let the watchdog thread finish logging
+    await asyncio.sleep(0.1)
+
+    profiler = bot.profiler
+    print(f"  !perf: {profiler.summary()}")
+    for name, stats in profiler.top(3):
+        print(f"  {name:<10} wall {stats.wall * 1000:6.0f}ms  cpu {stats.cpu * 1000:6.0f}ms  "
+              f"longest step {stats.max_step * 1000:6.0f}ms  slow={stats.slow} blocking={stats.blocked}")
+    for trace in profiler.slow_traces:
+        print(f"  slow-call trace for {trace['name']} after {trace['after'] * 1000:.0f}ms:")
+        for line in trace['stack'][-3:]:
+            print(f"    {line.strip()}")
+    for stall in profiler.stalls:
+        print(f"  loop stall in {stall['name']} ({stall['after'] * 1000:.0f}ms+), innermost frames:")
+        for frame in stall['stack'][-12:]:
+            first = frame.strip().splitlines()[0]
+            if 'site-packages' in first or 'bench_profiler' in first:
+                print(f"    {first}")
+
+
+async def run(args):
+    stub = StubTwitch(delay=0.6)
+    point_at_stub(start_in_thread(stub))
+    bot = make_bot()
+    print("overhead:")
+    await overhead(bot, args.messages)
+    print("offenders (slow > 500ms, blocking > 100ms):")
+    await offenders(bot, stub.base_url)
+    print(f"  full report: {bot.profiler.dump(args.dump)}")
+    bot.profiler.disable()
+    bot.lag_monitor.stop()
+    await bot.listener_engine.close()
+    await bot.channels.close()
+    await bot.http_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--dump', default='perf_report.json')
+    args = parser.parse_args()
+    # The profiler's warnings are the point here, but one line each is enough
+    logging.getLogger('twitch_bot').setLevel(logging.CRITICAL)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Headless OAuth provisioning and rotation end to end against the local fake Twitch.
+
+    python benchmarks/bench_provision.py [--accounts 50] [--concurrency 10] [--delay 0.05]
+
+A fake browser follows each authorization URL to StubTwitch's
+/oauth2/authorize, logged in as the account being provisioned, and on to
+the Provisioner's callback server. Reports:
+
+1. --accounts accounts provisioned one at a time (the interactive script's
+   pace without the human) and concurrently, with OAuth requests made and
+   every stored file checked: tokens validate as the file's account;
+2. a wrong-account login, a denied authorization and a forged callback,
+   each of which must fail without writing credentials;
+3. rotating every stored account one at a time and concurrently.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import aiohttp
+
+from common import point_at_stub
+from stub_twitch import LOGIN_HEADER, StubTwitch
+
+
+class FakeBrowser:
+    """Opens authorization URLs as whichever account logged_in_as(login) says"""
+
+    def __init__(self, logged_in_as=lambda login: login):
+        self.logged_in_as = logged_in_as
+        self.session = aiohttp.ClientSession()
+        self.tasks = set()
+
+    def open(self, login, url):
+        task = asyncio.ensure_future(self.visit(url, self.logged_in_as(login)))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def visit(self, url, login):
+        headers = {LOGIN_HEADER: login} if login else {}
+        async with self.session.get(url, headers=headers) as response:
+            await response.read()
+
+    async def close(self):
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.session.close()
+
+
+def check_store(stub, store, logins):
+    """Accounts whose stored tokens are missing or belong to someone else"""
+    bad = []
+    for login in logins:
+        path = store.path(login)
+        values = store.load(login) if os.path.exists(path) else {}
+        if (stub.token_logins.get(values.get('ACCESS_TOKEN')) != login
+                or stub.token_logins.get(values.get('REFRESH_TOKEN')) != login):
+            bad.append(login)
+    return bad
+
+
+def make_provisioner(store, browser, concurrency):
+    from oauth_provision import CallbackServer, Provisioner
+    return Provisioner('bench-client-id', 'bench-client-secret', store, CallbackServer(port=0),
+                       on_authorize=browser.open, concurrency=concurrency, timeout=10)
+
+
+async def provision(stub, args, root, name, concurrency, one_at_a_time):
+    from oauth_provision import CredentialStore
+
+    store = CredentialStore(os.path.join(root, name.replace(' ', '-')))
+    browser = FakeBrowser()
+    provisioner = make_provisioner(store, browser, concurrency)
+    await provisioner.start()
+    accounts = [{'bot_username': f'benchbot{index}', 'channel_name': f'channel{index}'}
+                for index in range(args.accounts)]
+    stub.requests = 0
+    start = time.perf_counter()
+    if one_at_a_time:
+        for account in accounts:
+            await provisioner.provision(account)
+    else:
+        await provisioner.provision_all(accounts)
+    elapsed = time.perf_counter() - start
+    await provisioner.close()
+    await browser.close()
+    logins = [account['bot_username'] for account in accounts]
+    bad = check_store(stub, store, logins)
+    print(f"{name}: {len(logins)} accounts in {elapsed:.2f}s ({stub.requests} OAuth requests, "
+          f"{provisioner.stats()['failures']} failures); {len(store.accounts())} files written, "
+          f"{len(bad)} with wrong or missing tokens")
+    return store, logins
+
+
+async def failures(stub, root):
+    from oauth_provision import CredentialStore
+
+    store = CredentialStore(os.path.join(root, 'failures'))
+    # benchbotwrong's browser is logged in to benchbot0; benchbotdenied's declines
+    browser = FakeBrowser({'benchbotwrong': 'benchbot0', 'benchbotdenied': None}.get)
+    provisioner = make_provisioner(store, browser, 10)
+    await provisioner.start()
+    results = await provisioner.provision_all([{'bot_username': 'benchbotwrong'}, {'bot_username': 'benchbotdenied'}])
+    async with browser.session.get(f'{provisioner.callback_server.redirect_uri}/?code=forged&state=guessed') as response:
+        forged = response.status
+    await provisioner.close()
+    await browser.close()
+    for login, result in results.items():
+        print(f"  {login}: {result}")
+    print(f"  forged callback answered {forged}; credential files written: {len(store.accounts())}")
+
+
+async def rotate(stub, args, store, logins):
+    from oauth_provision import Provisioner
+
+    for name, concurrency, one_at_a_time in (('rotate one at a time', 1, True),
+                                             (f'rotate, concurrency {args.concurrency}', args.concurrency, False)):
+        provisioner = Provisioner('bench-client-id', 'bench-client-secret', store, concurrency=concurrency)
+        before = {login: store.load(login)['ACCESS_TOKEN'] for login in logins}
+        stub.requests = 0
+        start = time.perf_counter()
+        if one_at_a_time:
+            for login in logins:
+                await provisioner.rotate(login)
+        else:
+            await provisioner.rotate_all()
+        elapsed = time.perf_counter() - start
+        await provisioner.close()
+        unchanged = sum(1 for login in logins if store.load(login)['ACCESS_TOKEN'] == before[login])
+        print(f"{name}: {len(logins)} accounts in {elapsed:.2f}s ({stub.requests} OAuth requests); "
+              f"{unchanged} unchanged, {len(check_store(stub, store, logins))} with wrong or missing tokens")
+
+
+async def run(args):
+    # Expected failures are printed below; the log would repeat them
+    logging.getLogger('twitch_bot').setLevel(logging.CRITICAL)
+    # Must be pointed at before http_client reads its base URLs
+    stub = StubTwitch(delay=args.delay)
+    point_at_stub(await stub.start())
+    root = tempfile.mkdtemp()
+    try:
+        print(f"{args.accounts} accounts, {args.delay * 1000:.0f}ms per OAuth request")
+        await provision(stub, args, root, 'one at a time', 1, True)
+        store, logins = await provision(stub, args, root, f'concurrency {args.concurrency}',
+                                        args.concurrency, False)
+        print("failures:")
+        await failures(stub, root)
+        await rotate(stub, args, store, logins)
+    finally:
+        shutil.rmtree(root)
+        await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--accounts', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--delay', type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""IRC reconnect time and message loss under dropped connections, against the local fake IRC server.
+
+    python benchmarks/bench_reconnect.py [--channels 5] [--rate 500] [--drops 3] [--interval 6] [--silence 2]
+                                         [--login-delay 0.3] [--outage 3] [--mode both|plain|standby]
+
+A connected bot (ChatHarness) runs once as is and once with IRC_STANDBY=1,
+each in its own process. The fake server takes --login-delay seconds to
+answer a login. Chatters talk at --rate messages per second over
+--channels channels and the bot posts a message every 0.4s while:
+
+1. the active connection goes dead --drops times, --interval seconds
+   apart: nothing gets through for --silence seconds, then the socket is
+   cut (a standby notices the silence before that). Reports the time from
+   going dead until the bot is back in every channel, the longest silence
+   in chat and in the bot's own posts, chat lines lost or handled twice
+   and posts lost or made twice;
+2. every socket is cut and connections are refused for --outage seconds:
+   attempts made during the outage (the backoff) and time to be back in
+   every channel once the server takes connections again.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+
+from harness import ChatHarness
+
+
+async def wait_for(condition, timeout=30.0):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError
+        await asyncio.sleep(0.001)
+    return time.perf_counter() - start
+
+
+def longest_gap(times, start, end):
+    times = sorted(at for at in times if start <= at <= end)
+    return max((later - earlier for earlier, later in zip(times, times[1:])), default=end - start)
+
+
+class Traffic:
+    """What the bot received, and what reached the server from it"""
+
+    def __init__(self):
+        self.received = Counter()
+        self.received_at = []
+        self.posted = Counter()
+        self.posted_at = []
+
+    async def listener(self, message):
+        self.received[message.content] += 1
+        self.received_at.append(time.perf_counter())
+
+    def on_privmsg(self, rest):
+        # Runs on the server thread
+        content = rest.partition(' :')[2]
+        if content.startswith('out '):
+            self.posted[content] += 1
+            self.posted_at.append(time.perf_counter())
+
+
+async def chatter(irc, channels, rate, stop):
+    """Chat at `rate` per second in 10ms ticks until stop is set; returns the lines said"""
+    said = 0
+    start = time.perf_counter()
+    tick = 0
+    while not stop.is_set():
+        batch = []
+        while said < (tick + 1) * rate / 100:
+            batch.append((channels[said % len(channels)], f'user{said % 50}', f'chat {said}'))
+            said += 1
+        await irc.say_many(batch)
+        tick += 1
+        await asyncio.sleep(max(0.0, start + tick * 0.01 - time.perf_counter()))
+    return said
+
+
+async def poster(bot, channel, stop):
+    posts = 0
+    while not stop.is_set():
+        await bot.send_message(channel, f'out {posts}')
+        posts += 1
+        await asyncio.sleep(0.4)
+    return posts
+
+
+def rejoined(manager):
+    connection = manager.shards[0]
+    return connection.connected_at is not None and all(config.joined for config in manager.channels.values())
+
+
+async def drops(harness, args, traffic, channels):
+    bot, manager = harness.bot, harness.bot.channels
+    stop_chat, stop_posts = threading.Event(), asyncio.Event()
+    chat = harness.in_servers(chatter(harness.irc, channels, args.rate, stop_chat))
+    posts = asyncio.ensure_future(poster(bot, channels[0], stop_posts))
+    start = time.perf_counter()
+    recoveries = []
+    for _ in range(args.drops):
+        await asyncio.sleep(args.interval)
+        peer = manager.shards[0]._websocket.get_extra_info('sockname')
+        lost = manager.reconnects
+        dead = time.perf_counter()
+        drop = harness.in_servers(harness.irc.drop(peer, silence=args.silence))
+        await wait_for(lambda: manager.reconnects > lost)
+        await wait_for(lambda: rejoined(manager))
+        recoveries.append(time.perf_counter() - dead)
+        await drop
+    await asyncio.sleep(args.interval)
+    stop_posts.set()
+    sent_posts = await posts
+    stop_chat.set()
+    said = await chat
+    end = time.perf_counter()
+    # Let the last lines and posts arrive
+    await asyncio.sleep(1.0)
+
+    handled = sum(traffic.received.values())
+    print(f"  {args.drops} drops: back in every channel after going dead for "
+          f"{', '.join(f'{recovery * 1000:.0f}ms' for recovery in recoveries)}")
+    print(f"  chat: {said} lines said, {len(traffic.received)} handled, {said - len(traffic.received)} lost, "
+          f"{handled - len(traffic.received)} twice; longest silence "
+          f"{longest_gap(traffic.received_at, start, end) * 1000:.0f}ms (normal {1000 / args.rate:.0f}ms)")
+    print(f"  posts: {sent_posts} queued, {len(traffic.posted)} posted, "
+          f"{sent_posts - len(traffic.posted)} lost, "
+          f"{sum(count - 1 for count in traffic.posted.values())} twice; longest gap "
+          f"{longest_gap(traffic.posted_at, start, end) * 1000:.0f}ms (normal 400ms)")
+    stats, queue = manager.stats(), bot.send_queue.stats()
+    print(f"  failovers {stats['failovers']}, chat lines replayed {stats['replayed']}, "
+          f"posts rewritten after failover {stats['replayed_sends']}, send retries {queue['retried']}")
+
+
+async def outage(harness, args, channels):
+    irc, manager = harness.irc, harness.bot.channels
+    irc.refusing = True
+    lost = manager.reconnects
+    await harness.in_servers(irc.drop())
+    await wait_for(lambda: manager.reconnects > lost)
+    await asyncio.sleep(args.outage)
+    refused = irc.refused
+    irc.refusing = False
+    reopened = time.perf_counter()
+    await wait_for(lambda: rejoined(manager), timeout=60.0)
+    back = time.perf_counter() - reopened
+    if manager.standby:
+        await wait_for(lambda: manager.stats()['standby_joined'] == len(channels), timeout=60.0)
+    print(f"  {args.outage:g}s outage: {refused} connection attempts refused, back in every channel "
+          f"{back * 1000:.0f}ms after the server came back")
+
+
+async def run(args, standby):
+    harness = ChatHarness(mod=True, login_delay=args.login_delay)
+    channels = [f'channel{index:02d}' for index in range(args.channels)]
+    await harness.start(channels)
+    manager = harness.bot.channels
+    if standby:
+        await wait_for(lambda: manager.stats()['standby_joined'] == len(channels))
+    traffic = Traffic()
+    harness.bot.add_message_listener(traffic.listener, queue_size=0)
+    harness.irc.on_privmsg = traffic.on_privmsg
+    print(f"{'with standby' if standby else 'plain reconnect'}:")
+    await drops(harness, args, traffic, channels)
+    await outage(harness, args, channels)
+    # The reconnected primary runs event_ready again; let its token check finish
+    await asyncio.sleep(0.5)
+    await harness.stop()
+
+
+def run_mode(args, standby):
+    # Read by the bot when it is created
+    os.environ['IRC_STANDBY'] = '1' if standby else '0'
+    asyncio.run(run(args, standby))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--rate', type=int, default=500)
+    parser.add_argument('--drops', type=int, default=3)
+    parser.add_argument('--interval', type=float, default=6.0)
+    parser.add_argument('--silence', type=float, default=2.0)
+    parser.add_argument('--login-delay', type=float, default=0.3)
+    parser.add_argument('--outage', type=float, default=3.0)
+    parser.add_argument('--mode', choices=('both', 'plain', 'standby'), default='both')
+    args = parser.parse_args()
+    modes = {'both': (False, True), 'plain': (False,), 'standby': (True,)}[args.mode]
+    for standby in modes:
+        # A process each: the IRC endpoint is fixed when the bot modules are imported
+        child = multiprocessing.get_context('spawn').Process(target=run_mode, args=(args, standby))
+        child.start()
+        child.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Drive SendQueue with a fake clock and transport through a burst of replies.
+
+    python benchmarks/bench_send_queue.py [--burst 300] [--mod]
+
+Checks that no 30s window exceeds the bucket size, that moderation
+messages overtake queued chatter and that duplicate replies coalesce.
+"""
+import argparse
+import asyncio
+from collections import deque
+
+from common import FakeClock, Timer
+from send_queue import SendQueue, MOD_LIMIT, USER_LIMIT, PRIORITY_MODERATION, PRIORITY_CHAT
+
+
+async def run(burst, mod):
+    clock = FakeClock()
+    sent = []
+
+    async def transport(channel, content, reply_to, nonce):
+        sent.append((clock(), content))
+
+    queue = SendQueue(transport, is_mod=lambda channel: mod, clock=clock, sleep=clock.sleep)
+    futures = []
+    with Timer() as timer:
+        for i in range(burst):
+            # A third of the burst repeats the same greeting
+            content = 'Hello! Welcome to the stream!' if i % 3 == 0 else f'reply {i}'
+            futures.append(queue.submit('benchchannel', content, PRIORITY_CHAT))
+        futures.append(queue.submit('benchchannel', '/timeout spammer 60', PRIORITY_MODERATION))
+        print(f"queued: {queue.stats()['depth_by_priority']} (coalesced {queue.coalesced})")
+        await asyncio.gather(*futures)
+
+    limit, per = MOD_LIMIT if mod else USER_LIMIT
+    window = deque()
+    worst = 0
+    for at, _ in sent:
+        window.append(at)
+        while window[0] <= at - per:
+            window.popleft()
+        worst = max(worst, len(window))
+    moderation_at = next(i for i, (_, content) in enumerate(sent) if content.startswith('/timeout'))
+    stats = queue.stats()
+    print(f"sent {stats['sent']} over {sent[-1][0] - sent[0][0]:.1f} virtual seconds "
+          f"({timer.elapsed * 1000:.1f}ms real)")
+    print(f"max in any {per:.0f}s window: {worst} (limit {limit})")
+    print(f"moderation message sent at position {moderation_at}")
+    print(f"peak depth {stats['peak_depth']}, avg wait {stats['avg_wait']:.1f}s")
+    await queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--burst', type=int, default=300)
+    parser.add_argument('--mod', action='store_true', help='use the moderator bucket')
+    args = parser.parse_args()
+    asyncio.run(run(args.burst, args.mod))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Throughput of the multi-process supervisor with 1, 2, 4 and 8 workers.
+
+    python benchmarks/bench_sharding.py [--workers 1,2,4,8] [--channels 200]
+                                        [--messages 40000] [--work 20]
+
+A fixed, seeded chat corpus is replayed through a fake Twitch IRC server to
+workers started by supervisor.Supervisor. Each worker runs a CPU-bound
+listener (--work passes of a moderation-style regex scan per message), so
+throughput can only grow with the number of cores available.
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import time
+
+import aiohttp
+
+from common import fake_credentials, point_at_stub
+from fake_irc import FakeIRC
+from stub_twitch import StubTwitch
+
+WORDS = ('hello', 'gg', 'pog', 'lol', 'nice', 'play', 'what', 'is', 'this', 'song', 'wow', 'clip',
+         'that', 'kappa', 'LUL', 'no', 'way', 'first', 'time', 'chat', 'streamer', 'hype')
+FILTER = re.compile(r'(?i)\b(?:free\s+followers|bit\.ly/\w+|(?:\w+\.)+(?:ru|xyz|top)\b|(.)\1{6,})')
+
+
+def make_corpus(count, channels, seed=1):
+    """A reproducible stream of (channel, user, content) chat lines"""
+    rng = random.Random(seed)
+    users = [f'chatter{index}' for index in range(2000)]
+    corpus = []
+    for _ in range(count):
+        words = rng.choices(WORDS, k=rng.randint(2, 14))
+        if rng.random() < 0.02:
+            words.append('free followers at spam.xyz')
+        corpus.append((rng.choice(channels), rng.choice(users), ' '.join(words)))
+    return corpus
+
+
+def bench_worker(index, auth_creds, channels, conn):
+    """Worker process: a CustomBot with one CPU-bound listener, reporting its count"""
+    from bot import CustomBot
+    from supervisor import WorkerLink
+
+    work = int(os.environ.get('BENCH_WORK', '20'))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    link = WorkerLink(conn)
+    processed = 0
+
+    async def moderate(message):
+        nonlocal processed
+        for _ in range(work):
+            FILTER.search(message.content)
+        processed += 1
+
+    async def report():
+        last = -1
+        while True:
+            if processed != last:
+                last = processed
+                link.send('processed', processed)
+            await asyncio.sleep(0.02)
+
+    async def start():
+        bot = CustomBot(auth_creds, channels=channels, token_source=link.request_token)
+        bot.add_message_listener(moderate, queue_size=0)
+        link.attach(bot)
+        bot._http.nick = auth_creds['bot_username']
+        bot._http.session = aiohttp.ClientSession()
+        bot._closing = asyncio.Event()
+        loop.create_task(report())
+        await bot._connection._connect()
+
+    loop.run_until_complete(start())
+    loop.run_forever()
+
+
+async def wait_for(predicate, timeout):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError('benchmark condition not reached in time')
+        await asyncio.sleep(0.01)
+
+
+async def run_once(irc, workers, names, corpus):
+    from supervisor import Supervisor
+
+    supervisor = Supervisor(fake_credentials(), names, workers=workers, target=bench_worker)
+    counts = {}
+
+    def on_message(index, kind, *args):
+        if kind == 'processed':
+            counts[index] = args[0]
+    supervisor.on_message = on_message
+
+    supervisor.start()
+    await wait_for(lambda: irc.joined() == len(names) and all(h.ready for h in supervisor.handles.values()),
+                   timeout=120.0)
+    start = time.perf_counter()
+    await irc.say_many(corpus)
+    pushed = time.perf_counter() - start
+    await wait_for(lambda: sum(counts.values()) >= len(corpus), timeout=600.0)
+    elapsed = time.perf_counter() - start
+    per_worker = [len(supervisor.assignment[index]) for index in sorted(supervisor.assignment)]
+    await supervisor.stop()
+    await wait_for(lambda: not irc.connections, timeout=30.0)
+    return elapsed, pushed, per_worker
+
+
+async def run(args):
+    irc = FakeIRC()
+    stub = StubTwitch(delay=0)
+    os.environ['TWITCH_IRC_URL'] = await irc.start()
+    os.environ['BENCH_WORK'] = str(args.work)
+    point_at_stub(await stub.start())
+
+    names = [f'bench{index:04d}' for index in range(args.channels)]
+    corpus = make_corpus(args.messages, names)
+    print(f"{os.cpu_count()} CPU(s), {len(corpus)} messages over {len(names)} channels, work={args.work}")
+    baseline = None
+    for workers in args.workers:
+        elapsed, pushed, per_worker = await run_once(irc, workers, names, corpus)
+        rate = len(corpus) / elapsed
+        baseline = baseline or rate
+        print(f"{workers} worker(s): {rate:,.0f} msgs/sec ({rate / baseline:.2f}x), "
+              f"replay pushed in {pushed:.2f}s, channels per worker {per_worker}")
+
+    await irc.stop()
+    await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=lambda value: [int(n) for n in value.split(',')], default=[1, 2, 4, 8])
+    parser.add_argument('--channels', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=40000)
+    parser.add_argument('--work', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Time-to-first-message with 200 synthetic command modules: eager vs lazy loading.
+
+    python benchmarks/bench_startup.py [--modules 200] [--import-cost 0.005]
+
+Each synthetic module pays --import-cost seconds at import time, standing in
+for heavy imports such as openai. The clock runs from creating the loader
+until the first command's callback runs.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from common import fake_message, make_bot
+
+MODULE_TEMPLATE = '''import time
+from commands import BotCommand
+
+# Stand-in for expensive imports
+time.sleep({cost})
+
+class Command{index}(BotCommand):
+    """Synthetic command module {index}"""
+
+    def register_commands(self):
+        @self.bot.command(name="cmd{index}", aliases=["c{index}"])
+        async def cmd{index}(ctx):
+            self.bot.first_reply_at = time.perf_counter()
+'''
+
+
+def write_modules(root, count, cost):
+    for index in range(count):
+        module_dir = os.path.join(root, f'synthetic{index:03d}')
+        os.makedirs(module_dir)
+        with open(os.path.join(module_dir, 'command.py'), 'w', encoding='utf-8') as f:
+            f.write(MODULE_TEMPLATE.format(index=index, cost=cost))
+
+
+async def time_to_first_message(commands_dir, manifest_path, lazy):
+    from command_loader import CommandLoader
+
+    bot = make_bot()
+    start = time.perf_counter()
+    loader = CommandLoader(bot, commands_dir, lazy=lazy, manifest_path=manifest_path)
+    loader.load_all()
+    bot.command_router.rebuild(bot.commands)
+    ready = time.perf_counter()
+    await bot.event_message(fake_message('!cmd7 hello'))
+    replied = getattr(bot, 'first_reply_at', None)
+    await bot.http_client.close()
+    if replied is None:
+        raise RuntimeError('first command did not run')
+    return ready - start, replied - start, len(loader.instances)
+
+
+async def run(count, cost):
+    root = tempfile.mkdtemp()
+    commands_dir = os.path.join(root, 'commands')
+    manifest_path = os.path.join(root, 'manifest.json')
+    write_modules(commands_dir, count, cost)
+    try:
+        for name, lazy in (('eager', False), ('lazy, cold manifest', True), ('lazy, warm manifest', True)):
+            ready, first, imported = await time_to_first_message(commands_dir, manifest_path, lazy)
+            print(f"{name}: ready in {ready * 1000:.1f}ms, first reply at {first * 1000:.1f}ms, "
+                  f"{imported}/{count} modules imported")
+    finally:
+        shutil.rmtree(root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modules', type=int, default=200)
+    parser.add_argument('--import-cost', type=float, default=0.005)
+    args = parser.parse_args()
+    asyncio.run(run(args.modules, args.import_cost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""State store under 10k point updates per second, against writing each update straight to disk.
+
+    python benchmarks/bench_store.py [--rate 10000] [--seconds 5] [--users 5000] [--dir /tmp]
+
+1. StateStore: --rate incr() calls per second on a points namespace spread
+   over --users chatters, for --seconds. Reports per-call latency, event
+   loop lag, flushes and rows written against updates, then reopens the
+   database and checks every point landed.
+2. The same updates written the naive ways, on the loop: one SQLite commit
+   per update, and dotenv.set_key (the bot's only persistence path before).
+3. A snapshot of the populated store, and a crash: a child process doing
+   the 10k/s workload is killed with SIGKILL mid-run, and the database it
+   leaves behind is checked for integrity.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import signal
+import sqlite3
+import tempfile
+import time
+
+from common import LoopLagProbe, summarize
+
+
+async def workload(store, rate, seconds, users, seed=1):
+    """incr() at `rate` per second in 10ms ticks; returns (expected totals, per-call latencies)"""
+    rng = random.Random(seed)
+    points = store.namespace('points')
+    expected = {}
+    latencies = []
+    per_tick = max(1, int(rate / 100))
+    start = time.perf_counter()
+    for tick in range(int(seconds * 100)):
+        for _ in range(per_tick):
+            user = rng.randrange(users)
+            started = time.perf_counter()
+            await points.incr(user, 10)
+            latencies.append(time.perf_counter() - started)
+            expected[str(user)] = expected.get(str(user), 0) + 10
+        await asyncio.sleep(max(0.0, start + (tick + 1) * 0.01 - time.perf_counter()))
+    return expected, latencies
+
+
+async def state_store(args, path):
+    from store import StateStore
+
+    store = StateStore(path)
+    probe = LoopLagProbe()
+    probe.start()
+    start = time.perf_counter()
+    expected, latencies = await workload(store, args.rate, args.seconds, args.users)
+    elapsed = time.perf_counter() - start
+    await probe.stop()
+    await store.close()
+    stats = store.stats()
+    latency, lag = summarize(latencies), probe.summary()
+    print(f"  {len(latencies)} updates in {elapsed:.2f}s = {len(latencies) / elapsed:,.0f}/s")
+    print(f"  incr() p50={latency['p50_ms'] * 1000:.1f}us p99={latency['p99_ms'] * 1000:.1f}us "
+          f"max={latency['max_ms']:.2f}ms ({stats['misses']} cache misses read from disk)")
+    print(f"  loop lag p50={lag['p50_ms']:.2f}ms p99={lag['p99_ms']:.2f}ms max={lag['max_ms']:.2f}ms")
+    print(f"  {stats['flushes']} flushes wrote {stats['rows_written']} rows for {stats['updates']} updates "
+          f"({stats['coalesced']} coalesced), last flush {stats['last_flush_time'] * 1000:.1f}ms")
+
+    reopened = StateStore(path)
+    stored = await reopened.items('points')
+    await reopened.close()
+    print(f"  after reopening: {len(stored)} users, "
+          f"{'all points present' if stored == expected else 'MISMATCH'}")
+
+
+def naive_sqlite(path, updates, users):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE points (user TEXT PRIMARY KEY, value INTEGER)')
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for _ in range(updates):
+        with conn:
+            conn.execute('INSERT INTO points VALUES (?, 10) ON CONFLICT (user) DO UPDATE SET value = value + 10',
+                         (str(rng.randrange(users)),))
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed / updates
+
+
+def naive_dotenv(path, updates, users):
+    from dotenv import set_key
+
+    open(path, 'w').close()
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for _ in range(updates):
+        set_key(path, f'POINTS_{rng.randrange(users)}', '10')
+    return (time.perf_counter() - start) / updates
+
+
+def crash_child(path, rate):
+    from store import StateStore
+
+    async def main():
+        await workload(StateStore(path, flush_interval=0.1), rate, 60, 5000)
+    asyncio.run(main())
+
+
+async def snapshot_and_crash(args, directory):
+    from store import StateStore
+
+    path = os.path.join(directory, 'state.db')
+    store = StateStore(path)
+    start = time.perf_counter()
+    await store.snapshot(os.path.join(directory, 'snapshot.db'))
+    await store.close()
+    snapshot = sqlite3.connect(os.path.join(directory, 'snapshot.db'))
+    rows = snapshot.execute('SELECT COUNT(*) FROM state').fetchone()[0]
+    snapshot.close()
+    print(f"  snapshot of {rows} rows in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    crash_path = os.path.join(directory, 'crash.db')
+    child = multiprocessing.get_context('spawn').Process(target=crash_child, args=(crash_path, args.rate))
+    child.start()
+    await asyncio.sleep(2.0 + random.random())
+    os.kill(child.pid, signal.SIGKILL)
+    child.join()
+    conn = sqlite3.connect(crash_path)
+    check = conn.execute('PRAGMA integrity_check').fetchone()[0]
+    rows, total = conn.execute('SELECT COUNT(*), SUM(value) FROM state').fetchone()
+    conn.close()
+    # Every flush adds a multiple of 10 to the total; a torn batch could leave anything
+    print(f"  killed mid-run: integrity_check={check}, {rows} rows, {int(total or 0) // 10} whole "
+          f"updates from complete batches")
+
+
+async def run(args):
+    directory = tempfile.mkdtemp(prefix='bench_store_', dir=args.dir)
+    print(f"StateStore, {args.rate:,}/s for {args.seconds:g}s over {args.users} users:")
+    await state_store(args, os.path.join(directory, 'state.db'))
+
+    print("naive, one write per update on the loop:")
+    per_update = naive_sqlite(os.path.join(directory, 'naive.db'), 2000, args.users)
+    print(f"  sqlite commit per update: {per_update * 1e6:.0f}us each, "
+          f"{args.rate * per_update * 100:.0f}% of the loop at {args.rate:,}/s")
+    per_update = naive_dotenv(os.path.join(directory, 'points.env'), 200, args.users)
+    print(f"  dotenv.set_key per update: {per_update * 1e6:.0f}us each, "
+          f"at most {1 / per_update:,.0f} updates/s")
+
+    print("snapshot and crash:")
+    await snapshot_and_crash(args, directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rate', type=int, default=10000)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--dir', default=None)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Token upkeep against a local fake OAuth endpoint: scheduling, single-flight and .env writes.
+
+    python benchmarks/bench_tokens.py [--hours 24] [--callers 50] [--writes 200]
+
+1. Simulates --hours of virtual time with 4-hour tokens, comparing the old
+   30-minute validate poll with TokenManager's expiry-driven schedule.
+2. Fires --callers concurrent refreshes (e.g. 401s racing the scheduled
+   refresh) and counts how many reach the token endpoint.
+3. Rewrites .env --writes times while a reader thread checks that it never
+   sees an access token paired with the wrong refresh token.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+
+from dotenv import dotenv_values, set_key
+
+from common import FakeClock, point_at_stub
+from stub_twitch import StubTwitch
+
+
+def reset(stub, delay=0.0, clock=None):
+    stub.delay = delay
+    stub.clock = clock
+    stub.issued_at = clock() if clock else None
+    stub.requests = stub.validations = stub.refreshes = 0
+
+
+async def legacy_policy(http_client, oauth_url, creds, clock):
+    """The removed CustomBot.token_check_loop: validate every 30 minutes, refresh under an hour"""
+    while True:
+        response = await http_client.get(f'{oauth_url}/validate',
+                                         headers={'Authorization': f"Bearer {creds['access_token']}"})
+        if response.status_code != 200 or response.json().get('expires_in', 0) < 3600:
+            response = await http_client.post(f'{oauth_url}/token', data={'refresh_token': creds['refresh_token']})
+            creds.update(response.json())
+        await clock.sleep(1800)
+
+
+async def simulate(stub, name, hours, start_policy):
+    clock = FakeClock()
+    reset(stub, clock=clock)
+    task = start_policy(clock)
+    end = clock.now + hours * 3600
+    while clock.now < end:
+        await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    print(f"{name}: {stub.validations} validations, {stub.refreshes} refreshes in {hours}h "
+          f"({stub.requests / hours:.1f} OAuth requests/hour)")
+
+
+async def compare_schedules(stub, hours, env_path):
+    from http_client import HttpClient, OAUTH_URL
+    from token_manager import TokenManager
+
+    http_client = HttpClient()
+    creds = {'access_token': 'bench-access-token', 'refresh_token': 'bench-refresh-token'}
+
+    def legacy(clock):
+        return asyncio.ensure_future(legacy_policy(http_client, OAUTH_URL, creds, clock))
+    await simulate(stub, '30-minute poll', hours, legacy)
+    await http_client.close()
+
+    managers = []
+
+    def scheduled(clock):
+        manager = TokenManager('bench-client-id', 'bench-client-secret', 'bench-access-token',
+                               'bench-refresh-token', env_path=env_path, clock=clock, sleep=clock.sleep)
+        managers.append(manager)
+        return manager.start()
+    await simulate(stub, 'TokenManager', hours, scheduled)
+    await managers[0].close()
+
+
+async def single_flight(stub, callers, env_path):
+    from token_manager import TokenManager
+
+    reset(stub, delay=0.05)
+    manager = TokenManager('bench-client-id', 'bench-client-secret', 'bench-access-token',
+                           'bench-refresh-token', env_path=env_path)
+    notified = []
+    manager.subscribe(lambda access, refresh: notified.append(access))
+    results = await asyncio.gather(*(manager.refresh() for _ in range(callers)))
+    print(f"{callers} concurrent refreshes: {stub.refreshes} token request(s), "
+          f"{sum(results)} callers saw success, subscribers notified {len(notified)} time(s)")
+    await manager.close()
+
+
+def torn_pairs(writes, env_path, writer):
+    """Count reads that saw an access token from one refresh and a refresh token from another"""
+    torn = [0, 0]
+    done = threading.Event()
+
+    def reader():
+        while not done.is_set():
+            values = dotenv_values(env_path)
+            access, refresh = values.get('ACCESS_TOKEN') or '', values.get('REFRESH_TOKEN') or ''
+            torn[1] += 1
+            if access.rsplit('-', 1)[-1] != refresh.rsplit('-', 1)[-1]:
+                torn[0] += 1
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for index in range(writes):
+        writer(env_path, f'access-{index}', f'refresh-{index}')
+    done.set()
+    thread.join()
+    return torn
+
+
+def atomic_writes(writes, env_path):
+    from token_manager import write_env
+
+    def two_set_keys(path, access, refresh):
+        set_key(path, 'ACCESS_TOKEN', access)
+        set_key(path, 'REFRESH_TOKEN', refresh)
+
+    def one_replace(path, access, refresh):
+        write_env(path, {'ACCESS_TOKEN': access, 'REFRESH_TOKEN': refresh})
+
+    for name, writer in (('set_key twice', two_set_keys), ('write_env', one_replace)):
+        write_env(env_path, {'CLIENT_ID': 'bench', 'ACCESS_TOKEN': 'access-x', 'REFRESH_TOKEN': 'refresh-x'})
+        torn, reads = torn_pairs(writes, env_path, writer)
+        print(f"{name}: {torn} of {reads} concurrent reads saw mismatched tokens")
+
+
+async def run(args):
+    # Must be pointed at before http_client reads its base URLs
+    stub = StubTwitch()
+    point_at_stub(await stub.start())
+    root = tempfile.mkdtemp()
+    env_path = os.path.join(root, '.env')
+    try:
+        await compare_schedules(stub, args.hours, env_path)
+        await single_flight(stub, args.callers, env_path)
+        atomic_writes(args.writes, env_path)
+    finally:
+        shutil.rmtree(root)
+        await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--callers', type=int, default=50)
+    parser.add_argument('--writes', type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
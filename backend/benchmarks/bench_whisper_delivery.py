@@ -0,0 +1,62 @@
+"""Whisper delivery through the WhisperQueue against a local stub Helix.
+
+    python benchmarks/bench_whisper_delivery.py [--whispers 300] [--recipients 250]
+                                                [--rate 20] [--server-rate 15]
+
+Recipients are given by login only, so their IDs come from batched
+GET /users lookups. The queue paces at --rate whispers/s while the stub
+answers anything above --server-rate with 429 + Ratelimit-Reset, which the
+queue must wait out and retry. Twitch's real cap is 3/s; the rates are scaled
+up so the run takes seconds rather than minutes.
+"""
+import argparse
+import asyncio
+import math
+
+from common import Timer, make_bot, point_at_stub
+from stub_twitch import StubTwitch
+
+
+async def run(args):
+    stub = StubTwitch(delay=0.05, whisper_limit=(args.server_rate, 1.0))
+    point_at_stub(await stub.start())
+    bot = make_bot()
+
+    from send_queue import TokenBucket
+
+    queue = bot.whispers
+    queue.buckets = [TokenBucket(args.rate, 1.0)]
+    queue.new_recipients = None
+
+    logins = [f'viewer{index}' for index in range(args.recipients - 3)] + ['ghost1', 'ghost2', 'ghost3']
+    with Timer() as timer:
+        results = await asyncio.gather(*(
+            bot.send_whisper(logins[index % len(logins)], f'hello #{index}')
+            for index in range(args.whispers)
+        ))
+    stats = queue.stats()
+    print(f"{args.whispers} whispers to {len(logins)} logins in {timer.elapsed:.2f}s: "
+          f"delivered={sum(results)} failed={len(results) - sum(results)} (3 logins don't exist)")
+    print(f"user lookups: {stub.user_lookups} GET /users for {len(logins)} logins "
+          f"(ceil({len(logins)}/100) = {math.ceil(len(logins) / 100)}), cache size {len(bot.users)}")
+    print(f"429s from server: {stub.rejected_whispers}, retried {stats['retried']}")
+    print(f"delivery latency p50={stats['latency_p50'] * 1000:.0f}ms p95={stats['latency_p95'] * 1000:.0f}ms "
+          f"p99={stats['latency_p99'] * 1000:.0f}ms max={stats['latency_max'] * 1000:.0f}ms")
+
+    await bot.whispers.close()
+    await bot.http_client.close()
+    await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--whispers', type=int, default=300)
+    parser.add_argument('--recipients', type=int, default=250)
+    parser.add_argument('--rate', type=int, default=20)
+    parser.add_argument('--server-rate', type=int, default=15)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Event-loop lag while 100 whispers are in flight against a local stub Helix.
+
+    python benchmarks/bench_whispers.py [--count 100] [--delay 0.2]
+"""
+import argparse
+import asyncio
+from types import SimpleNamespace
+
+from common import LoopLagProbe, Timer, make_bot, point_at_stub
+from stub_twitch import StubTwitch, start_in_thread
+
+
+async def run(count, delay, blocking):
+    stub = StubTwitch(delay=delay)
+    # The stub gets its own loop so the blocking path cannot starve it
+    point_at_stub(start_in_thread(stub))
+    bot = make_bot()
+    # Only the HTTP path is measured here; bench_whisper_delivery.py covers pacing
+    bot.whispers.buckets = []
+    bot.whispers.recipient_limit = (count, 1.0)
+    bot.whispers.new_recipients = None
+
+    users = [SimpleNamespace(id=str(1000 + i), name=f'user{i}') for i in range(count)]
+    if blocking:
+        import requests
+
+        async def send(user):
+            # The pre-HttpClient code path, kept for comparison
+            requests.post(f'{stub.base_url}/helix/whispers', params={'to_user_id': user.id},
+                          json={'message': 'hi'})
+    else:
+        async def send(user):
+            await bot.send_whisper(user, 'hi')
+
+    probe = LoopLagProbe()
+    probe.start()
+    # Let the probe take a baseline sample, and one more after the run so a
+    # fully blocked loop still shows up as a single huge sample
+    await asyncio.sleep(probe.interval * 2)
+    with Timer() as timer:
+        await asyncio.gather(*(send(user) for user in users))
+    await asyncio.sleep(probe.interval * 2)
+    await probe.stop()
+
+    await bot.http_client.close()
+
+    lag = probe.summary()
+    mode = 'blocking requests' if blocking else 'HttpClient'
+    print(f"{mode}: {count} whispers in {timer.elapsed:.3f}s, delivered={len(stub.whispers)}")
+    print(f"  loop lag p50={lag['p50_ms']:.2f}ms p99={lag['p99_ms']:.2f}ms max={lag['max_ms']:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--delay', type=float, default=0.2)
+    parser.add_argument('--blocking', action='store_true', help='measure the old blocking requests path')
+    args = parser.parse_args()
+    asyncio.run(run(args.count, args.delay, args.blocking))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Shared helpers for the benchmark scripts in this directory"""
+import os
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def point_at_stub(base_url):
+    """Route OAuth/Helix calls to a stub server. Call before importing bot modules."""
+    os.environ['TWITCH_OAUTH_URL'] = f'{base_url}/oauth2'
+    os.environ['TWITCH_HELIX_URL'] = f'{base_url}/helix'
+
+
+def fake_credentials():
+    """Credentials accepted by the stub servers"""
+    return {
+        'bot_username': 'benchbot',
+        'channel_name': 'benchchannel',
+        'client_id': 'bench-client-id',
+        'client_secret': 'bench-client-secret',
+        'access_token': 'bench-access-token',
+        'refresh_token': 'bench-refresh-token'
+    }
+
+
+# Tags as twitchio parses them for an ordinary chatter
+SAMPLE_TAGS = {
+    'badge-info': 'subscriber/14',
+    'badges': 'subscriber/12,premium/1',
+    'color': '#1E90FF',
+    'display-name': 'Viewer',
+    'emotes': '',
+    'first-msg': '0',
+    'flags': '',
+    'id': 'b34ccfc7-4977-403a-8a94-33c6bac34fb8',
+    'mod': '0',
+    'returning-chatter': '0',
+    'room-id': '12345678',
+    'subscriber': '1',
+    'tmi-sent-ts': '1700000000000',
+    'turbo': '0',
+    'user-id': '87654321',
+    'user-type': ''
+}
+
+
+def fake_message(content, author='viewer', tags=None, channel='benchchannel'):
+    """A stand-in for twitchio.Message carrying what event_message reads"""
+    return SimpleNamespace(
+        content=content,
+        id=(tags or SAMPLE_TAGS)['id'],
+        author=SimpleNamespace(name=author, id=(tags or SAMPLE_TAGS)['user-id'], _ws=None),
+        channel=SimpleNamespace(name=channel),
+        tags=tags if tags is not None else SAMPLE_TAGS,
+        echo=False
+    )
+
+
+def make_bot():
+    """Build a CustomBot that never touches the network. Call inside a running loop."""
+    from bot import CustomBot
+    bot = CustomBot(fake_credentials())
+    bot._connection.user_id = 1
+    bot.token_check_task.cancel()
+    return bot
+
+
+class LoopLagProbe:
+    """Measure event-loop lag by timing how late short sleeps wake up"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def summary(self):
+        return summarize(self.samples)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(values):
+    """Return max/p50/p99 of a list of seconds, in milliseconds"""
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': (ordered[-1] if ordered else 0.0) * 1000
+    }
+
+
+class FakeClock:
+    """Virtual monotonic clock; sleep() advances it instantly"""
+
+    def __init__(self, start=1000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+        await asyncio.sleep(0)
+
+
+class Timer:
+    """Context manager measuring wall time"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,152 @@
+"""Local fake of Twitch's EventSub WebSocket server for benchmarks.
+
+Mounted on a StubTwitch app (``StubTwitch(eventsub=FakeEventSub())``), it
+serves the socket at /eventsub and the subscription endpoints under
+/helix/eventsub/subscriptions, so the bot's Helix calls reach it. The
+benchmark drives it: notify() sends events to subscribed sessions,
+reconnect() asks every session to migrate, drop() cuts the sockets and
+pause_keepalives stops the keepalive messages.
+"""
+import asyncio
+import itertools
+import json
+import uuid
+from datetime import datetime, timezone
+
+from aiohttp import web, WSMsgType
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f000Z')
+
+
+def _message(kind, payload, **metadata):
+    return json.dumps({
+        'metadata': {'message_id': metadata.pop('message_id', str(uuid.uuid4())), 'message_type': kind,
+                     'message_timestamp': metadata.pop('timestamp', _now()), **metadata},
+        'payload': payload
+    })
+
+
+class FakeSession:
+    def __init__(self, session_id, ws):
+        self.id = session_id
+        self.ws = ws
+        self.subscriptions = {}
+
+
+class FakeEventSub:
+    def __init__(self, keepalive=10):
+        self.keepalive = keepalive
+        self.pause_keepalives = False
+        self.sessions = {}
+        self.url = None
+        self.connections = 0
+        self.subscribe_requests = 0
+        self.sent = 0
+        self._ids = itertools.count(1)
+
+    def add_routes(self, app):
+        app.router.add_get('/eventsub', self.handle)
+        app.router.add_post('/helix/eventsub/subscriptions', self.subscribe)
+        app.router.add_delete('/helix/eventsub/subscriptions', self.unsubscribe)
+
+    def started(self, base_url):
+        self.url = base_url.replace('http://', 'ws://') + '/eventsub'
+
+    def _welcome(self, session):
+        return _message('session_welcome', {'session': {
+            'id': session.id, 'status': 'connected', 'keepalive_timeout_seconds': self.keepalive,
+            'reconnect_url': None, 'connected_at': _now()}})
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        migrating = request.query.get('reconnect')
+        old = self.sessions.get(migrating) if migrating else None
+        if old is not None:
+            # Same session and subscriptions on the new socket; the old one closes after the welcome
+            old_ws, old.ws = old.ws, ws
+            session = old
+            await ws.send_str(self._welcome(session))
+            await old_ws.close()
+        else:
+            session = FakeSession(f'session-{next(self._ids)}', ws)
+            self.sessions[session.id] = session
+            await ws.send_str(self._welcome(session))
+        keepalive = asyncio.ensure_future(self._keepalive(session, ws))
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.TEXT:
+                    # Twitch closes sockets that send anything
+                    break
+        finally:
+            keepalive.cancel()
+            if session.ws is ws:
+                # Disconnected, not migrated: the session and its subscriptions are gone
+                self.sessions.pop(session.id, None)
+        return ws
+
+    async def _keepalive(self, session, ws):
+        while not ws.closed:
+            await asyncio.sleep(self.keepalive * 0.8)
+            if not self.pause_keepalives and session.ws is ws and not ws.closed:
+                await ws.send_str(_message('session_keepalive', {}))
+
+    async def subscribe(self, request):
+        self.subscribe_requests += 1
+        body = await request.json()
+        session = self.sessions.get(body['transport'].get('session_id'))
+        if session is None:
+            return web.json_response({'status': 400, 'message': 'websocket transport session does not exist'},
+                                     status=400)
+        key = (body['type'], body['version'], json.dumps(body['condition'], sort_keys=True))
+        if any(sub['key'] == key for sub in session.subscriptions.values()):
+            return web.json_response({'status': 409, 'message': 'subscription already exists'}, status=409)
+        subscription = {'id': str(uuid.uuid4()), 'status': 'enabled', 'type': body['type'],
+                        'version': body['version'], 'condition': body['condition'], 'cost': 0,
+                        'transport': body['transport'], 'created_at': _now()}
+        session.subscriptions[subscription['id']] = dict(subscription, key=key)
+        return web.json_response({'data': [subscription], 'total': 1, 'total_cost': 0,
+                                  'max_total_cost': 10}, status=202)
+
+    async def unsubscribe(self, request):
+        for session in self.sessions.values():
+            session.subscriptions.pop(request.query.get('id'), None)
+        return web.Response(status=204)
+
+    def subscribed(self):
+        return sum(len(session.subscriptions) for session in self.sessions.values())
+
+    async def notify(self, type, event, duplicate=False, timestamp=None):
+        """Send an event to the session subscribed to its type and channel; returns how many got it"""
+        channel = event.get('broadcaster_user_id') or event.get('to_broadcaster_user_id')
+        delivered = 0
+        for session in list(self.sessions.values()):
+            subscription = next((sub for sub in session.subscriptions.values() if sub['type'] == type
+                                 and channel in sub['condition'].values()), None)
+            if subscription is None or session.ws.closed:
+                continue
+            payload = {'subscription': {k: v for k, v in subscription.items() if k != 'key'}, 'event': event}
+            text = _message('notification', payload, subscription_type=type,
+                            subscription_version=subscription['version'],
+                            **({'timestamp': timestamp} if timestamp else {}))
+            for _ in range(2 if duplicate else 1):
+                await session.ws.send_str(text)
+                self.sent += 1
+            delivered += 1
+        return delivered
+
+    async def reconnect(self):
+        """Ask every session to move to a new socket, as Twitch does before maintenance"""
+        for session in list(self.sessions.values()):
+            url = f'{self.url}?reconnect={session.id}'
+            await session.ws.send_str(_message('session_reconnect', {'session': {
+                'id': session.id, 'status': 'reconnecting', 'keepalive_timeout_seconds': None,
+                'reconnect_url': url, 'connected_at': _now()}}))
+
+    async def drop(self):
+        """Cut every socket without warning"""
+        for session in list(self.sessions.values()):
+            await session.ws.close(code=4000)
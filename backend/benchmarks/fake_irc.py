@@ -0,0 +1,225 @@
+"""Local fake of Twitch's IRC-over-WebSocket chat server for benchmarks"""
+import asyncio
+import time
+from aiohttp import web, WSMsgType
+
+USER_TAGS = ('badge-info=;badges=;color=;display-name={user};emotes=;first-msg=0;flags=;'
+             'id={id};mod=0;room-id=1;subscriber=0;tmi-sent-ts={ts};turbo=0;user-id={user_id};user-type=')
+
+
+class FakeConnection:
+    """One client socket and the channels it has joined"""
+
+    def __init__(self, ws, transport=None):
+        self.ws = ws
+        self.transport = transport
+        # The client's (host, port), to pick out the socket of one of its connections
+        self.peer = transport.get_extra_info('peername') if transport else None
+        self.nick = None
+        self.channels = set()
+        # Set while the socket is going dead: nothing gets through either way
+        self.silent = False
+
+
+class FakeIRC:
+    """Minimal TMI server: logs clients in, answers JOIN/PART and injects chat.
+
+    Every JOINed channel is recorded with its arrival time so a benchmark
+    can check the client's join rate against Twitch's limit. As on Twitch,
+    chat goes to every connection that joined the channel, and a client's
+    own PRIVMSGs are relayed (with their client-nonce) to its other
+    connections there. drop() cuts connections and refusing turns new ones
+    away, to exercise reconnects.
+    """
+
+    def __init__(self, mod=False, login_delay=0.0):
+        # With mod, clients are told they moderate every channel they join (higher chat limits)
+        self.mod = mod
+        # Seconds before a login is answered, standing in for Twitch's TLS handshake and login
+        self.login_delay = login_delay
+        self.connections = []
+        self.join_times = []
+        self.join_commands = 0
+        self.sent = []
+        # Called as on_privmsg(rest) for every PRIVMSG a client sends
+        self.on_privmsg = None
+        self.refusing = False
+        self.logins = 0
+        self.refused = 0
+        self._message_id = 0
+        self._runner = None
+        self.url = None
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_get('/', self.handle)
+        return app
+
+    async def handle(self, request):
+        if self.refusing:
+            self.refused += 1
+            return web.Response(status=503)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        connection = FakeConnection(ws, request.transport)
+        self.connections.append(connection)
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                for line in msg.data.split('\r\n'):
+                    if line and not connection.silent:
+                        await self.on_line(connection, line)
+        finally:
+            self.connections.remove(connection)
+        return ws
+
+    async def on_line(self, connection, line):
+        tags = ''
+        if line.startswith('@'):
+            # Tagged client lines (replies, nonces) carry tags before the command
+            tags, line = line[1:].split(' ', 1)
+        command, _, rest = line.partition(' ')
+        if command == 'NICK':
+            self.logins += 1
+            connection.nick = rest.strip()
+            if self.login_delay:
+                await asyncio.sleep(self.login_delay)
+            nick = connection.nick
+            await self._deliver(connection,
+                f':tmi.twitch.tv 001 {nick} :Welcome, GLHF!\r\n'
+                f':tmi.twitch.tv 002 {nick} :Your host is tmi.twitch.tv\r\n'
+                f':tmi.twitch.tv 375 {nick} :-\r\n'
+                f':tmi.twitch.tv 372 {nick} :You are in a maze of twisty passages.\r\n'
+                f':tmi.twitch.tv 376 {nick} :>\r\n')
+        elif command == 'CAP':
+            await self._deliver(connection, f':tmi.twitch.tv CAP * ACK {rest.split(" ", 1)[1]}\r\n')
+        elif command == 'JOIN':
+            self.join_commands += 1
+            now = time.monotonic()
+            nick = connection.nick
+            lines = []
+            for channel in rest.strip().split(','):
+                name = channel.lstrip('#')
+                connection.channels.add(name)
+                self.join_times.append(now)
+                lines.append(f':{nick}!{nick}@{nick}.tmi.twitch.tv JOIN #{name}\r\n'
+                             f':{nick}.tmi.twitch.tv 353 {nick} = #{name} :{nick}\r\n'
+                             f':{nick}.tmi.twitch.tv 366 {nick} #{name} :End of /NAMES list\r\n'
+                             f'@badge-info=;badges={"moderator/1" if self.mod else ""};color=;'
+                             f'display-name={nick};emote-sets=0;mod={int(self.mod)};'
+                             f'subscriber=0;user-type= :tmi.twitch.tv USERSTATE #{name}\r\n')
+            await self._deliver(connection, ''.join(lines))
+        elif command == 'PART':
+            nick = connection.nick
+            for channel in rest.strip().split(','):
+                connection.channels.discard(channel.lstrip('#'))
+                await self._deliver(connection, f':{nick}!{nick}@{nick}.tmi.twitch.tv PART {channel}\r\n')
+        elif command == 'PING':
+            await self._deliver(connection, 'PONG :tmi.twitch.tv\r\n')
+        elif command == 'PRIVMSG':
+            self.sent.append(rest)
+            if self.on_privmsg is not None:
+                self.on_privmsg(rest)
+            channel, _, content = rest.partition(' :')
+            name = channel.lstrip('#')
+            others = [other for other in self.owners(name)
+                      if other is not connection and other.nick == connection.nick]
+            if others:
+                nonce = next((tag.split('=', 1)[1] for tag in tags.split(';')
+                              if tag.startswith('client-nonce=')), None)
+                line = self.privmsg(name, content, connection.nick, nonce=nonce)
+                for other in others:
+                    await self._deliver(other, line)
+
+    def joined(self):
+        return sum(len(connection.channels) for connection in self.connections)
+
+    def max_joins_in_window(self, window):
+        """Largest number of channels joined within any `window` seconds"""
+        best, start = 0, 0
+        for end, at in enumerate(self.join_times):
+            while at - self.join_times[start] >= window:
+                start += 1
+            best = max(best, end - start + 1)
+        return best
+
+    def privmsg(self, channel, content, user='viewer', user_id='87654321', nonce=None):
+        """Format a tagged PRIVMSG line as Twitch sends it"""
+        self._message_id += 1
+        tags = USER_TAGS.format(user=user, id=f'fake-{self._message_id}',
+                                ts=int(time.time() * 1000), user_id=user_id)
+        if nonce:
+            tags = f'client-nonce={nonce};{tags}'
+        return f'@{tags} :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #{channel} :{content}\r\n'
+
+    def owners(self, channel):
+        return [connection for connection in self.connections if channel in connection.channels]
+
+    def owner(self, channel):
+        owners = self.owners(channel)
+        return owners[0] if owners else None
+
+    async def _deliver(self, connection, data):
+        # A socket being cut loses what is sent to it, as on a real network
+        if not connection.ws.closed and not connection.silent:
+            try:
+                await connection.ws.send_str(data)
+            except ConnectionError:
+                pass
+
+    async def say(self, channel, content, user='viewer', user_id='87654321'):
+        """Deliver a PRIVMSG from a chatter to every client that joined the channel"""
+        owners = self.owners(channel)
+        line = self.privmsg(channel, content, user, user_id)
+        for connection in owners:
+            await self._deliver(connection, line)
+        return bool(owners)
+
+    async def say_many(self, messages, batch=200):
+        """Deliver (channel, user, content) messages, several lines per frame like Twitch does"""
+        pending = {}
+        for channel, user, content in messages:
+            owners = self.owners(channel)
+            if not owners:
+                continue
+            line = self.privmsg(channel, content, user, str(abs(hash(user)) % 10 ** 8))
+            for connection in owners:
+                lines = pending.setdefault(connection, [])
+                lines.append(line)
+                if len(lines) >= batch:
+                    await self._deliver(connection, ''.join(lines))
+                    lines.clear()
+        for connection, lines in pending.items():
+            if lines:
+                await self._deliver(connection, ''.join(lines))
+
+    async def drop(self, peer=None, silence=0.0):
+        """Cut client sockets without a close handshake (only the one at `peer` if given).
+
+        With silence, the sockets first carry nothing either way for that
+        many seconds, as a connection does before it is noticed to be dead.
+        """
+        connections = [connection for connection in self.connections if peer is None or connection.peer == peer]
+        for connection in connections:
+            connection.silent = True
+        if silence:
+            await asyncio.sleep(silence)
+        for connection in connections:
+            connection.transport.abort()
+        return len(connections)
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'ws://{host}:{port}/'
+        return self.url
+
+    async def stop(self):
+        for connection in list(self.connections):
+            await connection.ws.close()
+        if self._runner:
+            await self._runner.cleanup()
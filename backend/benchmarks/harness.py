@@ -0,0 +1,140 @@
+"""Run a real CustomBot, with its commands loaded, against local fake Twitch servers.
+
+The fake IRC and Helix/OAuth servers run on their own event loop in a
+background thread, so the bot's loop only carries the bot's own work and
+its lag can be measured honestly.
+"""
+import asyncio
+import os
+import re
+import resource
+import threading
+import time
+
+import aiohttp
+
+from common import LoopLagProbe, fake_credentials, point_at_stub, summarize
+from fake_irc import FakeIRC
+from replay import Replayer
+from stub_twitch import StubTwitch
+
+_PONG = re.compile(r':pong (\d+)$')
+
+
+def rss_mb():
+    """Current resident set size of this process in MB"""
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Elsewhere only the peak is available (bytes on macOS, KB on Linux)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if peak > 1 << 30 else peak / 1024
+
+
+class ChatHarness:
+    """Fake servers, a connected bot and the counters a benchmark reads.
+
+    Use ``await harness.start(channels)``, then ``await harness.replay(lines,
+    speed)`` as often as needed, and ``await harness.stop()``.
+    """
+
+    def __init__(self, mod=True, helix_delay=0.0, login_delay=0.0):
+        self.irc = FakeIRC(mod=mod, login_delay=login_delay)
+        self.stub = StubTwitch(delay=helix_delay)
+        self.bot = None
+        self.loader = None
+        self.received = 0
+        self.replies = {}
+        self._server_loop = None
+
+    def in_servers(self, coro):
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._server_loop))
+
+    async def start(self, channels):
+        self._server_loop = asyncio.new_event_loop()
+        threading.Thread(target=self._server_loop.run_forever, name='fake-twitch', daemon=True).start()
+        os.environ['TWITCH_IRC_URL'] = await self.in_servers(self.irc.start())
+        # Must be pointed at before http_client reads its base URLs
+        point_at_stub(await self.in_servers(self.stub.start()))
+        self.irc.on_privmsg = self._on_privmsg
+
+        from bot import CustomBot
+        from bot_logging import setup_logging
+        # main configures logging on import; keep the benchmark's output readable
+        from main import load_commands
+        setup_logging(level=os.getenv('LOG_LEVEL', 'WARNING'))
+
+        self.bot = CustomBot(fake_credentials(), channels=channels)
+        self.bot.token_check_task.cancel()
+        self.loader = load_commands(self.bot)
+
+        @self.bot.command(name='ping')
+        async def ping(ctx):
+            await ctx.send(f"pong {ctx.message.content.split()[-1]}")
+        self.bot.command_router.rebuild(self.bot.commands)
+
+        async def count(message):
+            self.received += 1
+        self.bot.add_message_listener(count, queue_size=0)
+
+        self.bot._http.nick = self.bot.bot_username
+        self.bot._http.session = aiohttp.ClientSession()
+        self.bot._closing = asyncio.Event()
+        await self.bot._connection._connect()
+        deadline = time.perf_counter() + 30.0
+        while self.irc.joined() < len(channels):
+            if time.perf_counter() > deadline:
+                raise TimeoutError('the bot did not join every channel')
+            await asyncio.sleep(0.01)
+        await self.bot.channels.wait_until_joined()
+
+    def _on_privmsg(self, rest):
+        # Runs on the server thread; the dict write needs no lock
+        match = _PONG.search(rest)
+        if match:
+            self.replies[int(match.group(1))] = time.perf_counter()
+
+    async def replay(self, lines, speed=1.0, probe_every=100, drain_timeout=60.0):
+        """Replay a corpus and return what the bot made of it"""
+        self.received = 0
+        self.replies = {}
+        replayer = Replayer(self.irc, lines, speed=speed, probe_every=probe_every)
+        probe = LoopLagProbe()
+        rss_before = rss_mb()
+        probe.start()
+        start = time.perf_counter()
+        played = await self.in_servers(replayer.run())
+        deadline = time.perf_counter() + drain_timeout
+        while self.received < replayer.sent or len(self.replies) < len(replayer.probes):
+            if time.perf_counter() > deadline:
+                break
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - start
+        await probe.stop()
+
+        latencies = [self.replies[index] - sent for index, sent in replayer.probes.items()
+                     if index in self.replies and sent is not None]
+        return {
+            'messages': replayer.sent,
+            'received': self.received,
+            'played_in': played,
+            'elapsed': elapsed,
+            'msgs_per_sec': self.received / elapsed if elapsed else 0.0,
+            'probes': len(replayer.probes),
+            'replies': len(latencies),
+            'reply_latency': summarize(latencies),
+            'loop_lag': probe.summary(),
+            'rss_mb': rss_mb(),
+            'rss_growth_mb': rss_mb() - rss_before
+        }
+
+    async def stop(self):
+        await self.bot.close()
+        await self.bot._http.session.close()
+        await self.in_servers(self.irc.stop())
+        await self.in_servers(self.stub.stop())
+        self._server_loop.call_soon_threadsafe(self._server_loop.stop)
@@ -0,0 +1,196 @@
+"""Record chat from Twitch into a corpus file and replay corpora into the fake IRC server.
+
+    python benchmarks/replay.py record --channels a,b,c [--duration 600] [--out chat.jsonl]
+    python benchmarks/replay.py synth [--messages 5000] [--rate 100] [--out chat.jsonl]
+
+A corpus is JSON lines of {"t": seconds since the first line, "channel",
+"user", "content"}. Recording joins anonymously (as justinfanNNNN), so it
+needs no token and can't send anything.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import aiohttp
+
+TWITCH_IRC_URL = 'wss://irc-ws.chat.twitch.tv:443'
+
+WORDS = ('hello', 'gg', 'pog', 'lol', 'nice', 'play', 'what', 'is', 'this', 'song', 'wow', 'clip',
+         'that', 'kappa', 'LUL', 'no', 'way', 'first', 'time', 'chat', 'streamer', 'hype')
+
+
+class ChatLine:
+    __slots__ = ('t', 'channel', 'user', 'content')
+
+    def __init__(self, t, channel, user, content):
+        self.t = t
+        self.channel = channel
+        self.user = user
+        self.content = content
+
+
+def load_corpus(path):
+    lines = []
+    with open(path, encoding='utf-8') as f:
+        for raw in f:
+            if raw.strip():
+                entry = json.loads(raw)
+                lines.append(ChatLine(entry['t'], entry['channel'], entry['user'], entry['content']))
+    return lines
+
+
+def save_corpus(path, lines):
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(json.dumps({'t': round(line.t, 3), 'channel': line.channel, 'user': line.user,
+                                'content': line.content}, ensure_ascii=False) + '\n')
+
+
+def synthetic_corpus(count, channels, rate=100.0, commands=('!greet',), command_ratio=0.01, seed=1):
+    """A reproducible corpus arriving at about `rate` lines/s, with Poisson gaps"""
+    rng = random.Random(seed)
+    users = [f'chatter{index}' for index in range(2000)]
+    lines = []
+    t = 0.0
+    for _ in range(count):
+        if rng.random() < command_ratio:
+            content = rng.choice(commands)
+        else:
+            content = ' '.join(rng.choices(WORDS, k=rng.randint(2, 14)))
+        lines.append(ChatLine(t, rng.choice(channels), rng.choice(users), content))
+        t += rng.expovariate(rate)
+    return lines
+
+
+class Recorder:
+    """Joins channels anonymously and keeps every PRIVMSG with its arrival time"""
+
+    def __init__(self, channels, url=None):
+        self.channels = channels
+        self.url = url or os.getenv('TWITCH_IRC_URL', TWITCH_IRC_URL)
+        self.lines = []
+
+    async def record(self, duration):
+        start = None
+        deadline = time.monotonic() + duration
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(self.url, heartbeat=30) as ws:
+                await ws.send_str(f'NICK justinfan{random.randint(10000, 99999)}\r\n')
+                for index in range(0, len(self.channels), 20):
+                    batch = ','.join(f'#{name}' for name in self.channels[index:index + 20])
+                    await ws.send_str(f'JOIN {batch}\r\n')
+                while time.monotonic() < deadline:
+                    try:
+                        msg = await ws.receive(timeout=max(0.1, deadline - time.monotonic()))
+                    except asyncio.TimeoutError:
+                        break
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    now = time.monotonic()
+                    for raw in msg.data.split('\r\n'):
+                        if raw.startswith('PING'):
+                            await ws.send_str('PONG :tmi.twitch.tv\r\n')
+                            continue
+                        parsed = self.parse(raw)
+                        if parsed is None:
+                            continue
+                        start = now if start is None else start
+                        self.lines.append(ChatLine(now - start, *parsed))
+        return self.lines
+
+    @staticmethod
+    def parse(raw):
+        """(channel, user, content) of a PRIVMSG line, None for anything else"""
+        if raw.startswith('@'):
+            raw = raw.split(' ', 1)[1] if ' ' in raw else ''
+        prefix, _, rest = raw.partition(' ')
+        command, _, rest = rest.partition(' ')
+        if command != 'PRIVMSG':
+            return None
+        channel, _, content = rest.partition(' :')
+        return channel.lstrip('#'), prefix.lstrip(':').split('!', 1)[0], content
+
+
+class Replayer:
+    """Plays a corpus into a FakeIRC server at a speed factor.
+
+    speed 1 keeps the recorded timing, 10 plays ten times faster and 0
+    sends everything as fast as possible. Lines due at the same moment go
+    out in one frame per connection, as Twitch batches them. Every
+    probe_every lines a ``!ping <n>`` from a probe user is added, and
+    ``probes[n]`` records when it was sent, for measuring reply latency.
+    """
+
+    def __init__(self, irc, lines, speed=1.0, probe_every=None, clock=time.perf_counter):
+        self.irc = irc
+        self.lines = lines
+        self.speed = speed
+        self.probe_every = probe_every
+        self.clock = clock
+        self.probes = {}
+        self.sent = 0
+
+    def _schedule(self):
+        schedule = []
+        for index, line in enumerate(self.lines):
+            schedule.append((line.channel, line.user, line.content, line.t))
+            if self.probe_every and index % self.probe_every == self.probe_every - 1:
+                schedule.append((line.channel, 'latencyprobe', f'!ping {len(self.probes)}', line.t))
+                self.probes[len(self.probes)] = None
+        return schedule
+
+    async def run(self):
+        schedule = self._schedule()
+        start = self.clock()
+        index = 0
+        while index < len(schedule):
+            due = self.clock() - start
+            batch = []
+            while index < len(schedule) and (not self.speed or schedule[index][3] / self.speed <= due):
+                batch.append(schedule[index])
+                index += 1
+                if not self.speed and len(batch) >= 200:
+                    break
+            if batch:
+                now = self.clock()
+                for channel, user, content, _ in batch:
+                    if user == 'latencyprobe':
+                        self.probes[int(content.split()[1])] = now
+                await self.irc.say_many([(channel, user, content) for channel, user, content, _ in batch])
+                self.sent += len(batch)
+            if index < len(schedule):
+                if self.speed:
+                    await asyncio.sleep(max(0.0, schedule[index][3] / self.speed - (self.clock() - start)))
+                else:
+                    await asyncio.sleep(0)
+        return self.clock() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest='mode', required=True)
+    record = sub.add_parser('record')
+    record.add_argument('--channels', required=True)
+    record.add_argument('--duration', type=float, default=600.0)
+    record.add_argument('--out', default='chat.jsonl')
+    synth = sub.add_parser('synth')
+    synth.add_argument('--messages', type=int, default=5000)
+    synth.add_argument('--rate', type=float, default=100.0)
+    synth.add_argument('--channels', default='benchchannel')
+    synth.add_argument('--out', default='chat.jsonl')
+    args = parser.parse_args()
+
+    channels = [name.strip().lstrip('#').lower() for name in args.channels.split(',') if name.strip()]
+    if args.mode == 'record':
+        lines = asyncio.run(Recorder(channels).record(args.duration))
+    else:
+        lines = synthetic_corpus(args.messages, channels, args.rate)
+    save_corpus(args.out, lines)
+    print(f"wrote {len(lines)} lines to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Local mock of the OpenAI chat completions API for benchmarks"""
+import json
+import time
+import asyncio
+from aiohttp import web
+
+
+class StubOpenAI:
+    """Answers /v1/chat/completions with a canned reply, streamed word by word.
+
+    Each reply starts after ``delay`` seconds and then takes ``token_delay``
+    per word, so a caller that blocks on it stalls for the whole answer.
+    """
+
+    def __init__(self, delay=0.2, token_delay=0.01, words=60):
+        self.delay = delay
+        self.token_delay = token_delay
+        self.words = words
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.completed = 0
+        self.aborted = 0
+        self._runner = None
+        self.base_url = None
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.completions)
+        return app
+
+    def answer(self, prompt):
+        words = [f'word{index}' for index in range(self.words)]
+        # A sentence end every ten words gives the chunker something to split at
+        return ' '.join(word + ('.' if index % 10 == 9 else '') for index, word in enumerate(words))
+
+    def event(self, content, finish_reason=None):
+        return {
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': 'stub',
+            'choices': [{'index': 0, 'delta': {'content': content} if content else {},
+                         'finish_reason': finish_reason}]
+        }
+
+    async def completions(self, request):
+        body = await request.json()
+        self.requests += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            text = self.answer(body['messages'][-1]['content'])
+            if not body.get('stream'):
+                await asyncio.sleep(self.token_delay * self.words)
+                self.completed += 1
+                return web.json_response({
+                    'id': 'chatcmpl-stub',
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': 'stub',
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': text}}]
+                })
+
+            response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+            await response.prepare(request)
+            for index, word in enumerate(text.split(' ')):
+                await asyncio.sleep(self.token_delay)
+                content = word if index == 0 else ' ' + word
+                await response.write(f"data: {json.dumps(self.event(content))}\n\n".encode())
+            await response.write(f"data: {json.dumps(self.event(None, 'stop'))}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+            self.completed += 1
+            return response
+        except (asyncio.CancelledError, ConnectionResetError):
+            # The client hung up mid-answer
+            self.aborted += 1
+            raise
+        finally:
+            self.active -= 1
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._runner = web.AppRunner(self.build_app(), access_log=None, handler_cancellation=True)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f'http://{host}:{port}'
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
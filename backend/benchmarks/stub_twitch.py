@@ -0,0 +1,213 @@
+"""Local stub of the Twitch OAuth and Helix HTTP APIs for benchmarks"""
+import time
+import asyncio
+import threading
+import uuid
+import zlib
+from collections import deque
+from urllib.parse import urlencode
+from aiohttp import web
+
+# Header the fake browser sends to say which account is logged in at /oauth2/authorize
+LOGIN_HEADER = 'X-Stub-Login'
+
+
+class StubTwitch:
+    """Minimal OAuth/Helix server with a configurable response delay"""
+
+    def __init__(self, delay=0.05, expires_in=14400, clock=None, whisper_limit=None, eventsub=None):
+        self.delay = delay
+        self.expires_in = expires_in
+        # With a clock, tokens age and expire; without one they always report expires_in
+        self.clock = clock
+        self.issued_at = clock() if clock else None
+        # (count, seconds): answer whispers over this rate with 429 and Ratelimit-Reset
+        self.whisper_limit = whisper_limit
+        self._whisper_times = deque()
+        self.requests = 0
+        self.validations = 0
+        self.refreshes = 0
+        self.authorizations = 0
+        self.exchanges = 0
+        self.user_lookups = 0
+        self.rejected_whispers = 0
+        self.stream_lookups = 0
+        self.moderation_actions = []
+        self.whispers = []
+        # Authorization code -> (login, redirect_uri, scopes); codes are single-use
+        self.codes = {}
+        # Access and refresh tokens issued for a login; other tokens validate as benchbot
+        self.token_logins = {}
+        # A FakeEventSub to serve the EventSub socket and subscription endpoints
+        self.eventsub = eventsub
+        self._runner = None
+        self.base_url = None
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_get('/oauth2/authorize', self.authorize)
+        app.router.add_get('/oauth2/validate', self.validate)
+        app.router.add_post('/oauth2/token', self.token)
+        app.router.add_post('/helix/whispers', self.whisper)
+        app.router.add_get('/helix/users', self.users)
+        app.router.add_get('/helix/streams', self.streams)
+        app.router.add_delete('/helix/moderation/chat', self.delete_message)
+        app.router.add_post('/helix/moderation/bans', self.ban)
+        if self.eventsub is not None:
+            self.eventsub.add_routes(app)
+        return app
+
+    def remaining(self):
+        if self.clock is None:
+            return self.expires_in
+        return int(self.expires_in - (self.clock() - self.issued_at))
+
+    async def validate(self, request):
+        self.requests += 1
+        self.validations += 1
+        await asyncio.sleep(self.delay)
+        if self.remaining() <= 0:
+            return web.json_response({'status': 401, 'message': 'invalid access token'}, status=401)
+        access_token = request.headers.get('Authorization', '').partition(' ')[2]
+        login = self.token_logins.get(access_token, 'benchbot')
+        return web.json_response({
+            'login': login,
+            'user_id': '1' if login == 'benchbot' else str(zlib.crc32(login.encode()) % 10 ** 9),
+            'client_id': 'bench-client-id',
+            'expires_in': self.remaining()
+        })
+
+    async def authorize(self, request):
+        """The consent page, already agreed to by whoever LOGIN_HEADER names"""
+        self.requests += 1
+        self.authorizations += 1
+        query = request.query
+        redirect_uri = query['redirect_uri']
+        login = request.headers.get(LOGIN_HEADER)
+        if login is None:
+            params = {'error': 'access_denied', 'error_description': 'The user denied you access'}
+        else:
+            code = uuid.uuid4().hex
+            self.codes[code] = (login, redirect_uri, query.get('scope', '').split())
+            params = {'code': code, 'scope': query.get('scope', '')}
+        if 'state' in query:
+            params['state'] = query['state']
+        raise web.HTTPFound(f'{redirect_uri}?{urlencode(params)}')
+
+    async def token(self, request):
+        self.requests += 1
+        form = await request.post()
+        await asyncio.sleep(self.delay)
+        if form.get('grant_type') == 'authorization_code':
+            return self.exchange(form)
+        self.refreshes += 1
+        if self.clock is not None:
+            self.issued_at = self.clock()
+        access_token = f'bench-access-token-{self.refreshes}'
+        refresh_token = f'bench-refresh-token-{self.refreshes}'
+        login = self.token_logins.pop(form.get('refresh_token'), None)
+        if login is not None:
+            self.token_logins[access_token] = self.token_logins[refresh_token] = login
+        return web.json_response({
+            'access_token': access_token,
+            'refresh_token': refresh_token,
+            'expires_in': self.expires_in,
+            'token_type': 'bearer'
+        })
+
+    def exchange(self, form):
+        self.exchanges += 1
+        grant = self.codes.pop(form.get('code'), None)
+        if grant is None or grant[1] != form.get('redirect_uri'):
+            return web.json_response({'status': 400, 'message': 'Invalid authorization code'}, status=400)
+        login, _, scopes = grant
+        access_token = f'bench-access-{login}-{self.exchanges}'
+        refresh_token = f'bench-refresh-{login}-{self.exchanges}'
+        self.token_logins[access_token] = self.token_logins[refresh_token] = login
+        return web.json_response({
+            'access_token': access_token,
+            'refresh_token': refresh_token,
+            'expires_in': self.expires_in,
+            'scope': scopes,
+            'token_type': 'bearer'
+        })
+
+    async def users(self, request):
+        self.requests += 1
+        self.user_lookups += 1
+        await asyncio.sleep(self.delay)
+        logins = request.query.getall('login', [])
+        # Logins starting with "ghost" don't exist
+        return web.json_response({'data': [
+            {'id': str(zlib.crc32(login.encode()) % 10 ** 9), 'login': login, 'display_name': login}
+            for login in logins if not login.startswith('ghost')
+        ]})
+
+    async def streams(self, request):
+        self.requests += 1
+        self.stream_lookups += 1
+        await asyncio.sleep(self.delay)
+        logins = request.query.getall('user_login', [])
+        # Every channel is live, having started an hour before the stub
+        return web.json_response({'data': [
+            {'user_login': login, 'type': 'live', 'viewer_count': 100,
+             'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() - 3600))}
+            for login in logins
+        ]})
+
+    async def delete_message(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        self.moderation_actions.append(('delete', request.query.get('message_id')))
+        return web.Response(status=204)
+
+    async def ban(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        data = (await request.json())['data']
+        self.moderation_actions.append(('timeout' if data.get('duration') else 'ban', data.get('user_id')))
+        return web.json_response({'data': [{'user_id': data.get('user_id')}]})
+
+    async def whisper(self, request):
+        self.requests += 1
+        if self.whisper_limit:
+            count, per = self.whisper_limit
+            now = time.time()
+            while self._whisper_times and self._whisper_times[0] + per <= now:
+                self._whisper_times.popleft()
+            if len(self._whisper_times) >= count:
+                self.rejected_whispers += 1
+                reset = self._whisper_times[0] + per
+                return web.json_response({'status': 429, 'message': 'Too Many Requests'}, status=429,
+                                         headers={'Ratelimit-Reset': f'{reset:.3f}'})
+            self._whisper_times.append(now)
+        await asyncio.sleep(self.delay)
+        body = await request.json()
+        self.whispers.append((request.query.get('to_user_id'), body.get('message')))
+        return web.Response(status=204)
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f'http://{host}:{port}'
+        if self.eventsub is not None:
+            self.eventsub.started(self.base_url)
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+def start_in_thread(server):
+    """Run a stub server on its own loop in a daemon thread and return its base URL.
+
+    Needed when the code under test blocks its own event loop, which would
+    otherwise also stall a stub served from that loop.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(server.start(), loop).result()
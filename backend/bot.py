@@ -1,22 +1,56 @@
 import os
+import time
 import logging
-import requests
-from openai import OpenAI
 from twitchio.ext import commands
-from dotenv import set_key, load_dotenv
+from dotenv import load_dotenv
 import asyncio
+from http_client import HttpClient, HELIX_URL
+from command_router import CommandRouter
+from bot_logging import sampler
+from listener_engine import ListenerEngine
+from send_queue import SendQueue, PRIORITY_COMMAND
+from cooldowns import CooldownManager
+from channel_manager import ChannelManager, SHARD_SIZE
+from token_manager import TokenManager
+from whispers import UserCache, WhisperQueue
+from helix_cache import HelixCache
+from llm import LLMService
+from moderation import ModerationEngine, ActionBatcher, load_rules
+from metrics import Registry, LagMonitor, MetricsServer
+from profiler import Profiler, SLOW_CALL_MS, BLOCK_MS
+from store import StateStore
+from eventsub import EventSubClient, DEFAULT_TOPICS
+from analytics import ChatAnalytics, WINDOW
+from chatters import ChatterRegistry, MAX_CHATTERS, SELF
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Logging is configured by main.py through bot_logging.setup_logging
 logger = logging.getLogger('twitch_bot')
 
-load_dotenv()
+load_dotenv(os.getenv('ENV_FILE'))
+
+class QueuedContext(commands.Context):
+    """Command context whose send/reply go through the bot's send queue"""
+    
+    async def send(self, content, priority=PRIORITY_COMMAND):
+        return await self.bot.send_queue.send(self.channel.name, content, priority, key=self._key(content))
+    
+    async def reply(self, content, priority=PRIORITY_COMMAND):
+        return await self.bot.send_queue.send(self.channel.name, content, priority,
+                                              reply_to=self.message.id, key=self._key(content))
+    
+    def _key(self, content):
+        # A command run again for the same message (say, replayed after a failover) does not post twice
+        return (self.message.id, content) if self.message.id else None
 
 class CustomBot(commands.Bot):
-    def __init__(self, auth_creds):
+    def __init__(self, auth_creds, channels=None, token_source=None, token_manager=None):
+        # channels overrides CHANNEL_NAME; token_source is an async callable used
+        # instead of refreshing the token here (supervisor workers pass one);
+        # token_manager shares twitch_auth's token state
+        
         # Get auth credentials
         self.bot_username = auth_creds['bot_username']
+        self._bot_login = self.bot_username.lower()
         self.channel_name = auth_creds['channel_name']
         self.client_id = auth_creds['client_id']
         self.client_secret = auth_creds['client_secret']
@@ -27,65 +61,216 @@ class CustomBot(commands.Bot):
         logger.info(f"Initializing bot with username: {self.bot_username}")
         logger.info(f"Connecting to channel: {self.channel_name}")
         
-        # Initialize message listeners list
+        # Initialize message listeners list, run off the read loop by the engine
         self.message_listeners = []
+        self.listener_engine = ListenerEngine(self.message_listeners)
+        
+        # Opt-in wall/CPU timing of commands and listeners: PROFILE_COMMANDS=1 or !perf on
+        self.profiler = Profiler(slow_threshold=float(os.getenv('PERF_SLOW_MS', SLOW_CALL_MS)) / 1000,
+                                 block_threshold=float(os.getenv('PERF_BLOCK_MS', BLOCK_MS)) / 1000)
+        self.listener_engine.profiler = self.profiler
+        
+        # EventSub notifications go to their own listeners, run by the same kind of engine
+        self.event_listeners = []
+        self.event_engine = ListenerEngine(self.event_listeners)
+        self.event_engine.profiler = self.profiler
+        
+        # Chatters by user ID with their roles read from the tags once; the bot's own account is marked SELF
+        self.chatters = ChatterRegistry(maxsize=int(os.getenv('CHATTER_CACHE_SIZE', MAX_CHATTERS)),
+                                        self_login=self.bot_username)
         
         # Add whisper capability
         self.can_send_whispers = True
         
-        # Initialize token refresh task
+        # Shared pooled HTTP client for all Helix/OAuth calls
+        self.http_client = HttpClient()
+        
+        # Initialize token refresh task; OAuth calls go through the shared pool too, also for a
+        # token manager passed in, whose own client only served the checks made before the loop ran
         self.token_check_task = None
+        self.token_source = token_source
+        if token_manager is None:
+            self.tokens = TokenManager.from_credentials(auth_creds, http_client=self.http_client)
+        else:
+            self.tokens = token_manager
+            self.tokens.use_http_client(self.http_client)
+        self.tokens.subscribe(self.set_tokens)
+        
+        # Every outbound chat message is paced through this queue
+        self.send_queue = SendQueue(self._send_raw, is_mod=self._is_mod_in)
+        
+        # Whispers go out in the background; recipients given by login are resolved in batches
+        self.users = UserCache(self._fetch_user_ids)
+        self.whispers = WhisperQueue(self._post_whisper, resolve=self.users.resolve)
+        
+        # Cached, coalesced Helix GETs for commands and listeners: await bot.helix.get('streams', {...})
+        self.helix = HelixCache(self._helix_get)
         
-        # Call the parent constructor to initialize the bot
+        # Async OpenAI completions for commands: await bot.llm.reply(ctx, prompt)
+        self.llm = LLMService()
+        
+        # Follows, raids, subs and redemptions over an EventSub WebSocket: with EVENTSUB=1 every
+        # channel is subscribed to EVENTSUB_TOPICS once the bot is ready (see subscribe_events)
+        self.eventsub = EventSubClient(self._eventsub_request, self.http_client.ws_connect,
+                                       self.event_engine.dispatch)
+        self.eventsub_topics = [topic.strip() for topic in
+                                os.getenv('EVENTSUB_TOPICS', ','.join(DEFAULT_TOPICS)).split(',') if topic.strip()]
+        
+        # Persistent state for command modules: points = bot.store.namespace('points')
+        self.store = StateStore()
+        
+        # Counters and histograms for the hot paths; set up before any listener is configured
+        self.metrics = Registry()
+        self._setup_metrics()
+        
+        # MODERATION_RULES points at banned terms/patterns checked on every message;
+        # deletions and timeouts go out through Helix in small batches
+        self.moderation = None
+        if os.getenv('MODERATION_RULES'):
+            self.moderation = ModerationEngine(load_rules(os.getenv('MODERATION_RULES')),
+                                               ActionBatcher(self._moderate), chatters=self.chatters)
+            self.add_message_listener(self.moderation)
+        
+        # CHAT_ANALYTICS=1 keeps sliding-window chat statistics (rates, top words/emotes/chatters,
+        # raid-like spikes) for !stats and !top; CHAT_ANALYTICS_WINDOW sets the window in seconds
+        self.analytics = None
+        if os.getenv('CHAT_ANALYTICS', '').lower() in ('1', 'true', 'yes'):
+            self.analytics = ChatAnalytics(window=float(os.getenv('CHAT_ANALYTICS_WINDOW', WINDOW)))
+            self.add_message_listener(self.analytics)
+        
+        # Per-command cooldowns, declared with commands.cooldown
+        self.cooldowns = CooldownManager()
+        
+        # Command name/alias index, rebuilt once load_commands finishes
+        self.command_router = CommandRouter(prefix='!')
+        
+        # Call the parent constructor to initialize the bot; channels are joined by the channel manager
         super().__init__(
             token=self._access_token,
             prefix='!',
-            initial_channels=[self.channel_name]
+            initial_channels=[]
         )
         
-        # Start token refresh task
-        self.token_check_task = self.loop.create_task(self.token_check_loop())
+        # CHANNEL_NAME may list several channels separated by commas;
+        # CHANNELS_CONFIG points at a JSON file with per-channel command lists;
+        # IRC_STANDBY=1 keeps a hot standby connection per shard for instant failover
+        self.channels = ChannelManager(self, shard_size=int(os.getenv('CHANNELS_PER_SHARD', SHARD_SIZE)),
+                                       standby=os.getenv('IRC_STANDBY', '').lower() in ('1', 'true', 'yes'))
+        self.channels.attach_primary()
+        self.channels.join(*(channels if channels is not None else (self.channel_name or '').split(',')))
+        if os.getenv('CHANNELS_CONFIG'):
+            # Given an explicit channel list, only those channels are taken from the file
+            self.channels.load_config(os.getenv('CHANNELS_CONFIG'), names=channels)
         
-    async def token_check_loop(self):
-        """Periodically check and refresh token if needed"""
-        while True:
-            try:
-                await self.validate_token()
-                # Check every 30 minutes
-                await asyncio.sleep(1800)
-            except Exception as e:
-                logger.error(f"Error in token check loop: {str(e)}")
-                # If there's an error, wait 5 minutes before retrying
-                await asyncio.sleep(300)
+        # Refresh the token shortly before it expires, unless someone else owns the token
+        if self.token_source is None:
+            self.token_check_task = self.tokens.start(self.loop)
+        
+        # Event-loop lag sampling, and /metrics on METRICS_PORT when it is set
+        self.lag_monitor.start(self.loop)
+        if os.getenv('PROFILE_COMMANDS', '').lower() in ('1', 'true', 'yes'):
+            self.profiler.enable(self.loop)
+        self.metrics_server = None
+        if os.getenv('METRICS_PORT'):
+            self.metrics_server = MetricsServer(self.metrics)
+            self.loop.create_task(self._start_metrics_server())
+
+    def _setup_metrics(self):
+        """Register the bot's metrics; hot paths keep direct references to their children"""
+        metrics = self.metrics
+        self._messages_received = metrics.counter(
+            'messages_received_total', 'Chat messages received').labels()
+        self._commands_dispatched = metrics.counter(
+            'commands_total', 'Commands dispatched, by command', ['command'])
+        self._command_errors = metrics.counter(
+            'command_errors_total', 'Commands that raised, by command', ['command'])
+        self._command_cooldowns = metrics.counter(
+            'command_cooldowns_total', 'Command uses refused by a cooldown, by command', ['command'])
+        self._command_seconds = metrics.histogram(
+            'command_seconds', 'Time spent running commands').labels()
+        self.listener_engine.latency = self.event_engine.latency = metrics.histogram(
+            'listener_seconds', 'Time spent in message and event listener calls').labels()
+        metrics.counter('listener_dropped_total', 'Messages dropped by full listener queues',
+                        function=lambda: sum(stats['dropped'] for stats in self.listener_engine.stats().values()))
+        metrics.counter('listener_errors_total', 'Listener calls that raised or timed out',
+                        function=lambda: sum(stats['errors'] + stats['timeouts']
+                                             for stats in self.listener_engine.stats().values()))
+        metrics.gauge('send_queue_depth', 'Chat messages waiting in the send queue',
+                      function=lambda: self.send_queue.depth)
+        metrics.counter('send_queue_messages_total', 'Chat messages leaving the send queue, by result', ['result'],
+                        function=lambda: {'sent': self.send_queue.sent, 'failed': self.send_queue.failed,
+                                          'retried': self.send_queue.retried,
+                                          'dropped': self.send_queue.dropped,
+                                          'coalesced': self.send_queue.coalesced,
+                                          'deduplicated': self.send_queue.deduplicated})
+        metrics.gauge('whisper_queue_depth', 'Whispers waiting to be delivered',
+                      function=lambda: self.whispers.depth)
+        metrics.counter('whispers_total', 'Whispers by result', ['result'],
+                        function=lambda: {'sent': self.whispers.sent, 'failed': self.whispers.failed,
+                                          'dropped': self.whispers.dropped,
+                                          'rate_limited': self.whispers.rate_limited})
+        self.whispers.latency = metrics.histogram(
+            'whisper_delivery_seconds', 'Time from send_whisper to delivery',
+            buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)).labels()
+        self._helix_seconds = metrics.histogram(
+            'helix_request_seconds', 'Helix request latency').labels()
+        self._helix_responses = metrics.counter(
+            'helix_responses_total', 'Helix responses by status code', ['status'])
+        metrics.counter('helix_cache_lookups_total', 'Helix cache lookups by result', ['result'],
+                        function=lambda: {'hit': self.helix.hits, 'stale': self.helix.stale_hits,
+                                          'miss': self.helix.misses})
+        metrics.counter('eventsub_messages_total', 'EventSub notifications by outcome', ['result'],
+                        function=lambda: {'dispatched': self.eventsub.notifications,
+                                          'duplicate': self.eventsub.duplicates,
+                                          'stale': self.eventsub.stale})
+        metrics.counter('eventsub_reconnects_total', 'EventSub socket changes by kind', ['kind'],
+                        function=lambda: {'reconnect': self.eventsub.reconnects,
+                                          'migration': self.eventsub.migrations})
+        metrics.counter('token_validations_total', 'OAuth token validations',
+                        function=lambda: self.tokens.validations)
+        metrics.counter('token_refreshes_total', 'OAuth token refreshes',
+                        function=lambda: self.tokens.refreshes)
+        metrics.gauge('token_expires_in_seconds', 'Seconds until the OAuth token expires (-1 if unknown)',
+                      function=lambda: self.tokens.expires_in() if self.tokens.expires_at is not None else -1)
+        metrics.counter('slow_calls_total', 'Profiled command and listener calls over the slow threshold',
+                        function=lambda: sum(stats.slow for stats in self.profiler.stats.values()))
+        metrics.counter('event_loop_stalls_total', 'Times the profiler watchdog saw the event loop blocked',
+                        function=lambda: self.profiler.stall_count)
+        metrics.gauge('state_store_pending', 'State store writes waiting for the next flush',
+                      function=lambda: self.store.pending)
+        metrics.counter('state_store_rows_written_total', 'State store rows written to disk',
+                        function=lambda: self.store.rows_written)
+        metrics.counter('chat_spikes_total', 'Raid-like jumps in chat rate seen by chat analytics',
+                        function=lambda: self.analytics.spikes if self.analytics is not None else 0)
+        metrics.gauge('chatters_cached', 'Chatters held by the chatter registry',
+                      function=lambda: len(self.chatters))
+        metrics.gauge('channels_joined', 'Channels currently joined',
+                      function=lambda: self.channels.stats()['joined'])
+        metrics.counter('irc_reconnects_total', 'IRC connections lost, and shards failed over to a standby',
+                        ['kind'], function=lambda: {'reconnect': self.channels.reconnects,
+                                                    'failover': self.channels.failovers})
+        metrics.counter('irc_replayed_total', 'Chat lines and sends replayed after failovers', ['direction'],
+                        function=lambda: {'received': self.channels.replayed,
+                                          'sent': self.channels.replayed_sends})
+        self.lag_monitor = LagMonitor(
+            metrics.histogram('event_loop_lag_seconds', 'How late the event loop wakes a sleeping task').labels(),
+            metrics.gauge('event_loop_lag_last_seconds', 'Most recent event loop lag sample').labels())
+
+    async def _start_metrics_server(self):
+        try:
+            await self.metrics_server.start()
+        except OSError as e:
+            logger.error(f"Could not serve metrics on port {self.metrics_server.port}: {str(e)}")
 
     async def validate_token(self):
         """Validate the current token and refresh if needed"""
-        try:
-            headers = {
-                'Authorization': f'Bearer {self._access_token}',
-                'Client-Id': self.client_id
-            }
-            response = requests.get('https://id.twitch.tv/oauth2/validate', headers=headers)
-            
-            if response.status_code == 200:
-                data = response.json()
-                logger.info(f"Token validated successfully. User: {data.get('login')}, expires in: {data.get('expires_in')} seconds")
-                # If token expires in less than 1 hour, refresh it
-                if data.get('expires_in', 0) < 3600:
-                    logger.info("Token is close to expiry, refreshing...")
-                    success = await self.refresh_oauth_token()
-                    if success:
-                        # Update the token in the bot's connection
-                        self._connection.token = self._access_token
-            else:
-                logger.warning(f"Token validation failed: {response.status_code}")
-                success = await self.refresh_oauth_token()
-                if success:
-                    # Update the token in the bot's connection
-                    self._connection.token = self._access_token
-        except Exception as e:
-            logger.error(f"Error validating token: {str(e)}")
-            await self.refresh_oauth_token()
+        if self.token_source is None:
+            return await self.tokens.ensure_valid()
+        # Expiry is the token owner's concern; only a rejected token is ours
+        valid = await self.tokens.validate()
+        if valid is False:
+            return await self.refresh_oauth_token()
+        return valid is not None
 
     async def event_ready(self):
         """Called once when the bot goes online."""
@@ -94,116 +279,267 @@ class CustomBot(commands.Bot):
         
         # Validate token on startup
         await self.validate_token()
+        if self.user_id:
+            self.chatters.self_id = str(self.user_id)
+        
+        if os.getenv('EVENTSUB', '').lower() in ('1', 'true', 'yes'):
+            await self.subscribe_events(*self.channels.channels)
 
     async def event_message(self, message):
-        """Called once when the bot goes online."""
-        # Add debug logging
-        logger.info(f"Received message: {message.content}")
-        logger.info(f"Message author: {message.author.name if message.author else 'None'}")
-        logger.info(f"Message tags: {message.tags}")
+        """Called for every chat message the bot receives."""
+        self._messages_received.inc()
+        
+        # Hot path: lazy formatting, DEBUG only, sampled under the "chat" category
+        if logger.isEnabledFor(logging.DEBUG) and sampler.sample('chat'):
+            logger.debug("Received message from %s: %s",
+                         message.author.name if message.author else None, message.content)
+            logger.debug("Message tags: %s", message.tags)
         
         # Ignore messages from the bot itself
-        if message.author is None or message.author.name.lower() == self.bot_username.lower():
+        chatter = self.chatters.observe(message)
+        if chatter is None or chatter.roles & SELF:
             return
             
-        # Process commands - check if message contains command anywhere
-        if '!' in message.content:
+        # Process commands - only a command token at the start of the message dispatches
+        command = self.command_router.match(message.content, message.tags)
+        if command is not None and getattr(command, 'lazy', False):
+            # First use of a lazily discovered command imports its module
+            command = command.resolve()
+        # Whispers have no channel: no channel configuration applies and channel-scoped cooldowns share one key
+        channel = message.channel.name if message.channel is not None else None
+        if command and channel is not None and not self.channels.allows(channel, command.name):
+            # Disabled in this channel's configuration
+            command = None
+        if command:
             try:
-                # Extract command name
-                parts = message.content.split('!')
-                if len(parts) > 1:
-                    command_name = parts[1].strip().split()[0]  # Get first word after !
-                    logger.info(f"Found command: {command_name}")
-                    
-                    # Get command from commands dict if it exists
-                    command = self.commands.get(command_name.lower())
-                    if command:
-                        logger.info(f"Executing command: {command_name}")
+                retry_after = self.cooldowns.check(command.name, channel, chatter.id)
+                if retry_after:
+                    self._command_cooldowns.labels(command.name).inc()
+                    logger.debug("Command %s on cooldown for %s (%.1fs left)",
+                                 command.name, message.author.name, retry_after)
+                else:
+                    logger.debug("Executing command: %s", command.name)
+                    self._commands_dispatched.labels(command.name).inc()
+                    started = time.perf_counter()
+                    try:
                         ctx = await self.get_context(message)
-                        await command(ctx)
-                    else:
-                        logger.info(f"Command not found: {command_name}")
+                        if self.profiler.enabled:
+                            await self.profiler.run(f"!{command.name}", command(ctx))
+                        else:
+                            await command(ctx)
+                    finally:
+                        self._command_seconds.observe(time.perf_counter() - started)
             except Exception as e:
+                self._command_errors.labels(command.name).inc()
                 logger.error(f"Error processing command: {str(e)}")
                 logger.exception("Full traceback:")
         
-        # Call all registered message listeners
-        for listener in self.message_listeners:
-            try:
-                await listener(message)
-            except Exception as e:
-                logger.error(f"Error in message listener: {str(e)}")
+        # Hand the message to all registered listeners without waiting on them
+        self.listener_engine.dispatch(message)
+
+    async def get_context(self, message, *, cls=None):
+        """Build command contexts whose replies go through the send queue"""
+        return await super().get_context(message, cls=cls or QueuedContext)
+
+    async def send_message(self, channel, content, priority=PRIORITY_COMMAND, wait=False):
+        """Queue a chat message to a channel, respecting Twitch rate limits"""
+        return await self.send_queue.send(channel, content, priority, wait=wait)
+
+    async def _send_raw(self, channel, content, reply_to=None, nonce=None):
+        """Write a PRIVMSG to the IRC connection; only the send queue calls this"""
+        await self.channels.connection_for(channel).privmsg(channel, content, reply_to, nonce)
+
+    def _is_mod_in(self, channel):
+        """Whether the bot gets the moderator rate limit in a channel"""
+        if channel.lower() == self._bot_login:
+            return True
+        chan = self.get_channel(channel)
+        return chan is not None and chan._bot_is_mod()
+
+    def get_channel(self, name):
+        """Look a channel up on whichever IRC connection joined it"""
+        return self.channels.get_channel(name)
+
+    async def join_channels(self, channels):
+        """Join channels at runtime through the channel manager's rate-limited queue"""
+        self.channels.join(*channels)
+
+    async def part_channels(self, channels):
+        """Leave channels at runtime"""
+        await self.channels.part(*channels)
+
+    def add_message_listener(self, listener, **options):
+        """Register a message listener.
+
+        Options (concurrency, timeout, queue_size, policy, key) are passed to
+        ListenerEngine.configure; listeners appended to message_listeners
+        directly run with the defaults.
+        """
+        if listener not in self.message_listeners:
+            self.message_listeners.append(listener)
+        if options:
+            self.listener_engine.configure(listener, **options)
+
+    def remove_message_listener(self, listener):
+        """Unregister a message listener; calls already running are left to finish"""
+        if listener in self.message_listeners:
+            self.message_listeners.remove(listener)
+        self.listener_engine.retire(listener)
+
+    def add_event_listener(self, listener, **options):
+        """Register an EventSub listener, called with an EventSubEvent for every notification.
+
+        Options are the same as for add_message_listener.
+        """
+        if listener not in self.event_listeners:
+            self.event_listeners.append(listener)
+        if options:
+            self.event_engine.configure(listener, **options)
+
+    def remove_event_listener(self, listener):
+        """Unregister an EventSub listener; calls already running are left to finish"""
+        if listener in self.event_listeners:
+            self.event_listeners.remove(listener)
+        self.event_engine.retire(listener)
+
+    async def subscribe_events(self, *channels, topics=None):
+        """Subscribe channels (by login) to EventSub topics, EVENTSUB_TOPICS by default"""
+        logins = [login.lower().lstrip('#') for login in channels]
+        bot_id = self.tokens.user_id or await self.users.resolve(self.bot_username)
+        broadcaster_ids = await asyncio.gather(*(self.users.resolve(login) for login in logins))
+        for login, broadcaster_id in zip(logins, broadcaster_ids):
+            if broadcaster_id is None:
+                logger.warning(f"Cannot subscribe to events of unknown channel {login}")
+                continue
+            self.eventsub.add_channel(broadcaster_id, bot_id, topics or self.eventsub_topics)
+
+    async def _eventsub_request(self, method, path, **kwargs):
+        return await self._helix(method, f'{HELIX_URL}/{path}', **kwargs)
+
+    def add_command(self, command):
+        """Register a command and index it for dispatch"""
+        super().add_command(command)
+        self.command_router.add(command)
+        for rate, per, scope in getattr(command._callback, '__rate_limits__', ()):
+            self.cooldowns.add(command.name, rate, per, scope)
+
+    def remove_command(self, name):
+        """Unregister a command and drop it from the dispatch index"""
+        command = self.get_command(name)
+        super().remove_command(name)
+        if command:
+            self.command_router.remove(command)
+            self.cooldowns.remove(command.name)
 
     async def refresh_oauth_token(self):
         """Refresh the OAuth token using the refresh token"""
-        try:
-            refresh_url = "https://id.twitch.tv/oauth2/token"
-            payload = {
-                'client_id': self.client_id,
-                'client_secret': self.client_secret,
-                'refresh_token': self._refresh_token,
-                'grant_type': 'refresh_token'
-            }
-            
-            response = requests.post(refresh_url, data=payload)
-            response.raise_for_status()
-            token_data = response.json()
-            
-            # Update the tokens
-            self._access_token = token_data['access_token']
-            self._refresh_token = token_data['refresh_token']
-            
-            # Update the .env file
-            dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
-            set_key(dotenv_path, 'ACCESS_TOKEN', self._access_token)
-            set_key(dotenv_path, 'REFRESH_TOKEN', self._refresh_token)
-            
-            # Update the token in the bot
-            self._connection.token = self._access_token
-            
-            logger.info("OAuth token refreshed successfully")
+        if self.token_source is not None:
+            return await self.token_source()
+        # Concurrent callers (say a 401 racing the scheduled refresh) share one request
+        return await self.tokens.refresh()
+
+    def set_tokens(self, access_token, refresh_token):
+        """Use new OAuth tokens for API calls and every IRC connection"""
+        self._access_token = access_token
+        self._refresh_token = refresh_token
+        self.tokens.access_token = access_token
+        self.tokens.refresh_token = refresh_token
+        self._http.token = access_token
+        self.channels.set_token(access_token)
+
+    async def send_whisper(self, user, message, wait=True):
+        """Send a whisper (private message) to a user.
+        
+        user is a chatter with .id/.name or a login name. The whisper is queued
+        within Twitch's whisper limits; with wait=False this returns at once.
+        """
+        if isinstance(user, str):
+            future = self.whispers.submit(user, message)
+        else:
+            future = self.whispers.submit(user.name, message, user_id=getattr(user, 'id', None))
+        if not wait:
             return True
-        except Exception as e:
-            logger.error(f"Failed to refresh OAuth token: {str(e)}")
-            return False
+        delivered = await future
+        if delivered:
+            logger.info(f"Successfully sent whisper to {user if isinstance(user, str) else user.name}")
+        return delivered
 
-    async def send_whisper(self, user, message):
-        """Send a whisper (private message) to a user"""
-        try:
-            url = f'https://api.twitch.tv/helix/whispers'
-            
-            # Добавляем параметры from_user_id и to_user_id в URL
-            params = {
-                'from_user_id': self.user_id,
-                'to_user_id': user.id
-            }
-            
-            headers = {
-                'Authorization': f'Bearer {self._access_token}',
-                'Client-Id': self.client_id,
-                'Content-Type': 'application/json'
-            }
-            
-            # Отправляем сообщение в теле запроса как JSON
-            data = {
-                'message': message
-            }
-            
-            response = requests.post(
-                url,
-                params=params,
-                headers=headers,
-                json=data
-            )
-            
-            if response.status_code == 204:
-                logger.info(f"Successfully sent whisper to {user.name}")
-                return True
-            else:
-                logger.error(f"Failed to send whisper: {response.status_code}")
-                logger.error(f"Response: {response.text}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error sending whisper: {str(e)}")
-            return False 
\ No newline at end of file
+    def _helix_headers(self):
+        return {
+            'Authorization': f'Bearer {self._access_token}',
+            'Client-Id': self.client_id
+        }
+
+    async def _helix(self, method, url, **kwargs):
+        """Helix request that refreshes a rejected token once and retries"""
+        for attempt in range(2):
+            response = await self.http_client.request(method, url, headers=self._helix_headers(), **kwargs)
+            self._helix_seconds.observe(response.elapsed)
+            self._helix_responses.labels(response.status_code).inc()
+            # A token rejected before its scheduled refresh is refreshed once, shared with any refresh already running
+            if response.status_code != 401 or attempt or not await self.refresh_oauth_token():
+                return response
+
+    async def _helix_get(self, path, params):
+        """GET a Helix endpoint for the response cache and return its JSON body"""
+        response = await self._helix('GET', f'{HELIX_URL}/{path}', params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def _post_whisper(self, user_id, message):
+        """POST one whisper; only the whisper queue calls this and it handles 429s itself"""
+        # Добавляем параметры from_user_id и to_user_id в URL
+        params = {
+            'from_user_id': self.user_id,
+            'to_user_id': user_id
+        }
+        # Отправляем сообщение в теле запроса как JSON
+        return await self._helix('POST', f'{HELIX_URL}/whispers', params=params,
+                                 json={'message': message}, retries=0)
+
+    async def _moderate(self, action):
+        """Carry out one moderation action through Helix; only the action batcher calls this"""
+        params = {'broadcaster_id': action.broadcaster_id, 'moderator_id': self.user_id}
+        if action.action == 'delete':
+            params['message_id'] = action.message_id
+            return await self._helix('DELETE', f'{HELIX_URL}/moderation/chat', params=params)
+        data = {'user_id': action.user_id, 'reason': action.reason}
+        if action.action == 'timeout':
+            data['duration'] = action.duration
+        return await self._helix('POST', f'{HELIX_URL}/moderation/bans', params=params, json={'data': data})
+
+    async def _fetch_user_ids(self, logins):
+        """Look up {login: user id} for up to 100 logins with one GET /users"""
+        response = await self._helix('GET', f'{HELIX_URL}/users', params=[('login', login) for login in logins])
+        response.raise_for_status()
+        return {user['login']: user['id'] for user in response.json().get('data', [])}
+
+    async def close(self):
+        """Stop listeners and close the HTTP client pool along with the IRC connection"""
+        if self.token_check_task:
+            self.token_check_task.cancel()
+        self.lag_monitor.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.tokens.close()
+        await self.eventsub.close()
+        await self.listener_engine.close()
+        await self.event_engine.close()
+        if self.profiler.enabled:
+            try:
+                logger.info(f"Profile written to {self.profiler.dump()}")
+            except OSError as e:
+                logger.error(f"Could not write profile: {str(e)}")
+            self.profiler.disable()
+        await self.store.close()
+        await self.send_queue.close()
+        await self.whispers.close()
+        await self.helix.close()
+        await self.llm.close()
+        if self.moderation is not None:
+            await self.moderation.actions.close()
+        if self.analytics is not None:
+            await self.analytics.close()
+        await self.http_client.close()
+        await self.channels.close()
+        await super().close()
@@ -0,0 +1,111 @@
+import os
+import queue
+import atexit
+import logging
+import itertools
+import logging.handlers
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class LogSampler:
+    """Per-category 1-in-N sampling for hot-path log events.
+
+    A rate of 1 logs every event, N logs every Nth one and 0 disables the
+    category. Categories without a configured rate are always logged.
+    """
+
+    def __init__(self, rates=None):
+        self._rates = {}
+        self._counters = {}
+        for category, every in (rates or {}).items():
+            self.set_rate(category, every)
+
+    def set_rate(self, category, every):
+        self._rates[category] = max(0, int(every))
+        self._counters[category] = itertools.count()
+
+    def sample(self, category):
+        """Return True if this event in the category should be logged"""
+        every = self._rates.get(category, 1)
+        if every == 1:
+            return True
+        if every == 0:
+            return False
+        return next(self._counters[category]) % every == 0
+
+
+# Shared sampler used by the bot's hot paths
+sampler = LogSampler()
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves most formatting to the listener thread.
+
+    Like the stock handler it merges msg % args before enqueueing, since the
+    arguments may change before the listener gets to them. Unlike it, the
+    format string, timestamps and tracebacks are applied on the listener
+    thread rather than the event loop.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_listener = None
+
+
+def setup_logging(level=None, log_file=None, sample_rates=None, console=True):
+    """Route all logging through a queue drained by a background thread.
+
+    Defaults come from LOG_LEVEL, LOG_FILE and LOG_SAMPLE_<CATEGORY> (e.g.
+    LOG_SAMPLE_CHAT=100 logs one chat message in a hundred). Existing root
+    handlers are replaced so this can run after modules that already called
+    logging.basicConfig.
+    """
+    global _listener
+    level = level or os.getenv('LOG_LEVEL', 'INFO')
+    log_file = log_file or os.getenv('LOG_FILE')
+
+    rates = {}
+    for key, value in os.environ.items():
+        if key.startswith('LOG_SAMPLE_'):
+            rates[key[len('LOG_SAMPLE_'):].lower()] = value
+    rates.update(sample_rates or {})
+    for category, every in rates.items():
+        sampler.set_rate(category, every)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()] if console else []
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    stop_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(_DeferredQueueHandler(queue.SimpleQueue()))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(root.handlers[0].queue, *handlers,
+                                               respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
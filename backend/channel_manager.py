@@ -0,0 +1,715 @@
+import os
+import re
+import time
+import json
+import random
+import asyncio
+import logging
+import aiohttp
+from functools import partial
+from collections import deque, OrderedDict
+import twitchio
+from twitchio import websocket
+from twitchio.channel import Channel
+from send_queue import TokenBucket
+from dedup import SeenSet
+
+logger = logging.getLogger('twitch_bot')
+
+# ShardConnection overrides private WSConnection internals (_keep_alive, _process_data,
+# _background_tasks, _cache_add) as they are in this release; requirements.txt pins it
+TWITCHIO_VERSION = '2.10.0'
+if twitchio.__version__ != TWITCHIO_VERSION:
+    logger.warning(f"twitchio {twitchio.__version__} is installed but channel_manager was written against "
+                   f"{TWITCHIO_VERSION}; reconnects and failover may misbehave")
+
+# The IRC endpoint can be overridden to point the bot at a local fake server
+IRC_URL = os.getenv('TWITCH_IRC_URL')
+if IRC_URL:
+    websocket.HOST = IRC_URL
+
+# Twitch JOIN limit for normal accounts (verified bots get 2000 per 10s)
+JOIN_LIMIT = (20, 10.0)
+# Channels per IRC connection before another one is opened
+SHARD_SIZE = 100
+# Reconnect backoff (seconds, doubling up to the max); a connection that had stayed up
+# STABLE_AFTER seconds reconnects at once and starts the backoff over
+RECONNECT_DELAY = (0.5, 30.0)
+STABLE_AFTER = 5.0
+# Chat lines a standby connection holds for replay should its shard fail over to it
+BACKLOG_SIZE = 2000
+# An active connection that has not handled chat its standby got this many seconds ago is
+# taken for dead and failed over, long before a ping timeout would notice
+STALL_AFTER = 1.0
+# Sends with no echo on the standby yet are written again after a failover if they are
+# this recent (seconds), once echoes still in flight have had REPLAY_GRACE to arrive
+REPLAY_WINDOW = 10.0
+REPLAY_GRACE = 0.3
+# Lines that carry a message id; a standby holds these instead of handling them
+REPLAYABLE = frozenset(('PRIVMSG', 'USERNOTICE'))
+
+
+def normalize(channel):
+    return re.sub('[#]', '', channel).strip().lower()
+
+
+def _command(line):
+    parts = line.split(' ', 3)
+    index = 2 if line.startswith('@') else 1
+    return parts[index] if len(parts) > index else ''
+
+
+def _tag(line, name):
+    """Value of an IRCv3 tag in a raw line, None if absent"""
+    if not line.startswith('@'):
+        return None
+    end = line.find(' ')
+    start = line.find(f';{name}=', 0, end)
+    if start != -1:
+        start += len(name) + 2
+    elif line.startswith(f'@{name}='):
+        start = len(name) + 2
+    else:
+        return None
+    stop = line.find(';', start, end)
+    return line[start:end if stop == -1 else stop]
+
+
+class Backoff:
+    """Exponential backoff with jitter, in place of twitchio's (which waits up to 17 minutes)"""
+
+    def __init__(self, base, maximum):
+        self.base = base
+        self.maximum = maximum
+        self.current = base
+        self.attempts = 0
+
+    def delay(self):
+        # Half-jitter keeps shards and workers that dropped together from reconnecting together
+        wait = random.uniform(self.current / 2, self.current)
+        self.current = min(self.maximum, self.current * 2)
+        self.attempts += 1
+        return wait
+
+    def reset(self):
+        self.current = self.base
+
+
+class ChannelConfig:
+    """Per-channel settings; commands=None enables every command"""
+
+    __slots__ = ('name', 'commands', 'disabled_commands', 'shard', 'joined', 'standby_joined')
+
+    def __init__(self, name, commands=None, disabled_commands=None):
+        self.name = name
+        self.commands = None
+        self.disabled_commands = frozenset()
+        self.shard = None
+        self.joined = False
+        self.standby_joined = False
+        self.update(commands, disabled_commands)
+
+    def update(self, commands=None, disabled_commands=None):
+        if commands is not None:
+            self.commands = frozenset(name.lower() for name in commands)
+        if disabled_commands is not None:
+            self.disabled_commands = frozenset(name.lower() for name in disabled_commands)
+
+    def allows(self, command):
+        command = command.lower()
+        if command in self.disabled_commands:
+            return False
+        return self.commands is None or command in self.commands
+
+
+class ShardConnection(websocket.WSConnection):
+    """IRC connection whose channels are owned by a ChannelManager.
+
+    On every (re)connect it leaves joining to the manager, which rejoins its
+    channels through the shared JOIN rate limit. Only the primary connection
+    reports the bot as ready.
+
+    As a standby it stays logged in and joined but dispatches nothing: chat
+    lines are kept in a short backlog for the manager to replay if the
+    shard fails over to it, and echoes of the bot's own messages confirm
+    the sends of the active connection.
+    """
+
+    def __init__(self, *, manager, primary=False, **kwargs):
+        kwargs['initial_channels'] = []
+        super().__init__(**kwargs)
+        self.manager = manager
+        self.primary = primary
+        self.shard = None
+        # True once PASS/NICK/CAP have gone out on the current socket
+        self.joinable = False
+        self.connecting = False
+        # When the current socket logged in, None while not logged in
+        self.connected_at = None
+        self.backlog = deque(maxlen=BACKLOG_SIZE)
+        # (received at, message id) of backlog lines the active connection may not have handled yet
+        self.unseen = deque(maxlen=BACKLOG_SIZE)
+        self._backoff = Backoff(*RECONNECT_DELAY)
+
+    @property
+    def is_standby(self):
+        return self.manager.standbys[self.shard] is self
+
+    async def _connect(self):
+        self.joinable = False
+        self.connecting = True
+        try:
+            if self.connected_at is not None:
+                # twitchio reconnects as soon as the socket closes; only a connection
+                # that dropped again shortly after logging in waits first
+                uptime = time.monotonic() - self.connected_at
+                self.connected_at = None
+                self.manager.connection_lost(self)
+                if uptime >= STABLE_AFTER:
+                    self._backoff.reset()
+                else:
+                    await asyncio.sleep(self._backoff.delay())
+            await super()._connect()
+        finally:
+            self.connecting = False
+
+    async def authenticate(self, channels):
+        await super().authenticate(())
+        self.joinable = True
+        self.manager.rejoin(self)
+
+    async def _keep_alive(self):
+        if not self.manager.standby:
+            return await super()._keep_alive()
+        # twitchio's loop, except that a standby holds chat lines inline instead of
+        # spending a task on each
+        await self._ws_ready_event.wait()
+        self._ws_ready_event.clear()
+        if not self._last_ping:
+            self._last_ping = time.time()
+        while not self._websocket.closed and not self._reconnect_requested:
+            msg = await self._websocket.receive()
+            if msg.type is aiohttp.WSMsgType.CLOSED:
+                logger.warning(f"IRC shard {self.shard} connection was closed: {msg.extra}")
+                break
+            data = msg.data
+            if not data:
+                continue
+            standby = self.is_standby
+            if not standby:
+                self.dispatch("raw_data", data)
+            for event in data.split("\r\n"):
+                if not event:
+                    continue
+                if standby and _command(event) in REPLAYABLE:
+                    self._hold(event)
+                    continue
+                task = asyncio.create_task(self._process_data(event))
+                task.add_done_callback(partial(self._task_callback, event))
+                self._background_tasks.append(task)
+        self._background_tasks.append(asyncio.create_task(self._connect()))
+
+    def _hold(self, data):
+        manager = self.manager
+        nonce = _tag(data, 'client-nonce')
+        # An echo of one of the active connection's sends confirms it; other lines wait
+        if nonce is not None and manager.confirm(nonce):
+            return
+        self.backlog.append(data)
+        message_id = _tag(data, 'id')
+        if message_id is not None:
+            self.unseen.append((time.monotonic(), message_id))
+            manager.check_stall(self)
+
+    async def _process_data(self, data):
+        manager = self.manager
+        if manager.standby and _command(data) in REPLAYABLE:
+            if self.is_standby:
+                self._hold(data)
+                return
+            message_id = _tag(data, 'id')
+            if message_id is not None and not manager.seen.add(message_id):
+                manager.duplicates += 1
+                return
+        await super()._process_data(data)
+
+    def restart(self):
+        """Give up on the current socket and reconnect, as twitchio does on Twitch's RECONNECT"""
+        if self.connecting:
+            return
+        self.connecting = True
+        self._reconnect_requested = True
+        if self._keeper:
+            self._keeper.cancel()
+        self._background_tasks.append(asyncio.create_task(self._connect()))
+
+    def replay(self, lines):
+        """Handle lines held as a standby, in order and ahead of anything received later"""
+        for line in lines:
+            task = asyncio.create_task(self._process_data(line))
+            task.add_done_callback(partial(self._task_callback, line))
+            self._background_tasks.append(task)
+
+    async def privmsg(self, channel, content, reply_to=None, nonce=None):
+        """Send a chat message tagged with its client-nonce and, for replies, its parent"""
+        tags = []
+        if nonce:
+            tags.append(f'client-nonce={nonce}')
+        if reply_to:
+            tags.append(f'reply-parent-msg-id={reply_to}')
+        await self._websocket.send_str(f"{'@' + ';'.join(tags) + ' ' if tags else ''}PRIVMSG #{channel} :{content}\r\n")
+        # The same local echo twitchio's send and reply produce, once the write went through
+        parent = f'@reply-parent-msg-id={reply_to} ' if reply_to else ''
+        dummy = f"> {parent}:{self.nick}!{self.nick}@{self.nick}.tmi.twitch.tv PRIVMSG(ECHO) #{channel} :{content}\r\n"
+        task = asyncio.create_task(self._process_data(dummy))
+        task.add_done_callback(partial(self._task_callback, dummy))
+        self._background_tasks.append(task)
+        if nonce and self.manager.standby:
+            self.manager.sent(self, nonce, channel, content, reply_to)
+
+    async def _join(self, parsed):
+        if parsed["user"] == self.nick and self.is_standby:
+            # Only echoes seen after the server has joined us count as confirmations
+            self.manager.standby_joined(self, parsed["channel"])
+        await super()._join(parsed)
+
+    async def _code(self, parsed, code):
+        if code == 1:
+            self.connected_at = time.monotonic()
+        if code == 353 and parsed["channel"] != "TWITCHIOFAILURE" and not self._initial_channels:
+            # twitchio only caches NAMES replies for initial channels before 'ready'
+            self._cache_add(parsed)
+            return
+        await super()._code(parsed, code)
+
+    async def disconnect(self):
+        """Close this connection for good, leaving the bot's shared HTTP session open"""
+        for task in (self._keeper, self._task_cleaner, *self._background_tasks):
+            if task and not task.done():
+                task.cancel()
+        self.is_ready.clear()
+        for fut in self._fetch_futures():
+            fut.cancel()
+        if self._websocket:
+            await self._websocket.close()
+
+    def dispatch(self, event, *args, **kwargs):
+        if (event == 'ready' and not self.primary) or self.is_standby:
+            return
+        super().dispatch(event, *args, **kwargs)
+
+
+class ChannelManager:
+    """Joins, parts and shards channels across IRC connections in one process.
+
+    The bot's own connection is shard 0; further shards are opened as
+    channels are added. JOINs from all shards share a single token bucket
+    and go out in comma-separated batches.
+
+    With standby, every shard also keeps a second connection logged in and
+    joined to the same channels (joined after the active connections, at
+    twice the JOIN cost). When the active connection drops, the standby
+    takes over at once: chat it received meanwhile is replayed, skipping
+    messages already handled by id, and sends the standby never saw echoed
+    are written again under the same client-nonce. The dropped connection
+    reconnects with backoff and becomes the new standby.
+    """
+
+    def __init__(self, bot, shard_size=SHARD_SIZE, join_limit=JOIN_LIMIT, batch_size=20, standby=False,
+                 clock=time.monotonic, sleep=asyncio.sleep):
+        self.bot = bot
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+        self.standby = standby
+        self.clock = clock
+        self.sleep = sleep
+        self.join_bucket = TokenBucket(*join_limit)
+        self.channels = {}
+        self.shards = []
+        self.standbys = []
+        self._shard_load = []
+        self._queue = deque()
+        self._queued = set()
+        self._standby_queue = deque()
+        self._standby_queued = set()
+        self._wakeup = None
+        self._worker = None
+        # Message ids handled by active connections, and sends waiting for their echo
+        self.seen = SeenSet(2 * BACKLOG_SIZE)
+        self._unconfirmed = OrderedDict()
+        self.joins_sent = 0
+        self.reconnects = 0
+        self.failovers = 0
+        self.replayed = 0
+        self.replayed_sends = 0
+        self.duplicates = 0
+
+    def attach_primary(self):
+        """Replace the bot's IRC connection with a managed shard 0"""
+        old = self.bot._connection
+        primary = ShardConnection(
+            manager=self,
+            primary=True,
+            client=self.bot,
+            loop=old._loop,
+            token=old._token,
+            heartbeat=old._heartbeat,
+            modes=old.modes,
+            retain_cache=old._retain_cache
+        )
+        primary.shard = 0
+        self.bot._connection = primary
+        self.shards = [primary]
+        self.standbys = [None]
+        self._shard_load = [0]
+        return primary
+
+    def _make_connection(self, index):
+        template = self.shards[0]
+        connection = ShardConnection(
+            manager=self,
+            client=self.bot,
+            loop=template._loop,
+            token=template._token,
+            heartbeat=template._heartbeat,
+            modes=template.modes,
+            retain_cache=template._retain_cache
+        )
+        connection.shard = index
+        return connection
+
+    def _new_shard(self):
+        index = len(self.shards)
+        self.shards.append(self._make_connection(index))
+        self.standbys.append(None)
+        self._shard_load.append(0)
+        # Connected by the join worker once it has channels to join on it
+        return index
+
+    def _connect_shard(self, index):
+        shard = self.shards[index]
+        # Shard 0 is connected by the bot, and twitchio reconnects a connection by itself
+        if index == 0 or shard.connecting:
+            return
+        shard.connecting = True
+        logger.info(f"Opening IRC shard {index}")
+        asyncio.get_running_loop().create_task(shard._connect())
+
+    def _connect_standby(self, index):
+        if not self.standby or self.standbys[index] is not None:
+            return
+        standby = self.standbys[index] = self._make_connection(index)
+        standby.connecting = True
+        logger.info(f"Opening standby IRC connection for shard {index}")
+        asyncio.get_running_loop().create_task(standby._connect())
+
+    def _connections(self):
+        return [connection for connection in (*self.shards, *self.standbys) if connection is not None]
+
+    def _assign_shard(self):
+        for index, load in enumerate(self._shard_load):
+            if load < self.shard_size:
+                return index
+        return self._new_shard()
+
+    def load_config(self, path, names=None):
+        """Read {channel: {"commands": [...], "disabled_commands": [...]}} and join those channels.
+
+        With names, only channels in that collection are joined.
+        """
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if names is not None:
+            names = {normalize(name) for name in names}
+        for name, options in data.items():
+            if names is None or normalize(name) in names:
+                self.join(name, **(options or {}))
+
+    def join(self, *names, commands=None, disabled_commands=None):
+        """Join channels at runtime; optional command enable/disable lists apply to all of them"""
+        for name in names:
+            name = normalize(name)
+            if not name:
+                continue
+            config = self.channels.get(name)
+            if config is None:
+                config = self.channels[name] = ChannelConfig(name)
+            config.update(commands, disabled_commands)
+            if config.shard is None:
+                config.shard = self._assign_shard()
+                self._shard_load[config.shard] += 1
+                self._enqueue(name)
+
+    async def part(self, *names):
+        """Leave channels and forget their configuration"""
+        for name in names:
+            name = normalize(name)
+            config = self.channels.pop(name, None)
+            if config is None:
+                continue
+            self._queued.discard(name)
+            self._standby_queued.discard(name)
+            self._shard_load[config.shard] -= 1
+            for connection in (self.shards[config.shard], self.standbys[config.shard]):
+                if connection is not None and connection.is_alive:
+                    await connection.part_channels(name)
+
+    def rejoin(self, connection):
+        """Queue every channel of a connection that has just (re)connected"""
+        index = connection.shard
+        if index is None or index >= len(self.shards):
+            return
+        if self.standbys[index] is connection:
+            for config in self.channels.values():
+                if config.shard == index:
+                    config.standby_joined = False
+                    if config.name not in self._standby_queued:
+                        self._standby_queued.add(config.name)
+                        self._standby_queue.append(config.name)
+            self._kick()
+            return
+        if self.shards[index] is not connection:
+            return
+        for config in self.channels.values():
+            if config.shard == index:
+                config.joined = False
+                self._enqueue(config.name)
+        self._kick()
+        self._connect_standby(index)
+
+    def connection_lost(self, connection):
+        """Called as a logged-in connection starts reconnecting; fails its shard over to a ready standby"""
+        self.reconnects += 1
+        index = connection.shard
+        standby = self.standbys[index]
+        if standby is connection:
+            connection.backlog.clear()
+            connection.unseen.clear()
+            # Nothing can confirm the active connection's sends until the standby has rejoined
+            for config in self.channels.values():
+                if config.shard == index:
+                    config.standby_joined = False
+            active = self.shards[index]
+            for nonce in [nonce for nonce, entry in self._unconfirmed.items() if entry[0] is active]:
+                del self._unconfirmed[nonce]
+            return
+        if self.shards[index] is not connection or standby is None or not (standby.joinable and standby.is_alive):
+            return
+        self.shards[index], self.standbys[index] = standby, connection
+        standby.primary, connection.primary = connection.primary, False
+        if self.bot._connection is connection:
+            self.bot._connection = standby
+        self.failovers += 1
+        for config in self.channels.values():
+            if config.shard == index:
+                config.joined, config.standby_joined = config.standby_joined, False
+                if not config.joined:
+                    self._enqueue(config.name)
+        # Chat that reached the standby while the old connection was failing; the rest was handled
+        backlog = [line for line in standby.backlog if _tag(line, 'id') not in self.seen]
+        standby.backlog.clear()
+        standby.unseen.clear()
+        standby.replay(backlog)
+        self.replayed += len(backlog)
+        logger.warning(f"IRC shard {index} lost its connection; failed over to its standby, "
+                       f"replaying {len(backlog)} messages")
+        asyncio.get_running_loop().create_task(self._replay_sends(connection))
+
+    def check_stall(self, standby):
+        unseen, seen = standby.unseen, self.seen
+        while unseen and unseen[0][1] in seen:
+            unseen.popleft()
+        if unseen and time.monotonic() - unseen[0][0] > STALL_AFTER:
+            unseen.clear()
+            active = self.shards[standby.shard]
+            if active.connected_at is not None and not active.connecting:
+                logger.warning(f"IRC shard {standby.shard} missed chat its standby got {STALL_AFTER:g}s ago; "
+                               f"reconnecting it")
+                active.restart()
+
+    def standby_joined(self, connection, channel):
+        config = self.channels.get(channel)
+        if config is not None and self.standbys[config.shard] is connection:
+            config.standby_joined = True
+
+    def sent(self, connection, nonce, channel, content, reply_to):
+        """Track a send until the standby sees its echo"""
+        config = self.channels.get(channel)
+        # Without a standby in the channel no echo will come, and a replay could post twice
+        if config is None or not config.standby_joined:
+            return
+        unconfirmed = self._unconfirmed
+        now = self.clock()
+        unconfirmed[nonce] = (connection, now, channel, content, reply_to)
+        while unconfirmed:
+            oldest = next(iter(unconfirmed))
+            if unconfirmed[oldest][1] >= now - REPLAY_WINDOW:
+                break
+            del unconfirmed[oldest]
+
+    def confirm(self, nonce):
+        """An echo of a send arrived; False if the nonce is not one of ours"""
+        return self._unconfirmed.pop(nonce, None) is not None
+
+    async def _replay_sends(self, lost):
+        await self.sleep(REPLAY_GRACE)
+        cutoff = self.clock() - REPLAY_WINDOW
+        for nonce, (connection, sent_at, channel, content, reply_to) in list(self._unconfirmed.items()):
+            if connection is not lost:
+                continue
+            del self._unconfirmed[nonce]
+            if sent_at < cutoff:
+                continue
+            try:
+                await self.connection_for(channel).privmsg(channel, content, reply_to, nonce)
+            except Exception as e:
+                logger.error(f"Failed to resend a message to #{channel} after failover: {str(e)}")
+                continue
+            self.replayed_sends += 1
+
+    def _enqueue(self, name):
+        if name not in self._queued:
+            self._queued.add(name)
+            self._queue.append(name)
+            self._kick()
+
+    def _kick(self):
+        if not self._queue and not self._standby_queue:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not running yet; the primary connection's authenticate will start the worker
+            return
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if not self._queue and not self._standby_queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # Take as many channels as the bucket allows, up to one batch
+            batches = {}
+            taken = 0
+            now = self.clock()
+            while self._queue and taken < self.batch_size:
+                name = self._queue[0]
+                config = self.channels.get(name)
+                if config is None or name not in self._queued:
+                    self._queue.popleft()
+                    continue
+                shard = self.shards[config.shard]
+                if not (shard.joinable and shard.is_alive):
+                    # Requeued by rejoin() once that shard has connected
+                    self._queue.popleft()
+                    self._queued.discard(name)
+                    self._connect_shard(config.shard)
+                    continue
+                if not self.join_bucket.take(now):
+                    break
+                self._queue.popleft()
+                self._queued.discard(name)
+                batches.setdefault(shard, []).append(name)
+                taken += 1
+
+            # Standbys join only with tokens the active connections do not need
+            while self._standby_queue and not self._queue and taken < self.batch_size:
+                name = self._standby_queue[0]
+                config = self.channels.get(name)
+                if config is None or name not in self._standby_queued:
+                    self._standby_queue.popleft()
+                    continue
+                standby = self.standbys[config.shard]
+                if standby is None or not (standby.joinable and standby.is_alive):
+                    # Requeued by rejoin() once the standby has connected
+                    self._standby_queue.popleft()
+                    self._standby_queued.discard(name)
+                    continue
+                if not self.join_bucket.take(now):
+                    break
+                self._standby_queue.popleft()
+                self._standby_queued.discard(name)
+                batches.setdefault(standby, []).append(name)
+                taken += 1
+
+            for connection, names in batches.items():
+                try:
+                    await connection.send(f"JOIN {','.join('#' + name for name in names)}\r\n")
+                except Exception as e:
+                    logger.error(f"Failed to join {len(names)} channels on shard {connection.shard}: {str(e)}")
+                    continue
+                self.joins_sent += len(names)
+                if connection.is_standby:
+                    # Marked joined when the server confirms, see standby_joined()
+                    continue
+                for name in names:
+                    config = self.channels.get(name)
+                    if config is not None:
+                        config.joined = True
+
+            if not taken and (self._queue or self._standby_queue):
+                await self.sleep(max(self.join_bucket.delay(self.clock()), 0.001))
+
+    def set_token(self, token):
+        """Use a refreshed token on every shard's next (re)connect"""
+        for connection in self._connections():
+            connection._token = token
+
+    def allows(self, channel, command):
+        """Whether a command is enabled in a channel"""
+        config = self.channels.get(channel)
+        return config is None or config.allows(command)
+
+    def connection_for(self, channel):
+        """The IRC connection a channel was joined on"""
+        config = self.channels.get(channel)
+        if config is None or config.shard is None:
+            return self.bot._connection
+        return self.shards[config.shard]
+
+    def get_channel(self, name):
+        """A twitchio Channel bound to the right shard, or None if not in its cache"""
+        name = normalize(name)
+        connection = self.connection_for(name)
+        if name in connection._cache:
+            return Channel(name=name, websocket=connection)
+        return None
+
+    async def wait_until_joined(self, interval=0.5):
+        """Return once a JOIN has gone out for every channel"""
+        while any(not config.joined for config in self.channels.values()):
+            await self.sleep(interval)
+
+    def stats(self):
+        return {
+            'channels': len(self.channels),
+            'joined': sum(1 for config in self.channels.values() if config.joined),
+            'queued_joins': len(self._queue),
+            'shards': len(self.shards),
+            'channels_per_shard': list(self._shard_load),
+            'joins_sent': self.joins_sent,
+            'standby_joined': sum(1 for config in self.channels.values() if config.standby_joined),
+            'reconnects': self.reconnects,
+            'failovers': self.failovers,
+            'replayed': self.replayed,
+            'replayed_sends': self.replayed_sends,
+            'duplicates': self.duplicates
+        }
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        # The bot's own connection is closed by the bot
+        for connection in self._connections():
+            if connection is not self.bot._connection:
+                await connection.disconnect()
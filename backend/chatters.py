@@ -0,0 +1,173 @@
+import sys
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger('twitch_bot')
+
+# Chatters remembered before the least recently seen one is forgotten
+MAX_CHATTERS = 100000
+# Distinct badges tags whose role bits are remembered
+BADGE_CACHE_SIZE = 4096
+
+# Role bits, read from the badges tag
+BROADCASTER = 1 << 0
+MODERATOR = 1 << 1
+VIP = 1 << 2
+SUBSCRIBER = 1 << 3
+FOUNDER = 1 << 4
+STAFF = 1 << 5
+ADMIN = 1 << 6
+GLOBAL_MOD = 1 << 7
+PARTNER = 1 << 8
+TURBO = 1 << 9
+PRIME = 1 << 10
+ARTIST = 1 << 11
+# The bot's own account; not a badge
+SELF = 1 << 15
+# Exempt from moderation
+PRIVILEGED = BROADCASTER | MODERATOR | VIP
+
+BADGE_ROLES = {
+    'broadcaster': BROADCASTER, 'moderator': MODERATOR, 'vip': VIP, 'subscriber': SUBSCRIBER,
+    # Founders are subscribers whose badge replaces the subscriber one
+    'founder': FOUNDER | SUBSCRIBER,
+    'staff': STAFF, 'admin': ADMIN, 'global_mod': GLOBAL_MOD, 'partner': PARTNER, 'turbo': TURBO,
+    'premium': PRIME, 'artist-badge': ARTIST,
+}
+
+
+def badge_roles(badges):
+    """Role bits of a badges tag such as 'moderator/1,subscriber/12'"""
+    roles = 0
+    if badges:
+        for badge in badges.split(','):
+            roles |= BADGE_ROLES.get(badge.partition('/')[0], 0)
+    return roles
+
+
+class ChatterRecord:
+    """A chatter in one channel, as of their last message there: roles are per channel"""
+
+    __slots__ = ('id', 'login', 'channel', 'roles', 'badges', 'mod', 'vip')
+
+    def __init__(self, user_id, login, channel, roles=0):
+        self.id = user_id
+        self.login = login
+        self.channel = channel
+        self.roles = roles
+        # The badges, mod and vip tags the roles were read from
+        self.badges = None
+        self.mod = None
+        self.vip = None
+
+    @property
+    def is_broadcaster(self):
+        return bool(self.roles & BROADCASTER)
+
+    @property
+    def is_mod(self):
+        # The broadcaster counts as a moderator of their own channel
+        return bool(self.roles & (MODERATOR | BROADCASTER))
+
+    @property
+    def is_vip(self):
+        return bool(self.roles & VIP)
+
+    @property
+    def is_subscriber(self):
+        return bool(self.roles & SUBSCRIBER)
+
+    @property
+    def is_self(self):
+        return bool(self.roles & SELF)
+
+    def __repr__(self):
+        return f"ChatterRecord({self.login!r}, id={self.id!r}, channel={self.channel!r}, roles={self.roles:#x})"
+
+
+class ChatterRegistry:
+    """Chatters by channel and user ID, read from message tags once and forgotten least recently seen first.
+
+    Mod and VIP status differ between channels, so a user has a record per
+    channel they chat in. observe(message) returns the author's record for
+    the message's channel, refreshed only when the badges, mod or vip tag
+    differs from the one the roles were read from; role bits of a badges tag
+    are themselves cached, so a chatter seen again costs a couple of dict
+    lookups. The last message observed is remembered, so the listeners and
+    commands handling one message share a single lookup. Logins are
+    interned, and the bot's own account is marked SELF when a record is
+    created.
+    """
+
+    def __init__(self, maxsize=MAX_CHATTERS, self_login=None, self_id=None):
+        self.maxsize = maxsize
+        self.self_login = self_login.lower() if self_login else None
+        self.self_id = self_id
+        self._records = OrderedDict()
+        self._badge_roles = {}
+        self._last_message = None
+        self._last_record = None
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, channel, user_id):
+        """The record of a user ID in a channel, or None; does not count as seeing them"""
+        return self._records.get((channel, user_id))
+
+    def observe(self, message):
+        """The record of a message's author in its channel, created or refreshed from its tags; None without an author"""
+        if message is self._last_message:
+            return self._last_record
+        author = message.author
+        if author is None:
+            return None
+        tags = message.tags or {}
+        # Messages without tags are keyed by login
+        user_id = tags.get('user-id') or author.name
+        # Whispers have no channel and share one record per user under None
+        channel = message.channel
+        key = (channel.name if channel is not None else None, user_id)
+        records = self._records
+        record = records.get(key)
+        if record is None:
+            self.misses += 1
+            login = sys.intern(author.name)
+            record = records[key] = ChatterRecord(
+                user_id, login, key[0], SELF if login == self.self_login or user_id == self.self_id else 0)
+            if len(records) > self.maxsize:
+                records.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+            records.move_to_end(key)
+        badges = tags.get('badges')
+        mod = tags.get('mod')
+        vip = tags.get('vip')
+        if badges != record.badges or mod != record.mod or vip != record.vip:
+            record.badges, record.mod, record.vip = badges, mod, vip
+            record.roles = self._roles(badges, mod, vip) | (record.roles & SELF)
+        self._last_message = message
+        self._last_record = record
+        return record
+
+    def _roles(self, badges, mod, vip):
+        roles = self._badge_roles.get(badges)
+        if roles is None:
+            if len(self._badge_roles) >= BADGE_CACHE_SIZE:
+                self._badge_roles.clear()
+            roles = self._badge_roles[badges] = badge_roles(badges)
+        # Set alongside the badge, but the tags are what Twitch documents
+        if mod == '1':
+            roles |= MODERATOR
+        if vip == '1':
+            roles |= VIP
+        return roles
+
+    def stats(self):
+        return {'chatters': len(self._records), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'badge_sets': len(self._badge_roles)}
@@ -0,0 +1,282 @@
+import os
+import ast
+import json
+import asyncio
+import logging
+import importlib.util
+import commands
+
+logger = logging.getLogger('twitch_bot')
+
+COMMANDS_DIR = os.path.join(os.path.dirname(__file__), 'commands')
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), '.command_manifest.json')
+# Touching any of these means a module registers listeners and must be imported at startup
+LISTENER_ATTRIBUTES = ('message_listeners', 'add_message_listener', 'event_listeners', 'add_event_listener')
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def index_module(path):
+    """Read the command names a module registers without importing it.
+
+    Returns a list of [name, aliases] pairs taken from @....command(...)
+    decorators, or None when the module has to be imported eagerly: it
+    registers message or event listeners, builds names at runtime, or
+    registers no command this way.
+    """
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    found = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and node.attr in LISTENER_ATTRIBUTES:
+            return None
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for decorator in node.decorator_list:
+            if not (isinstance(decorator, ast.Call) and isinstance(decorator.func, ast.Attribute)
+                    and decorator.func.attr == 'command'):
+                continue
+            name, aliases = node.name, []
+            for keyword in decorator.keywords:
+                try:
+                    value = ast.literal_eval(keyword.value)
+                except ValueError:
+                    return None
+                if keyword.arg == 'name':
+                    name = value
+                elif keyword.arg == 'aliases':
+                    aliases = list(value or ())
+            found.append([name, aliases])
+    return found or None
+
+
+class CommandManifest:
+    """On-disk index of command names per module, invalidated by file mtime"""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.entries = {}
+        self._dirty = False
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def commands(self, name, path, mtime):
+        """Return the indexed [name, aliases] pairs of a module, re-reading it if it changed"""
+        entry = self.entries.get(name)
+        if entry is None or entry['mtime'] != mtime:
+            entry = {'mtime': mtime, 'commands': index_module(path)}
+            self.entries[name] = entry
+            self._dirty = True
+        return entry['commands']
+
+    def prune(self, names):
+        """Forget modules that no longer exist"""
+        for name in [name for name in self.entries if name not in names]:
+            del self.entries[name]
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.warning(f"Could not write command manifest: {str(e)}")
+
+
+class LazyCommand:
+    """Router placeholder for a command whose module has not been imported yet"""
+
+    lazy = True
+    __slots__ = ('name', 'aliases', 'module', 'loader')
+
+    def __init__(self, name, aliases, module, loader):
+        self.name = name
+        self.aliases = aliases
+        self.module = module
+        self.loader = loader
+
+    def resolve(self):
+        """Import the owning module and return the real command, or None"""
+        self.loader.load(self.module)
+        return self.loader.bot.get_command(self.name)
+
+
+class CommandLoader:
+    """Loads commands/<name>/command.py modules and keeps their BotCommand instances.
+
+    Each module can be reloaded on its own: the new module is imported
+    first, the old instance's commands and listeners are unregistered and
+    the new class registers its own, all without yielding to the event
+    loop. If anything fails the old instance is registered again.
+    Invocations already running keep the old callbacks and finish normally.
+
+    With lazy=True, modules whose command names can be read from the
+    manifest are not imported at startup; placeholders in the bot's command
+    router import them the first time one of their commands is invoked.
+    """
+
+    def __init__(self, bot, commands_dir=COMMANDS_DIR, lazy=False, manifest_path=MANIFEST_PATH):
+        self.bot = bot
+        self.commands_dir = commands_dir
+        self.lazy = lazy
+        self.manifest = CommandManifest(manifest_path) if lazy else None
+        self.instances = {}
+        self.stubs = {}
+        self._mtimes = {}
+        self._watch_task = None
+
+    def command_file(self, name):
+        return os.path.join(self.commands_dir, name, 'command.py')
+
+    def scan(self):
+        """Return {module name: mtime} for every command module on disk"""
+        found = {}
+        for entry in os.scandir(self.commands_dir):
+            if entry.is_dir() and not entry.name.startswith('__'):
+                mtime = _mtime(self.command_file(entry.name))
+                if mtime is not None:
+                    found[entry.name] = mtime
+        return found
+
+    def import_module(self, name):
+        """Import a command module and return its BotCommand subclass"""
+        spec = importlib.util.spec_from_file_location(
+            f"commands.{name}.command", self.command_file(name))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        # Find the command class
+        for attr_name in dir(module):
+            attr = getattr(module, attr_name)
+            if (isinstance(attr, type) and
+                issubclass(attr, commands.BotCommand) and
+                attr != commands.BotCommand):
+                return attr
+        raise ImportError(f"No BotCommand subclass found in {name}/command.py")
+
+    def index(self, name, mtime):
+        """Put placeholders for a module's commands in the router; False if it must be imported"""
+        try:
+            indexed = self.manifest.commands(name, self.command_file(name), mtime)
+        except (OSError, SyntaxError, ValueError):
+            return False
+        if not indexed:
+            return False
+        self._drop_stubs(name)
+        router = self.bot.command_router
+        stubs = [LazyCommand(command_name, aliases, name, self) for command_name, aliases in indexed]
+        for stub in stubs:
+            router.add(stub, replace=False)
+        self.stubs[name] = stubs
+        self._mtimes[name] = mtime
+        return True
+
+    def _drop_stubs(self, name):
+        for stub in self.stubs.pop(name, ()):
+            self.bot.command_router.remove(stub)
+
+    def load(self, name):
+        """Import and instantiate a module that is not loaded yet"""
+        if name in self.instances:
+            return True
+        self._drop_stubs(name)
+        mtime = _mtime(self.command_file(name))
+        try:
+            command_class = self.import_module(name)
+            # Instantiate the command handler
+            self.instances[name] = command_class(self.bot)
+            logger.info(f"Loaded command module: {name}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to load command module {name}: {str(e)}")
+            return False
+        finally:
+            self._mtimes[name] = mtime
+
+    def load_all(self):
+        """Load every command module found on disk, or index it when lazy"""
+        found = self.scan()
+        for name in sorted(found):
+            if self.lazy and self.index(name, found[name]):
+                continue
+            self.load(name)
+        if self.lazy:
+            self.manifest.prune(found)
+            self.manifest.save()
+            logger.info(f"Indexed {len(self.stubs)} command modules for lazy loading")
+
+    def reload(self, name):
+        """Swap in a fresh copy of a module, keeping the old one if that fails"""
+        old = self.instances.get(name)
+        mtime = _mtime(self.command_file(name))
+        if old is None:
+            # Never imported: re-index it if possible, so it stays lazy
+            if self.lazy and self.index(name, mtime):
+                return True
+            return self.load(name)
+        self._mtimes[name] = mtime
+
+        try:
+            command_class = self.import_module(name)
+        except Exception as e:
+            logger.error(f"Reload of {name} failed, keeping the running version: {str(e)}")
+            return False
+
+        old.unregister()
+        try:
+            self.instances[name] = command_class(self.bot)
+        except Exception as e:
+            logger.error(f"Reload of {name} failed, rolling back: {str(e)}")
+            self.instances[name] = type(old)(self.bot)
+            return False
+        logger.info(f"Reloaded command module: {name}")
+        return True
+
+    def unload(self, name):
+        """Unregister a module whose file has gone away"""
+        self._mtimes.pop(name, None)
+        self._drop_stubs(name)
+        instance = self.instances.pop(name, None)
+        if instance is not None:
+            instance.unregister()
+            logger.info(f"Unloaded command module: {name}")
+
+    def check_for_changes(self):
+        """Reload modules whose command.py changed since the last check"""
+        found = self.scan()
+        for name, mtime in found.items():
+            if self._mtimes.get(name) != mtime:
+                self.reload(name)
+        for name in list(self._mtimes):
+            if name not in found:
+                self.unload(name)
+        if self.lazy:
+            self.manifest.prune(found)
+            self.manifest.save()
+
+    async def watch(self, interval=1.0):
+        """Poll the commands/ tree and hot-reload changed modules"""
+        logger.info(f"Watching {self.commands_dir} for command changes")
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.check_for_changes()
+            except Exception as e:
+                logger.error(f"Error checking command modules: {str(e)}")
+
+    def start_watching(self, interval=1.0):
+        self._watch_task = self.bot.loop.create_task(self.watch(interval))
+        return self._watch_task
@@ -0,0 +1,76 @@
+import logging
+
+logger = logging.getLogger('twitch_bot')
+
+
+class CommandRouter:
+    """Hash index of command names and aliases for O(1) dispatch.
+
+    Only a prefix at the very start of a message counts as a command token, so
+    '!' inside URLs or mid-sentence never dispatches. Matching slices out a
+    single token and does one dict lookup; argument parsing is left to the
+    bot's context and only happens once a command has matched.
+    """
+
+    def __init__(self, prefix='!'):
+        self.prefix = prefix
+        self._prefix_len = len(prefix)
+        self._index = {}
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, name):
+        return name.lower() in self._index
+
+    def rebuild(self, commands):
+        """Rebuild the index from a name -> Command mapping.
+
+        Lazy placeholders (objects with a true ``lazy`` attribute) stay
+        indexed until a real command takes their name.
+        """
+        self._index = {name: command for name, command in self._index.items()
+                       if getattr(command, 'lazy', False)}
+        for command in commands.values():
+            self.add(command)
+        logger.info(f"Command router built with {len(self._index)} names")
+
+    def add(self, command, replace=True):
+        """Index a command under its name and all of its aliases"""
+        for name in (command.name, *(command.aliases or ())):
+            name = name.lower()
+            if replace or name not in self._index:
+                self._index[name] = command
+
+    def remove(self, command):
+        """Drop every name that points at the given command"""
+        for name in [name for name, cmd in self._index.items() if cmd is command]:
+            del self._index[name]
+
+    def match(self, content, tags=None):
+        """Return the command invoked by a chat line, or None.
+
+        ``tags`` are the message's IRC tags; they are only consulted to tell
+        a reply ("@user !cmd ...") from a line that merely starts with a
+        mention.
+        """
+        prefix = self.prefix
+        # Most chat lines carry no prefix at all and the 'in' operator rejects
+        # them without a method call; lines with a prefix that isn't leading
+        # only look past a mention when they are replies
+        if prefix not in content:
+            return None
+        if not content.startswith(prefix):
+            if content[0] != '@' or not tags or 'reply-parent-msg-id' not in tags:
+                return None
+            # Replies arrive as "@user !cmd ...", skip the mention
+            space = content.find(' ')
+            if space < 0 or not content.startswith(prefix, space + 1):
+                return None
+            content = content[space + 1:]
+        start = self._prefix_len
+        end = content.find(' ', start)
+        token = content[start:] if end < 0 else content[start:end]
+        if not token:
+            return None
+        return self._index.get(token.lower())
@@ -3,13 +3,61 @@ from twitchio.ext import commands
 
 logger = logging.getLogger('twitch_bot')
 
+def cooldown(rate, per, scope='user'):
+    """Limit a command to `rate` uses per `per` seconds.
+    
+    Scope is 'user', 'channel' or 'global'. Stack it under @self.bot.command:
+    
+        @self.bot.command(name="greet")
+        @cooldown(1, 30, scope='user')
+        async def greet(ctx): ...
+    """
+    def decorator(func):
+        func.__rate_limits__ = getattr(func, '__rate_limits__', []) + [(rate, per, scope)]
+        return func
+    return decorator
+
 class BotCommand:
     """Base class for all bot commands"""
     
     def __init__(self, bot):
         self.bot = bot
-        self.register_commands()
+        # Remember what this instance registers so it can be unloaded later
+        commands_before = set(bot.commands)
+        listeners_before = list(bot.message_listeners)
+        event_listeners_before = list(bot.event_listeners)
+        try:
+            self.register_commands()
+        except Exception:
+            # Undo a registration that failed halfway before passing the error on
+            self._record_registrations(commands_before, listeners_before, event_listeners_before)
+            self.unregister()
+            raise
+        self._record_registrations(commands_before, listeners_before, event_listeners_before)
+        
+    def _record_registrations(self, commands_before, listeners_before, event_listeners_before):
+        self.registered_commands = [name for name in self.bot.commands if name not in commands_before]
+        self.registered_listeners = [listener for listener in self.bot.message_listeners
+                                     if listener not in listeners_before]
+        self.registered_event_listeners = [listener for listener in self.bot.event_listeners
+                                           if listener not in event_listeners_before]
         
     def register_commands(self):
         """Register all commands with the bot. Must be implemented by subclasses."""
-        raise NotImplementedError("Subclasses must implement register_commands()")
\ No newline at end of file
+        raise NotImplementedError("Subclasses must implement register_commands()")
+    
+    def unregister(self):
+        """Remove the commands and listeners this instance registered.
+        
+        Invocations already in progress are left to finish.
+        """
+        for name in self.registered_commands:
+            if name in self.bot.commands:
+                self.bot.remove_command(name)
+        for listener in self.registered_listeners:
+            self.bot.remove_message_listener(listener)
+        for listener in self.registered_event_listeners:
+            self.bot.remove_event_listener(listener)
+        self.registered_commands = []
+        self.registered_listeners = []
+        self.registered_event_listeners = []
@@ -0,0 +1,47 @@
+from commands import BotCommand
+from send_queue import MAX_MESSAGE_LENGTH
+import asyncio
+import logging
+
+logger = logging.getLogger('twitch_bot')
+
+class PerfCommand(BotCommand):
+    """Profiler controls and report for the broadcaster and moderators"""
+
+    def register_commands(self):
+        """Register the perf command"""
+
+        @self.bot.command(name="perf")
+        async def perf(ctx):
+            """!perf [on|off|reset|dump]: top offenders, or control the profiler"""
+            chatter = self.bot.chatters.observe(ctx.message)
+            if chatter is None or not chatter.is_mod:
+                return
+            profiler = self.bot.profiler
+            words = ctx.message.content.split()
+            action = words[1].lower() if len(words) > 1 else ''
+
+            if action == 'on':
+                profiler.enable()
+                await ctx.send("Profiling on")
+            elif action == 'off':
+                profiler.disable()
+                await ctx.send("Profiling off")
+            elif action == 'reset':
+                profiler.reset()
+                await ctx.send("Profile cleared")
+            elif action == 'dump':
+                # The report is taken on the loop; the file write happens off it
+                report = profiler.report()
+                try:
+                    path = await asyncio.get_running_loop().run_in_executor(None, profiler.write_report, report)
+                    # The path stays in the log; chat only hears that it worked
+                    logger.info(f"Profile written to {path}")
+                    await ctx.send("Profile written")
+                except OSError as e:
+                    logger.error(f"Could not write profile: {str(e)}")
+                    await ctx.send("Could not write the profile")
+            elif not profiler.enabled and not profiler.stats:
+                await ctx.send("Profiling is off; !perf on to start")
+            else:
+                await ctx.send(profiler.summary()[:MAX_MESSAGE_LENGTH])
@@ -0,0 +1,58 @@
+from commands import BotCommand, cooldown
+from send_queue import MAX_MESSAGE_LENGTH
+import logging
+
+logger = logging.getLogger('twitch_bot')
+
+TOP_LISTS = ('words', 'emotes', 'chatters')
+
+class StatsCommand(BotCommand):
+    """Live chat statistics from the bot's chat analytics"""
+
+    def register_commands(self):
+        """Register the stats and top commands"""
+
+        @self.bot.command(name="stats")
+        @cooldown(1, 10, scope='channel')
+        async def stats(ctx):
+            """!stats [user]: chat rate in this channel, or how much one chatter has said"""
+            current = await self._current(ctx)
+            if current is None:
+                return
+            words = ctx.message.content.split()
+            if len(words) > 1:
+                user = words[1].lstrip('@').lower()
+                count = self.bot.analytics.chatter_count(ctx.channel.name, user)
+                await ctx.send(f"{user}: {count} messages in the last {current.span:.0f}s "
+                               f"({count / current.span * 60:.1f}/min)")
+                return
+            spike = " - raid-like spike!" if current.spiking else ""
+            await ctx.send(f"Last {current.span:.0f}s: {current.messages} messages from {current.chatters} "
+                           f"chatters ({current.per_minute:.0f}/min){spike}")
+
+        @self.bot.command(name="top")
+        @cooldown(1, 10, scope='channel')
+        async def top(ctx):
+            """!top [words|emotes|chatters]: what chat has used most lately"""
+            current = await self._current(ctx)
+            if current is None:
+                return
+            words = ctx.message.content.split()
+            wanted = [words[1].lower()] if len(words) > 1 and words[1].lower() in TOP_LISTS else TOP_LISTS
+            parts = []
+            for name in wanted:
+                ranked = getattr(current, f'top_{name}')
+                if ranked:
+                    parts.append(f"{name.capitalize()}: " + ', '.join(f"{key} ({count})" for key, count in ranked))
+            await ctx.send((' | '.join(parts) or "Nothing to rank yet")[:MAX_MESSAGE_LENGTH])
+
+    async def _current(self, ctx):
+        """The channel's statistics, or None after telling chat why there are none"""
+        analytics = self.bot.analytics
+        if analytics is None:
+            await ctx.send("Chat statistics are off")
+            return None
+        current = analytics.window(ctx.channel.name)
+        if current is None:
+            await ctx.send("No chat to go on yet")
+        return current
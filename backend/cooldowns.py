@@ -0,0 +1,157 @@
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger('twitch_bot')
+
+SCOPES = ('global', 'channel', 'user')
+
+# Expired keys are dropped from every rule this often (seconds)
+PRUNE_INTERVAL = 60
+# Keys a rule tracks at most; past this the window closest to expiring is dropped early
+MAX_KEYS = 50000
+
+
+class CooldownRule:
+    """Allow ``rate`` uses per ``per`` seconds for each key of a scope.
+
+    A key's window starts at its first use and state is an ordered dict of
+    window expiry timestamps, plus a use count per key for rates above one.
+    Every window lasts ``per``, so the order windows open in is the order
+    they expire in: prune() stops at the first live key, and past
+    ``max_keys`` keys the oldest window is dropped, its key allowed again
+    a little early.
+    """
+
+    __slots__ = ('command', 'rate', 'per', 'scope', 'max_keys', 'evictions', '_expires', '_counts')
+
+    def __init__(self, command, rate, per, scope='user', max_keys=MAX_KEYS):
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown cooldown scope: {scope}")
+        if rate < 1:
+            raise ValueError("Cooldown rate must be at least 1")
+        self.command = command
+        self.rate = rate
+        self.per = per
+        self.scope = scope
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._expires = OrderedDict()
+        self._counts = {}
+
+    def __len__(self):
+        return len(self._expires)
+
+    def key(self, channel, user_id):
+        if self.scope == 'user':
+            return user_id
+        if self.scope == 'channel':
+            return channel
+        return None
+
+    def retry_after(self, key, now):
+        """Seconds until the key may use this again, 0.0 if it may now"""
+        expires = self._expires.get(key)
+        if expires is None or expires <= now:
+            return 0.0
+        if self.rate > 1 and self._counts[key] < self.rate:
+            return 0.0
+        return expires - now
+
+    def hit(self, key, now):
+        """Record one use by the key"""
+        windows = self._expires
+        expires = windows.get(key)
+        if expires is None or expires <= now:
+            windows[key] = now + self.per
+            windows.move_to_end(key)
+            if self.rate > 1:
+                self._counts[key] = 1
+            if len(windows) > self.max_keys:
+                oldest, _ = windows.popitem(last=False)
+                self._counts.pop(oldest, None)
+                self.evictions += 1
+        else:
+            self._counts[key] += 1
+
+    def prune(self, now):
+        """Drop keys whose window has passed"""
+        windows = self._expires
+        dropped = 0
+        while windows:
+            key = next(iter(windows))
+            if windows[key] > now:
+                break
+            windows.popitem(last=False)
+            self._counts.pop(key, None)
+            dropped += 1
+        return dropped
+
+
+class CooldownManager:
+    """Cooldowns and rate limits at global, per-channel and per-user scope.
+
+    Rules are attached to a command name. Rules registered with command=None
+    apply to every command, e.g. a bot-wide per-user limit against spam.
+    """
+
+    def __init__(self, clock=time.monotonic, prune_interval=PRUNE_INTERVAL, max_keys=MAX_KEYS):
+        self.clock = clock
+        self.prune_interval = prune_interval
+        self.max_keys = max_keys
+        self._rules = {}
+        self._shared = []
+        self._next_prune = None
+
+    def add(self, command, rate, per, scope='user'):
+        """Register a rule; command=None applies it to all commands"""
+        rule = CooldownRule(command, rate, per, scope, self.max_keys)
+        if command is None:
+            self._shared.append(rule)
+        else:
+            self._rules.setdefault(command.lower(), []).append(rule)
+        return rule
+
+    def remove(self, command):
+        """Drop all rules attached to a command"""
+        self._rules.pop(command.lower(), None)
+
+    def rules(self, command):
+        return self._rules.get(command.lower(), []) + self._shared
+
+    def check(self, command, channel, user_id):
+        """Record a use if every rule allows it.
+
+        Returns 0.0 when the command may run, otherwise the number of seconds
+        until the most restrictive rule would allow it; a refused use is not
+        recorded.
+        """
+        rules = self._rules.get(command.lower())
+        if self._shared:
+            rules = (rules or []) + self._shared
+        elif not rules:
+            return 0.0
+        now = self.clock()
+        if self._next_prune is None or now >= self._next_prune:
+            self.prune(now)
+        for rule in rules:
+            wait = rule.retry_after(rule.key(channel, user_id), now)
+            if wait:
+                return wait
+        for rule in rules:
+            rule.hit(rule.key(channel, user_id), now)
+        return 0.0
+
+    def prune(self, now=None):
+        """Drop expired keys from every rule"""
+        now = self.clock() if now is None else now
+        self._next_prune = now + self.prune_interval
+        return sum(rule.prune(now) for rules in self._rules.values() for rule in rules) + sum(
+            rule.prune(now) for rule in self._shared)
+
+    def stats(self):
+        """Number of tracked keys per rule"""
+        data = {}
+        for rule in [rule for rules in self._rules.values() for rule in rules] + self._shared:
+            data[f"{rule.command or '*'}:{rule.scope}"] = len(rule)
+        return data
@@ -0,0 +1,26 @@
+from collections import OrderedDict
+
+
+class SeenSet:
+    """Bounded set of recent message IDs; the oldest are forgotten first"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        # Not a dict: deleting from its front leaves holes next(iter()) has to scan past
+        self._ids = OrderedDict()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, message_id):
+        return message_id in self._ids
+
+    def add(self, message_id):
+        """Remember an ID; False if it was already there"""
+        ids = self._ids
+        if message_id in ids:
+            return False
+        ids[message_id] = None
+        if len(ids) > self.maxsize:
+            ids.popitem(last=False)
+        return True
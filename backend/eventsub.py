@@ -0,0 +1,367 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+import aiohttp
+from dedup import SeenSet
+
+logger = logging.getLogger('twitch_bot')
+
+# The EventSub endpoint can be overridden to point the bot at a local fake server
+EVENTSUB_URL = os.getenv('TWITCH_EVENTSUB_URL', 'wss://eventsub.wss.twitch.tv/ws')
+
+# Subscription version and condition for each type the bot can set up per channel;
+# conditions are built from (broadcaster user ID, bot user ID)
+TOPICS = {
+    'channel.follow': ('2', lambda broadcaster, bot: {'broadcaster_user_id': broadcaster,
+                                                      'moderator_user_id': bot}),
+    'channel.raid': ('1', lambda broadcaster, bot: {'to_broadcaster_user_id': broadcaster}),
+    'channel.subscribe': ('1', lambda broadcaster, bot: {'broadcaster_user_id': broadcaster}),
+    'channel.subscription.gift': ('1', lambda broadcaster, bot: {'broadcaster_user_id': broadcaster}),
+    'channel.subscription.message': ('1', lambda broadcaster, bot: {'broadcaster_user_id': broadcaster}),
+    'channel.cheer': ('1', lambda broadcaster, bot: {'broadcaster_user_id': broadcaster}),
+    'channel.channel_points_custom_reward_redemption.add': (
+        '1', lambda broadcaster, bot: {'broadcaster_user_id': broadcaster}),
+}
+# Follows need moderator:read:followers, which the setup script requests; raids need no scope
+DEFAULT_TOPICS = ('channel.follow', 'channel.raid')
+
+# Twitch allows 300 enabled subscriptions per WebSocket session and 3 sessions per user token
+SESSION_LIMIT = 300
+MAX_SESSIONS = 3
+# Message IDs remembered for deduplication
+SEEN_SIZE = 4096
+# Notifications older than this are replays and are dropped
+MAX_AGE = 600
+# Seconds past the keepalive timeout before a silent connection is given up on
+KEEPALIVE_GRACE = 2.0
+# Reconnect backoff after a lost connection (seconds, doubling up to the max)
+RECONNECT_DELAY = (0.5, 30.0)
+
+
+def _parse_timestamp(value):
+    # Twitch sends nanosecond precision, which fromisoformat does not take
+    try:
+        head, _, fraction = value.rstrip('Z').partition('.')
+        parsed = datetime.fromisoformat(f"{head}.{fraction[:6].ljust(6, '0')}" if fraction else head)
+        return parsed.replace(tzinfo=timezone.utc).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+class EventSubEvent:
+    """An EventSub notification as handed to event listeners"""
+
+    __slots__ = ('id', 'type', 'version', 'timestamp', 'subscription', 'data', 'channel', 'received_at')
+
+    # Listener engine keys (coalescing) read message.author
+    author = None
+
+    def __init__(self, message_id, type, version, timestamp, subscription, data):
+        self.id = message_id
+        self.type = type
+        self.version = version
+        self.timestamp = timestamp
+        self.subscription = subscription
+        self.data = data
+        self.channel = (data.get('broadcaster_user_login') or data.get('to_broadcaster_user_login'))
+        self.received_at = time.time()
+
+    def __repr__(self):
+        return f"<EventSubEvent {self.type} {self.channel} {self.id}>"
+
+
+class Subscription:
+    __slots__ = ('type', 'version', 'condition', 'id', 'session', 'failed')
+
+    def __init__(self, type, version, condition):
+        self.type = type
+        self.version = version
+        self.condition = condition
+        self.id = None
+        self.session = None
+        self.failed = False
+
+    @property
+    def key(self):
+        return (self.type, self.version, tuple(sorted(self.condition.items())))
+
+
+class EventSubSession:
+    """One EventSub WebSocket and the subscriptions bound to it.
+
+    Keeps the socket alive across Twitch's session_reconnect (migrating to
+    the new URL keeps the session and its subscriptions) and reconnects
+    with backoff when the socket drops or goes silent past its keepalive
+    timeout, which starts a new session whose subscriptions are recreated.
+    """
+
+    def __init__(self, client, index):
+        self.client = client
+        self.index = index
+        self.id = None
+        self.keepalive = 10
+        self.subscriptions = {}
+        self.ws = None
+        self._task = None
+
+    @property
+    def welcomed(self):
+        return self.id is not None
+
+    def start(self, loop=None):
+        loop = loop or asyncio.get_event_loop()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self.run())
+        return self._task
+
+    async def run(self):
+        client = self.client
+        delay = RECONNECT_DELAY[0]
+        while True:
+            try:
+                self.ws = await client.connect(client.url)
+                await self._welcome(self.ws)
+                delay = RECONNECT_DELAY[0]
+                # A new session has no subscriptions; bind them again while keepalives are read
+                for subscription in self.subscriptions.values():
+                    subscription.id = None
+                    client.spawn(client.create(subscription))
+                await self._read()
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                logger.warning(f"EventSub session {self.index} lost: nothing received within "
+                               f"{self.keepalive + KEEPALIVE_GRACE:.0f}s")
+            except Exception as e:
+                logger.warning(f"EventSub session {self.index} lost: {e.__class__.__name__} {str(e)}")
+            finally:
+                self.id = None
+                if self.ws is not None:
+                    await self.ws.close()
+                    self.ws = None
+            client.reconnects += 1
+            wait = random.uniform(delay / 2, delay)
+            logger.info(f"Reconnecting EventSub session {self.index} in {wait:.1f}s")
+            await asyncio.sleep(wait)
+            delay = min(RECONNECT_DELAY[1], delay * 2)
+
+    async def _welcome(self, ws):
+        msg = await ws.receive(timeout=self.client.welcome_timeout)
+        if msg.type != aiohttp.WSMsgType.TEXT:
+            raise ConnectionError(f"socket closed before the welcome ({msg.type.name})")
+        data = json.loads(msg.data)
+        if data['metadata']['message_type'] != 'session_welcome':
+            raise ConnectionError(f"expected session_welcome, got {data['metadata']['message_type']}")
+        session = data['payload']['session']
+        self.keepalive = session.get('keepalive_timeout_seconds') or self.keepalive
+        migrated = self.id == session['id']
+        self.id = session['id']
+        logger.info(f"EventSub session {self.index} {'migrated' if migrated else 'welcomed'}: {self.id}")
+
+    async def _read(self):
+        while True:
+            msg = await self.ws.receive(timeout=self.keepalive + KEEPALIVE_GRACE)
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                raise ConnectionError(f"socket closed ({msg.type.name}, code {self.ws.close_code})")
+            reconnect_url = self.client.handle(self, json.loads(msg.data))
+            if reconnect_url:
+                await self._migrate(reconnect_url)
+
+    async def _migrate(self, url):
+        """Move to the URL from session_reconnect; the session and its subscriptions carry over"""
+        old = self.ws
+        new = await self.client.connect(url)
+        try:
+            await self._welcome(new)
+        except Exception:
+            await new.close()
+            raise
+        self.ws = new
+        self.client.migrations += 1
+        # The old socket keeps delivering until the new welcome; handle what it already received
+        while True:
+            try:
+                msg = await old.receive(timeout=0.1)
+            except asyncio.TimeoutError:
+                break
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            self.client.handle(self, json.loads(msg.data))
+        await old.close()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class EventSubClient:
+    """EventSub over WebSocket: subscriptions, sessions and deduplicated dispatch.
+
+    add() records a subscription and binds it to a session with room
+    (opening up to MAX_SESSIONS sockets of SESSION_LIMIT each). Every
+    notification is checked against a bounded set of seen message IDs and
+    its age, then handed to `dispatch`, the bot's event listener engine.
+    `request(method, path, **kwargs)` makes the Helix calls and
+    `connect(url)` opens a WebSocket.
+    """
+
+    def __init__(self, request, connect, dispatch, url=EVENTSUB_URL, session_limit=SESSION_LIMIT,
+                 max_sessions=MAX_SESSIONS, welcome_timeout=10.0):
+        self.request = request
+        self.connect = connect
+        self.dispatch = dispatch
+        self.url = url
+        self.session_limit = session_limit
+        self.max_sessions = max_sessions
+        self.welcome_timeout = welcome_timeout
+        self.sessions = []
+        self.subscriptions = {}
+        self.seen = SeenSet(SEEN_SIZE)
+        self._tasks = set()
+        self.notifications = 0
+        self.duplicates = 0
+        self.stale = 0
+        self.keepalives = 0
+        self.revocations = 0
+        self.reconnects = 0
+        self.migrations = 0
+        self.subscribe_errors = 0
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def add(self, type, condition, version=None):
+        """Subscribe to a type; the subscription survives reconnects. Returns it, or None if there is no room"""
+        version = version or TOPICS.get(type, ('1',))[0]
+        subscription = Subscription(type, version, condition)
+        existing = self.subscriptions.get(subscription.key)
+        if existing is not None:
+            return existing
+        session = next((session for session in self.sessions
+                        if len(session.subscriptions) < self.session_limit), None)
+        if session is None:
+            if len(self.sessions) >= self.max_sessions:
+                logger.warning(f"No EventSub session has room for {type} {condition}")
+                return None
+            session = EventSubSession(self, len(self.sessions))
+            self.sessions.append(session)
+            session.start()
+        subscription.session = session
+        session.subscriptions[subscription.key] = subscription
+        self.subscriptions[subscription.key] = subscription
+        if session.welcomed:
+            self.spawn(self.create(subscription))
+        return subscription
+
+    def add_channel(self, broadcaster_id, bot_id, topics=DEFAULT_TOPICS):
+        """Subscribe a channel to each of `topics`"""
+        for topic in topics:
+            if topic not in TOPICS:
+                logger.warning(f"Unknown EventSub topic: {topic}")
+                continue
+            version, condition = TOPICS[topic]
+            self.add(topic, condition(broadcaster_id, bot_id), version)
+
+    async def remove(self, type, condition, version=None):
+        version = version or TOPICS.get(type, ('1',))[0]
+        subscription = self.subscriptions.pop(Subscription(type, version, condition).key, None)
+        if subscription is None:
+            return
+        subscription.session.subscriptions.pop(subscription.key, None)
+        if subscription.id is not None:
+            response = await self.request('DELETE', 'eventsub/subscriptions', params={'id': subscription.id})
+            if not response.ok:
+                logger.warning(f"Could not delete EventSub subscription {subscription.id}: "
+                               f"{response.status_code}")
+
+    async def create(self, subscription):
+        """Bind a subscription to its session's current socket"""
+        session = subscription.session
+        session_id = session.id
+        if session_id is None or subscription.failed:
+            return
+        try:
+            response = await self.request('POST', 'eventsub/subscriptions', json={
+                'type': subscription.type,
+                'version': subscription.version,
+                'condition': subscription.condition,
+                'transport': {'method': 'websocket', 'session_id': session_id}
+            })
+        except Exception as e:
+            self.subscribe_errors += 1
+            logger.error(f"Could not subscribe to {subscription.type}: {str(e)}")
+            return
+        if response.status_code == 202:
+            subscription.id = response.json()['data'][0]['id']
+        elif response.status_code == 409:
+            # Already bound to this session
+            pass
+        else:
+            self.subscribe_errors += 1
+            # Missing scopes or a bad condition will not fix themselves on the next reconnect
+            subscription.failed = response.status_code in (400, 403)
+            logger.warning(f"Subscribing to {subscription.type} {subscription.condition} failed: "
+                           f"{response.status_code} {response.text[:200]}")
+
+    def handle(self, session, data):
+        """Act on one message; returns the reconnect URL for a session_reconnect"""
+        metadata = data['metadata']
+        kind = metadata['message_type']
+        if kind == 'notification':
+            if not self.seen.add(metadata['message_id']):
+                self.duplicates += 1
+                return None
+            timestamp = _parse_timestamp(metadata.get('message_timestamp'))
+            if timestamp is not None and timestamp < time.time() - MAX_AGE:
+                self.stale += 1
+                return None
+            self.notifications += 1
+            payload = data['payload']
+            self.dispatch(EventSubEvent(metadata['message_id'], metadata.get('subscription_type'),
+                                        metadata.get('subscription_version'), timestamp,
+                                        payload['subscription'], payload['event']))
+        elif kind == 'session_keepalive':
+            self.keepalives += 1
+        elif kind == 'session_reconnect':
+            return data['payload']['session']['reconnect_url']
+        elif kind == 'revocation':
+            self.revocations += 1
+            revoked = data['payload']['subscription']
+            logger.warning(f"EventSub subscription {revoked['type']} revoked: {revoked.get('status')}")
+            for key, subscription in list(session.subscriptions.items()):
+                if subscription.id == revoked['id']:
+                    del session.subscriptions[key]
+                    self.subscriptions.pop(key, None)
+        return None
+
+    def stats(self):
+        return {
+            'sessions': sum(session.welcomed for session in self.sessions),
+            'subscriptions': len(self.subscriptions),
+            'bound': sum(subscription.id is not None for subscription in self.subscriptions.values()),
+            'notifications': self.notifications,
+            'duplicates': self.duplicates,
+            'stale': self.stale,
+            'revocations': self.revocations,
+            'reconnects': self.reconnects,
+            'migrations': self.migrations,
+            'subscribe_errors': self.subscribe_errors
+        }
+
+    async def close(self):
+        await asyncio.gather(*(session.close() for session in self.sessions))
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
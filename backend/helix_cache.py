@@ -0,0 +1,181 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger('twitch_bot')
+
+# Seconds a Helix GET stays fresh, by endpoint path; the longest matching prefix wins
+ENDPOINT_TTLS = {
+    'users': 3600.0,
+    'channels': 300.0,
+    'channels/followers': 60.0,
+    'streams': 30.0,
+    'chat/chatters': 30.0,
+    'games': 86400.0,
+}
+DEFAULT_TTL = 60.0
+# Past its TTL an entry is still served for STALE_FACTOR * TTL seconds while it is refetched
+STALE_FACTOR = 1.0
+MAX_ENTRIES = 2000
+
+
+def _cache_key(path, params):
+    """Hashable key for a path and its query, independent of the order of parameter names.
+
+    Values given for the same name keep their order, since Helix may treat
+    it as significant; only a set's items, which have none, are sorted.
+    """
+    if not params:
+        return path, ()
+    pairs = params.items() if isinstance(params, dict) else params
+    flat = []
+    for name, value in pairs:
+        if isinstance(value, (set, frozenset)):
+            flat.extend((name, item) for item in sorted(map(str, value)))
+        elif isinstance(value, (list, tuple)):
+            flat.extend((name, str(item)) for item in value)
+        else:
+            flat.append((name, str(value)))
+    # sorted() is stable: pairs sharing a name stay in the order they were given
+    return path, tuple(sorted(flat, key=lambda pair: pair[0]))
+
+
+class HelixCache:
+    """In-process cache for Helix GETs.
+
+    ``fetch(path, params)`` performs the request, params being a list of
+    (name, value) pairs, and returns the decoded JSON body, raising on error
+    responses. Identical requests in flight share one fetch. An entry past
+    its TTL but within its stale window is returned at once while a single
+    background fetch replaces it. Entries are kept in LRU order up to
+    maxsize; errors are never cached.
+    """
+
+    def __init__(self, fetch, ttls=None, default_ttl=DEFAULT_TTL, stale_factor=STALE_FACTOR,
+                 maxsize=MAX_ENTRIES, clock=time.monotonic):
+        self.fetch = fetch
+        self.ttls = dict(ENDPOINT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.stale_factor = stale_factor
+        self.maxsize = maxsize
+        self.clock = clock
+        # key -> (data, fresh_until, stale_until)
+        self._entries = OrderedDict()
+        self._inflight = {}
+        # Metrics
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.errors = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ttl_for(self, path):
+        path = path.strip('/')
+        best = None
+        for prefix in self.ttls:
+            if (path == prefix or path.startswith(prefix + '/')) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return self.ttls[best] if best is not None else self.default_ttl
+
+    async def get(self, path, params=None, ttl=None):
+        """Return the JSON body of GET /helix/<path>, from the cache when possible.
+
+        params is a dict (list values become repeated parameters) or a list
+        of (name, value) pairs. ttl overrides the endpoint's TTL.
+        """
+        path = path.strip('/')
+        key = _cache_key(path, params)
+        now = self.clock()
+        entry = self._entries.get(key)
+        if entry is not None:
+            data, fresh_until, stale_until = entry
+            if now < fresh_until:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return data
+            if now < stale_until:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._start(key, path, ttl, background=True)
+                return data
+            del self._entries[key]
+
+        self.misses += 1
+        if key in self._inflight:
+            self.coalesced += 1
+        # Shielded so one caller giving up doesn't cancel the fetch for the others
+        return await asyncio.shield(self._start(key, path, ttl))
+
+    def _start(self, key, path, ttl, background=False):
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._fetch(key, path, ttl))
+            task.add_done_callback(lambda done: self._fetched(key, done, background))
+        return task
+
+    def _fetched(self, key, task, background):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None and background:
+            # Nobody awaits a revalidation; the stale entry keeps being served until it runs out
+            logger.warning(f"Revalidating Helix {key[0]} failed: {str(error)}")
+
+    async def _fetch(self, key, path, ttl):
+        self.fetches += 1
+        try:
+            data = await self.fetch(path, list(key[1]))
+        except Exception:
+            self.errors += 1
+            raise
+        ttl = self.ttl_for(path) if ttl is None else ttl
+        now = self.clock()
+        self._entries[key] = (data, now + ttl, now + ttl * (1 + self.stale_factor))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return data
+
+    def invalidate(self, path=None, params=None):
+        """Forget cached responses: one request, every request for a path, or everything"""
+        if path is None:
+            self._entries.clear()
+            return
+        path = path.strip('/')
+        if params is not None:
+            self._entries.pop(_cache_key(path, params), None)
+            return
+        for key in [key for key in self._entries if key[0] == path]:
+            del self._entries[key]
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'inflight': len(self._inflight),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'fetches': self.fetches,
+            'errors': self.errors,
+            'evictions': self.evictions,
+            'hit_ratio': (self.hits + self.stale_hits) / lookups if lookups else 0.0
+        }
+
+    async def close(self):
+        """Cancel fetches still in flight"""
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._inflight.clear()
@@ -0,0 +1,182 @@
+import os
+import json
+import random
+import asyncio
+import logging
+import time
+import aiohttp
+
+logger = logging.getLogger('twitch_bot')
+
+# Base URLs can be overridden to point the bot at local stub servers
+OAUTH_URL = os.getenv('TWITCH_OAUTH_URL', 'https://id.twitch.tv/oauth2')
+HELIX_URL = os.getenv('TWITCH_HELIX_URL', 'https://api.twitch.tv/helix')
+
+# Statuses that are worth retrying after a backoff
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Methods that can be repeated without changing the outcome; anything else
+# (a whisper, a ban, a token exchange) is only retried when the server
+# cannot have acted on it
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+# Statuses that mean the server refused the request without acting on it
+UNSENT_STATUSES = frozenset({429})
+
+# Errors raised before any of the request was sent; aiohttp only has a
+# separate connect timeout error from 3.10
+UNSENT_ERRORS = (aiohttp.ClientConnectorError,) + (
+    (aiohttp.ConnectionTimeoutError,) if hasattr(aiohttp, 'ConnectionTimeoutError') else ())
+
+
+class HttpResponse:
+    """A fully read HTTP response with a requests-like interface"""
+
+    __slots__ = ('status_code', 'headers', 'content', 'elapsed')
+
+    def __init__(self, status_code, headers, content, elapsed):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        """Raise HttpError for 4xx/5xx responses"""
+        if not self.ok:
+            raise HttpError(self)
+
+
+class HttpError(Exception):
+    """Raised by HttpResponse.raise_for_status for error statuses"""
+
+    def __init__(self, response):
+        self.response = response
+        super().__init__(f"HTTP {response.status_code}: {response.text[:200]}")
+
+
+class HttpClient:
+    """Shared async HTTP client with a keep-alive pool, timeouts and retries.
+
+    The aiohttp session is created lazily on first use so the client can be
+    constructed before the event loop is running.
+    """
+
+    def __init__(self, pool_size=100, pool_size_per_host=50, timeout=10.0,
+                 connect_timeout=5.0, retries=3, backoff=0.5, max_backoff=10.0,
+                 keepalive=60.0):
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.keepalive = keepalive
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                keepalive_timeout=self.keepalive,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout)
+            )
+        return self._session
+
+    def _retry_delay(self, attempt, response=None):
+        """Return how long to wait before the next attempt"""
+        if response is not None:
+            # Prefer the server's own hints when it rate limits us
+            reset = response.headers.get('Ratelimit-Reset')
+            if reset:
+                try:
+                    return min(self.max_backoff, max(0.0, float(reset) - time.time()))
+                except ValueError:
+                    pass
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(self.max_backoff, max(0.0, float(retry_after)))
+                except ValueError:
+                    pass
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        # Full jitter keeps many retrying callers from synchronizing
+        return random.uniform(delay / 2, delay)
+
+    async def request(self, method, url, *, params=None, headers=None, data=None,
+                      json=None, timeout=None, retries=None):
+        """Send a request, retrying connection errors and retryable statuses.
+
+        Non-idempotent methods such as POST are only retried when the request
+        never reached the server: a failed connect or a 429. A timeout, a
+        dropped connection or a 5xx may follow a request that was acted on,
+        so those are returned or raised instead of sent twice.
+        """
+        session = self._get_session()
+        retries = self.retries if retries is None else retries
+        if method.upper() in IDEMPOTENT_METHODS:
+            retry_errors = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+            retry_statuses = RETRY_STATUSES
+        else:
+            retry_errors = UNSENT_ERRORS
+            retry_statuses = UNSENT_STATUSES
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                async with session.request(method, url, params=params, headers=headers,
+                                           data=data, json=json, timeout=request_timeout) as resp:
+                    content = await resp.read()
+                    response = HttpResponse(resp.status, resp.headers, content,
+                                            time.perf_counter() - start)
+            except retry_errors as e:
+                if attempt >= retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(f"{method} {url} failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            else:
+                if response.status_code not in retry_statuses or attempt >= retries:
+                    return response
+                delay = self._retry_delay(attempt, response)
+                logger.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.2f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def patch(self, url, **kwargs):
+        return await self.request('PATCH', url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request('DELETE', url, **kwargs)
+
+    async def ws_connect(self, url, **kwargs):
+        """Open a WebSocket over the pooled session"""
+        return await self._get_session().ws_connect(url, **kwargs)
+
+    async def close(self):
+        """Close the pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
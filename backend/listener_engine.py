@@ -0,0 +1,207 @@
+import time
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger('twitch_bot')
+
+# What to do with a message when a listener's queue is full
+POLICIES = ('drop', 'drop_oldest', 'coalesce')
+
+
+def _default_key(message):
+    return message.author.name if message.author else None
+
+
+class ListenerStats:
+    """Counters for a single listener"""
+
+    __slots__ = ('calls', 'errors', 'timeouts', 'dropped', 'coalesced', 'total_time', 'max_time')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def as_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['avg_time'] = self.total_time / self.calls if self.calls else 0.0
+        return data
+
+
+class Listener:
+    """A message listener with its own queue and worker tasks.
+
+    With the 'coalesce' policy, a newer message with the same key (the author
+    by default) replaces the one still waiting in the queue, so a listener
+    only ever sees the latest pending message per key.
+    """
+
+    def __init__(self, func, concurrency=1, timeout=None, queue_size=1000, policy='drop', key=None,
+                 latency=None, profiler=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown listener queue policy: {policy}")
+        self.func = func
+        self.name = getattr(func, '__qualname__', repr(func))
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self.policy = policy
+        self.key = key or _default_key
+        self.stats = ListenerStats()
+        # Optional histogram observing every call's duration
+        self.latency = latency
+        # Optional Profiler timing every call while it is enabled
+        self.profiler = profiler
+        # Coalescing needs lookup by key; a dict keeps insertion order so it doubles as the FIFO
+        self._pending = {} if policy == 'coalesce' else deque()
+        self._ready = None
+        self._workers = []
+        self._retired = False
+
+    @property
+    def queued(self):
+        return len(self._pending)
+
+    def offer(self, message):
+        """Queue a message without waiting; returns False if it was dropped"""
+        pending = self._pending
+        if self.policy == 'coalesce':
+            key = self.key(message)
+            if key in pending:
+                pending[key] = message
+                self.stats.coalesced += 1
+                return True
+        if self.queue_size and len(pending) >= self.queue_size:
+            if self.policy == 'drop_oldest':
+                self._pop()
+                self.stats.dropped += 1
+            else:
+                self.stats.dropped += 1
+                return False
+        if self.policy == 'coalesce':
+            pending[key] = message
+        else:
+            pending.append(message)
+        if not self._workers:
+            self._start()
+        self._ready.set()
+        return True
+
+    def _pop(self):
+        if self.policy == 'coalesce':
+            return self._pending.pop(next(iter(self._pending)))
+        return self._pending.popleft()
+
+    def _start(self):
+        self._ready = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def _worker(self):
+        while True:
+            if not self._pending:
+                if self._retired:
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            await self._run(self._pop())
+
+    async def _run(self, message):
+        stats = self.stats
+        start = time.perf_counter()
+        try:
+            call = self.func(message)
+            if self.profiler is not None and self.profiler.enabled:
+                call = self.profiler.run(self.name, call)
+            if self.timeout:
+                await asyncio.wait_for(call, self.timeout)
+            else:
+                await call
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            logger.warning(f"Message listener {self.name} timed out after {self.timeout}s")
+        except Exception as e:
+            stats.errors += 1
+            logger.error(f"Error in message listener {self.name}: {str(e)}")
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.calls += 1
+            stats.total_time += elapsed
+            if self.latency is not None:
+                self.latency.observe(elapsed)
+            if elapsed > stats.max_time:
+                stats.max_time = elapsed
+
+    def retire(self):
+        """Let the workers finish what is queued and then exit"""
+        self._retired = True
+        if self._ready is not None:
+            self._ready.set()
+
+    async def close(self):
+        """Cancel the workers; queued messages are discarded"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._pending.clear()
+
+
+class ListenerEngine:
+    """Runs message listeners concurrently, isolated from the IRC read loop.
+
+    The bot's message_listeners list stays the source of truth for which
+    listeners are active; functions appended to it directly run with the
+    default options, and configure() sets per-listener options.
+    """
+
+    def __init__(self, listeners, **defaults):
+        self.listeners = listeners
+        self.defaults = defaults
+        self._engines = {}
+        # Histogram shared by every listener's call durations, if set
+        self.latency = None
+        # Profiler shared by every listener, if set
+        self.profiler = None
+
+    def configure(self, func, **options):
+        """Set concurrency/timeout/queue_size/policy/key for a listener"""
+        old = self._engines.pop(func, None)
+        if old is not None:
+            old.retire()
+        listener = Listener(func, **{'latency': self.latency, 'profiler': self.profiler,
+                                     **self.defaults, **options})
+        self._engines[func] = listener
+        return listener
+
+    def dispatch(self, message):
+        """Hand a message to every active listener without awaiting any of them"""
+        engines = self._engines
+        for func in self.listeners:
+            listener = engines.get(func)
+            if listener is None:
+                listener = self.configure(func)
+            listener.offer(message)
+
+    def retire(self, func):
+        """Stop a removed listener once its queued messages have been handled"""
+        listener = self._engines.pop(func, None)
+        if listener is not None:
+            listener.retire()
+
+    def stats(self):
+        """Per-listener counters keyed by listener name"""
+        data = {}
+        for listener in self._engines.values():
+            data[listener.name] = {**listener.stats.as_dict(), 'queued': listener.queued}
+        return data
+
+    async def close(self):
+        await asyncio.gather(*(listener.close() for listener in self._engines.values()))
+        self._engines = {}
@@ -0,0 +1,275 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from openai import AsyncOpenAI
+from send_queue import MAX_MESSAGE_LENGTH
+
+logger = logging.getLogger('twitch_bot')
+
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+# Completions running at once; the rest wait their turn
+MAX_CONCURRENCY = 4
+# Seconds a finished answer is reused for the same prompt
+CACHE_TTL = 600.0
+CACHE_SIZE = 500
+# Longest chat message a streamed answer is cut into
+CHUNK_LENGTH = MAX_MESSAGE_LENGTH - 50
+# Once this many seconds pass with text waiting, a finished sentence goes out without filling the chunk
+FLUSH_AFTER = 1.5
+
+_SENTENCE_END = re.compile(r'[.!?…](?=\s|$)')
+
+
+def _normalize(text):
+    return ' '.join(text.split()).lower()
+
+
+def split_chunk(text, limit):
+    """Split text into (chunk, rest) at the last sentence end or space within limit"""
+    if len(text) <= limit:
+        return text, ''
+    head = text[:limit + 1]
+    ends = [match.end() for match in _SENTENCE_END.finditer(head)]
+    cut = ends[-1] if ends else head.rfind(' ')
+    if cut <= 0:
+        cut = limit
+    return text[:cut].rstrip(), text[cut:].lstrip()
+
+
+class Generation:
+    """One completion being streamed, shared by every caller asking the same prompt.
+
+    Text arrives in ``parts``; followers wait on ``changed`` for more. The
+    task is cancelled once nobody follows it any more.
+    """
+
+    __slots__ = ('key', 'parts', 'task', 'followers', 'changed', 'error')
+
+    def __init__(self, key):
+        self.key = key
+        self.parts = []
+        self.task = None
+        self.followers = 0
+        self.changed = asyncio.Event()
+        self.error = None
+
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    @property
+    def text(self):
+        return ''.join(self.parts)
+
+
+class LLMService:
+    """Async chat completions for commands.
+
+    Completions run on the async OpenAI client, at most max_concurrency at
+    a time. Callers asking the same prompt share one streamed completion,
+    finished answers are cached by normalized prompt, and a new request with
+    the same ``key`` (e.g. a user repeating a command) cancels the previous
+    one. ``client`` is created on first use from OPENAI_API_KEY and
+    OPENAI_BASE_URL, so a mock server can stand in for the API.
+    """
+
+    def __init__(self, client=None, model=OPENAI_MODEL, max_concurrency=MAX_CONCURRENCY,
+                 cache_ttl=CACHE_TTL, cache_size=CACHE_SIZE, timeout=30.0, clock=time.monotonic):
+        self._client = client
+        self.model = model
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.clock = clock
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._cache = OrderedDict()
+        self._generations = {}
+        self._active = {}
+        # Metrics
+        self.requests = 0
+        self.cache_hits = 0
+        self.deduplicated = 0
+        self.cancelled = 0
+        self.errors = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = AsyncOpenAI(timeout=self.timeout)
+        return self._client
+
+    def _cache_key(self, prompt, system, max_tokens):
+        return self.model, system, _normalize(prompt), max_tokens
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= self.clock():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[0]
+
+    def _store(self, key, text):
+        self._cache[key] = (text, self.clock() + self.cache_ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def stream(self, prompt, system=None, max_tokens=200):
+        """Yield the answer to a prompt as text deltas arrive"""
+        cache_key = self._cache_key(prompt, system, max_tokens)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            self.cache_hits += 1
+            yield cached
+            return
+
+        generation = self._generations.get(cache_key)
+        if generation is None:
+            generation = self._generations[cache_key] = Generation(cache_key)
+            generation.task = asyncio.ensure_future(self._generate(generation, prompt, system, max_tokens))
+        else:
+            self.deduplicated += 1
+        generation.followers += 1
+        try:
+            index = 0
+            while True:
+                while index < len(generation.parts):
+                    index += 1
+                    yield generation.parts[index - 1]
+                if generation.task.done():
+                    break
+                await generation.changed.wait()
+            if generation.error is not None:
+                raise generation.error
+        finally:
+            generation.followers -= 1
+            if generation.followers == 0 and not generation.task.done():
+                self.cancelled += 1
+                generation.task.cancel()
+
+    async def complete(self, prompt, system=None, key=None, max_tokens=200):
+        """Return the whole answer to a prompt, or None if a newer request with the same key replaced it"""
+        async def collect():
+            return ''.join([part async for part in self.stream(prompt, system, max_tokens)])
+        return await self._run_keyed(key, collect())
+
+    async def stream_to_chat(self, send, prompt, system=None, key=None, max_tokens=200,
+                             chunk_length=CHUNK_LENGTH, flush_after=FLUSH_AFTER):
+        """Stream an answer into chat messages through ``await send(text)``.
+
+        Text goes out in chunks of up to chunk_length, split at sentence ends
+        or spaces. Returns the number of messages sent, or None if a newer
+        request with the same key replaced this one.
+        """
+        return await self._run_keyed(key, self._send_chunks(send, prompt, system, max_tokens,
+                                                            chunk_length, flush_after))
+
+    async def reply(self, ctx, prompt, system=None, max_tokens=200):
+        """Answer a command in chat; the author repeating the command cancels the earlier answer"""
+        key = (getattr(ctx.command, 'name', None), ctx.channel.name, ctx.author.name)
+        return await self.stream_to_chat(ctx.send, prompt, system, key, max_tokens)
+
+    async def _send_chunks(self, send, prompt, system, max_tokens, chunk_length, flush_after):
+        buffer = ''
+        waiting_since = None
+        sent = 0
+        async for part in self.stream(prompt, system, max_tokens):
+            buffer += part
+            if waiting_since is None:
+                waiting_since = self.clock()
+            while len(buffer) > chunk_length:
+                chunk, buffer = split_chunk(buffer, chunk_length)
+                await send(chunk)
+                sent += 1
+                waiting_since = self.clock() if buffer else None
+            if waiting_since is not None and self.clock() - waiting_since >= flush_after:
+                ends = [match.end() for match in _SENTENCE_END.finditer(buffer)]
+                if ends:
+                    chunk, buffer = buffer[:ends[-1]].strip(), buffer[ends[-1]:].lstrip()
+                    await send(chunk)
+                    sent += 1
+                    waiting_since = self.clock() if buffer else None
+        if buffer.strip():
+            await send(buffer.strip())
+            sent += 1
+        return sent
+
+    async def _run_keyed(self, key, coro):
+        """Run coro in its own task, cancelling the task still running for the same key"""
+        task = asyncio.ensure_future(coro)
+        if key is None:
+            return await task
+        # The new task is scheduled before the old one sees its cancellation, so a
+        # repeated prompt joins the running generation before the old follower leaves it
+        previous = self._active.get(key)
+        self._active[key] = task
+        if previous is not None and not previous.done():
+            logger.debug("Cancelling superseded LLM request for %s", key)
+            previous.cancel()
+        try:
+            # wait() leaves the task alone if the caller itself is cancelled; handled below
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if self._active.get(key) is task:
+                del self._active[key]
+        if task.cancelled():
+            return None
+        return task.result()
+
+    async def _generate(self, generation, prompt, system, max_tokens):
+        messages = [{'role': 'system', 'content': system}] if system else []
+        messages.append({'role': 'user', 'content': prompt})
+        try:
+            async with self._semaphore:
+                self.requests += 1
+                stream = await self.client.chat.completions.create(
+                    model=self.model, messages=messages, max_tokens=max_tokens, stream=True)
+                try:
+                    async for event in stream:
+                        if not event.choices:
+                            continue
+                        delta = event.choices[0].delta.content
+                        if delta:
+                            generation.parts.append(delta)
+                            generation.notify()
+                finally:
+                    await stream.close()
+            self._store(generation.key, generation.text)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"LLM request failed: {str(e)}")
+            generation.error = e
+        finally:
+            if self._generations.get(generation.key) is generation:
+                del self._generations[generation.key]
+            generation.notify()
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'inflight': len(self._generations),
+            'cache_hits': self.cache_hits,
+            'cache_size': len(self._cache),
+            'deduplicated': self.deduplicated,
+            'cancelled': self.cancelled,
+            'errors': self.errors
+        }
+
+    async def close(self):
+        tasks = [generation.task for generation in self._generations.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.close()
@@ -1,21 +1,18 @@
 import os
 import logging
-import importlib
-import pkgutil
 from dotenv import load_dotenv
-import commands
 from bot import CustomBot
-from twitch_auth import validate_token_sync, get_auth_credentials
-import importlib.util
+from command_loader import CommandLoader
+from twitch_auth import validate_token_sync, get_auth_credentials, token_manager
+from bot_logging import setup_logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging: records are queued and written by a background thread
+setup_logging()
 logger = logging.getLogger('twitch_bot')
 
 def load_credentials():
     """Load authentication credentials from environment variables"""
-    load_dotenv()
+    load_dotenv(os.getenv('ENV_FILE'))
     
     return {
         'bot_username': os.getenv('BOT_USERNAME'),
@@ -29,34 +26,14 @@ def load_credentials():
 def load_commands(bot):
     """Dynamically load all command modules"""
     logger.info("Loading command modules...")
-    commands_dir = os.path.join(os.path.dirname(__file__), 'commands')
+    # LAZY_COMMANDS=0 imports every module up front instead of on first use
+    lazy = os.getenv('LAZY_COMMANDS', '1').lower() not in ('0', 'false', 'no')
+    loader = CommandLoader(bot, lazy=lazy)
+    loader.load_all()
     
-    # Iterate through all command directories
-    for item in os.listdir(commands_dir):
-        command_dir = os.path.join(commands_dir, item)
-        if os.path.isdir(command_dir) and not item.startswith('__'):
-            # Look for command.py in each directory
-            command_file = os.path.join(command_dir, 'command.py')
-            if os.path.exists(command_file):
-                try:
-                    # Import the module
-                    spec = importlib.util.spec_from_file_location(
-                        f"commands.{item}.command", command_file)
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    
-                    # Find the command class
-                    for attr_name in dir(module):
-                        attr = getattr(module, attr_name)
-                        if (isinstance(attr, type) and 
-                            issubclass(attr, commands.BotCommand) and 
-                            attr != commands.BotCommand):
-                            # Instantiate the command handler
-                            attr(bot)
-                            logger.info(f"Loaded command module: {item}")
-                            break
-                except Exception as e:
-                    logger.error(f"Failed to load command module {item}: {str(e)}")
+    # Build the dispatch index from everything that registered
+    bot.command_router.rebuild(bot.commands)
+    return loader
 
 def main():
     # Validate and refresh token before starting the bot
@@ -69,11 +46,22 @@ def main():
         logger.error("Failed to validate or refresh token. Please run twitch_oauth_setup.py to get new tokens.")
         return
     
+    # WORKERS=N runs N bot processes, each serving a share of the channels
+    workers = int(os.getenv('WORKERS', '1'))
+    if workers > 1:
+        from supervisor import run_supervisor
+        run_supervisor(auth_creds, workers, token_manager=token_manager)
+        return
+    
     # Initialize the bot with the validated credentials
-    bot = CustomBot(auth_creds)
+    bot = CustomBot(auth_creds, token_manager=token_manager)
     
     # Load command modules
-    load_commands(bot)
+    loader = load_commands(bot)
+    
+    # HOT_RELOAD=1 reloads changed command modules without restarting the bot
+    if os.getenv('HOT_RELOAD', '').lower() in ('1', 'true', 'yes'):
+        loader.start_watching(float(os.getenv('HOT_RELOAD_INTERVAL', '1.0')))
     
     # Start the bot
     logger.info("Starting bot...")
@@ -0,0 +1,254 @@
+import os
+import time
+import asyncio
+import bisect
+import logging
+from aiohttp import web
+
+logger = logging.getLogger('twitch_bot')
+
+# Seconds; suits everything from a dict lookup to a slow Helix call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# How often the event-loop lag monitor wakes up
+LAG_INTERVAL = 0.5
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Counter:
+    """Monotonic count. Updates are a plain attribute add on the loop thread, so they need no lock."""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class Histogram:
+    """Counts per fixed bucket; observe() is a bisect and two adds, allocating nothing"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """A named metric family, optionally split by label values.
+
+    labels(*values) returns the child for those values, creating it the
+    first time; hot paths look their child up once and keep it (labels()
+    with no values gives an unlabelled metric's only child). With a single
+    label the child is keyed by the bare value, so no tuple is built.
+    """
+
+    def __init__(self, kind, name, documentation, labelnames=(), factory=None, function=None):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.function = function
+        self._children = {}
+        self._single = None
+        if function is None and not self.labelnames:
+            self._single = factory()
+
+    def labels(self, *values):
+        if not values and self._single is not None:
+            return self._single
+        key = values[0] if len(values) == 1 else values
+        child = self._children.get(key)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            child = self._children[key] = self.factory()
+        return child
+
+    # The unlabelled metric is used directly
+    def inc(self, amount=1):
+        self._single.inc(amount)
+
+    def set(self, value):
+        self._single.set(value)
+
+    def observe(self, value):
+        self._single.observe(value)
+
+    def _label_text(self, key, extra=None):
+        pairs = []
+        if key is not None:
+            values = (key,) if len(self.labelnames) == 1 else key
+            pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def _samples(self):
+        if self.function is not None:
+            value = self.function()
+            if isinstance(value, dict):
+                return [(key, value[key]) for key in value]
+            return [(None, value)]
+        if self._single is not None:
+            return [(None, self._single)]
+        return list(self._children.items())
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, sample in self._samples():
+            labels = self._label_text(key)
+            if self.kind != 'histogram':
+                value = sample.value if isinstance(sample, (Counter, Gauge)) else sample
+                lines.append(f'{self.name}{labels} {_format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(tuple(sample.bounds) + (float('inf'),), sample.counts):
+                cumulative += count
+                bucket = self._label_text(key, 'le="%s"' % _format_value(bound))
+                lines.append(f'{self.name}_bucket{bucket} {cumulative}')
+            lines.append(f'{self.name}_sum{labels} {_format_value(sample.sum)}')
+            lines.append(f'{self.name}_count{labels} {sample.count}')
+        return lines
+
+
+class Registry:
+    """The bot's metrics, exposed in the Prometheus text format.
+
+    Function metrics read a value (or a {label: value} dict) at scrape time,
+    so counters the bot already keeps cost nothing extra per event.
+    """
+
+    def __init__(self, prefix='twitch_bot_'):
+        self.prefix = prefix
+        self._metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), function=None):
+        return self._add(Metric('counter', self.prefix + name, documentation, labelnames, Counter, function))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self._add(Metric('gauge', self.prefix + name, documentation, labelnames, Gauge, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Metric('histogram', self.prefix + name, documentation, labelnames,
+                                lambda: Histogram(buckets)))
+
+    def get(self, name):
+        return self._metrics.get(self.prefix + name)
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.expose())
+            except Exception as e:
+                logger.error(f"Could not collect metric {metric.name}: {str(e)}")
+        return '\n'.join(lines) + '\n'
+
+
+class LagMonitor:
+    """Measures how late the event loop wakes a sleeping task"""
+
+    def __init__(self, histogram, gauge=None, interval=LAG_INTERVAL):
+        self.histogram = histogram
+        self.gauge = gauge
+        self.interval = interval
+        self._task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.histogram.observe(lag)
+            if self.gauge is not None:
+                self.gauge.set(lag)
+
+    def start(self, loop=None):
+        loop = loop or asyncio.get_event_loop()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self.run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class MetricsServer:
+    """Serves GET /metrics from a registry on a local port"""
+
+    def __init__(self, registry, host=None, port=None):
+        self.registry = registry
+        self.host = host or os.getenv('METRICS_HOST', '127.0.0.1')
+        self.port = int(port if port is not None else os.getenv('METRICS_PORT', '9108'))
+        self._runner = None
+        self.scrapes = 0
+
+    async def handle(self, request):
+        self.scrapes += 1
+        start = time.perf_counter()
+        body = self.registry.expose()
+        logger.debug("Metrics scrape took %.2fms", (time.perf_counter() - start) * 1000)
+        return web.Response(body=body.encode('utf-8'),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,398 @@
+import re
+import json
+import asyncio
+import logging
+import unicodedata
+from collections import deque
+from chatters import PRIVILEGED
+
+logger = logging.getLogger('twitch_bot')
+
+ACTIONS = ('delete', 'timeout', 'ban')
+# Stronger actions win when a message matches several rules
+_SEVERITY = {'delete': 0, 'timeout': 1, 'ban': 2}
+# Moderation actions collected for this long are sent together
+BATCH_WINDOW = 0.05
+# Helix moderation requests in flight at once
+MAX_CONCURRENCY = 10
+
+# Look-alike characters folded onto the ASCII letter they imitate
+CONFUSABLES = {
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b', '9': 'g',
+    '@': 'a', '$': 's', '€': 'e', '£': 'l',
+    # Cyrillic and Greek letters that render like Latin ones
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p',
+    'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'і': 'i', 'ї': 'i', 'ј': 'j', 'ѕ': 's', 'ԁ': 'd',
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p',
+    'τ': 't', 'υ': 'u', 'χ': 'x',
+}
+# Invisible characters used to split a word past a filter
+ZERO_WIDTH = '​‌‍⁠﻿­\U000e0000'
+
+_TRANSLATION = str.maketrans({**CONFUSABLES, **{char: None for char in ZERO_WIDTH}})
+_INVISIBLE = str.maketrans({char: None for char in ZERO_WIDTH})
+_REPEATS = re.compile(r'(.)\1{2,}')
+# Numbered or named backreferences and group conditionals; a false positive only costs a separate search
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+
+def normalize(text):
+    """Fold a message onto plain lowercase ASCII-ish text for term matching.
+
+    Compatibility forms and accents are removed, look-alike characters
+    mapped to the letter they imitate, invisible characters dropped, runs
+    of whitespace collapsed and runs of three or more of a character
+    shortened to two.
+    """
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = ' '.join(text.lower().translate(_TRANSLATION).split())
+    return _REPEATS.sub(r'\1\1', text)
+
+
+def clean(text):
+    """Lightly normalize a message for pattern matching.
+
+    Only compatibility forms, case and invisible characters are folded, so
+    digits, symbols such as @ and $, and spacing stay as they were sent.
+    """
+    if text.isascii():
+        return text.lower()
+    return unicodedata.normalize('NFKC', text).casefold().translate(_INVISIBLE)
+
+
+class Rule:
+    """A banned term or pattern and what to do about a message containing it.
+
+    A term is matched as a whole word of the normalized message unless
+    word is False; a pattern is a case-insensitive regex run against the
+    cleaned message, which keeps digits and symbols.
+    """
+
+    __slots__ = ('term', 'pattern', 'action', 'duration', 'reason', 'word')
+
+    def __init__(self, term=None, pattern=None, action='delete', duration=600, reason=None, word=True):
+        if (term is None) == (pattern is None):
+            raise ValueError("A moderation rule needs exactly one of term or pattern")
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown moderation action: {action}")
+        self.term = normalize(term) if term is not None else None
+        if pattern is not None:
+            _check_pattern(pattern)
+        self.pattern = pattern
+        self.action = action
+        self.duration = duration
+        self.reason = reason or f"Matched {'term' if term is not None else 'pattern'}: {term or pattern}"
+        self.word = word
+
+    def stronger_than(self, other):
+        if other is None or _SEVERITY[self.action] != _SEVERITY[other.action]:
+            return other is None or _SEVERITY[self.action] > _SEVERITY[other.action]
+        return self.action == 'timeout' and self.duration > other.duration
+
+    def __repr__(self):
+        return f"Rule({self.term or self.pattern!r}, action={self.action!r})"
+
+
+def _strength(rule):
+    """Sort key agreeing with Rule.stronger_than"""
+    return _SEVERITY[rule.action], rule.duration if rule.action == 'timeout' else 0
+
+
+def _check_pattern(pattern):
+    """Reject patterns that are invalid or match every message; warn about ones that can never match"""
+    try:
+        compiled = re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid moderation pattern {pattern!r}: {e}") from None
+    if compiled.search('') is not None:
+        raise ValueError(f"Moderation pattern {pattern!r} matches every message")
+    # Characters clean() removes or rewrites never reach the pattern
+    lost = sorted({char for char in pattern if clean(char) not in (char, char.lower())})
+    if lost:
+        logger.warning(f"Moderation pattern {pattern!r} can never match {''.join(lost)!r}: "
+                       f"messages are NFKC-normalized, casefolded and stripped of invisible characters")
+
+
+class Automaton:
+    """Aho–Corasick automaton over many terms; one pass finds all of them.
+
+    Node n's transitions are ``goto[n]``, its failure link ``fail[n]`` and
+    the values of terms ending there (directly or through failure links)
+    ``output[n]``.
+    """
+
+    def __init__(self, items=()):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for term, value in items:
+            self.add(term, value)
+        self.build()
+
+    def add(self, term, value):
+        node = 0
+        for char in term:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+            node = next_node
+        self.output[node] = self.output[node] + ((len(term), value),)
+
+    def build(self):
+        """Compute failure links breadth first"""
+        goto, fail, output = self.goto, self.fail, self.output
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                # Children of the root fail back to the root
+                fail[child] = goto[state].get(char, 0) if node else 0
+                if output[fail[child]]:
+                    output[child] = output[child] + output[fail[child]]
+
+    def __len__(self):
+        return len(self.goto)
+
+    def search(self, text):
+        """Yield (start, end, value) for every term occurring in text"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                for length, value in output[state]:
+                    yield index + 1 - length, index + 1, value
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+class RuleSet:
+    """Rules compiled for one pass per message.
+
+    Terms share an Aho–Corasick automaton, so their cost per message grows
+    with its length rather than with the number of rules. Patterns are
+    joined into a single alternation used as a filter: most messages match
+    none and are passed over in one search, and a message that does match
+    is checked against each pattern, strongest first, so the strongest
+    rule it breaks wins. Patterns with backreferences keep their group
+    numbering only on their own and are always checked separately.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        terms = [rule for rule in self.rules if rule.term]
+        patterns = sorted((rule for rule in self.rules if rule.pattern), key=_strength, reverse=True)
+        self.automaton = Automaton((rule.term, rule) for rule in terms)
+        self._patterns = [(rule, re.compile(rule.pattern, re.IGNORECASE)) for rule in patterns]
+        self._separate = [(rule, regex) for rule, regex in self._patterns if _BACKREFERENCE.search(rule.pattern)]
+        self._filter = None
+        joined = [rule.pattern for rule, regex in self._patterns if not _BACKREFERENCE.search(rule.pattern)]
+        if joined:
+            try:
+                self._filter = re.compile('|'.join(f'(?:{pattern})' for pattern in joined), re.IGNORECASE)
+            except re.error as e:
+                # Named groups repeated across rules; check every pattern on its own
+                logger.warning(f"Moderation patterns cannot be combined ({e}), checking them one by one")
+                self._separate = self._patterns
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, text):
+        """Return the strongest rule the text breaks, or None"""
+        best = None
+        if len(self.automaton) > 1:
+            # Look-alike folding is for terms only; patterns see the digits and symbols
+            folded = normalize(text)
+            length = len(folded)
+            for start, end, rule in self.automaton.search(folded):
+                if rule.word and ((start and _is_word_char(folded[start - 1]))
+                                  or (end < length and _is_word_char(folded[end]))):
+                    continue
+                if rule.stronger_than(best):
+                    best = rule
+        if self._patterns:
+            cleaned = clean(text)
+            candidates = self._separate
+            if self._filter is not None and self._filter.search(cleaned):
+                candidates = self._patterns
+            # Strongest first: the first match, or the first rule no stronger than best, ends the scan
+            for rule, regex in candidates:
+                if not rule.stronger_than(best):
+                    break
+                if regex.search(cleaned):
+                    best = rule
+                    break
+        return best
+
+
+def load_rules(path):
+    """Read rules from a JSON list of rule objects, or a text file of one term per line"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            return [Rule(**entry) for entry in json.load(f)]
+        return [Rule(term=line.strip()) for line in f if line.strip() and not line.startswith('#')]
+
+
+class ModerationAction:
+    __slots__ = ('action', 'broadcaster_id', 'user_id', 'message_id', 'duration', 'reason')
+
+    def __init__(self, action, broadcaster_id, user_id, message_id=None, duration=None, reason=None):
+        self.action = action
+        self.broadcaster_id = broadcaster_id
+        self.user_id = user_id
+        self.message_id = message_id
+        self.duration = duration
+        self.reason = reason
+
+
+class ActionBatcher:
+    """Collects moderation actions for a short window and sends them through Helix together.
+
+    Within a batch, a timeout or ban of a user replaces that user's message
+    deletions (Twitch clears their messages anyway), repeated timeouts of a
+    user collapse into the longest one, and requests run max_concurrency at
+    a time. ``transport(action)`` performs one Helix call.
+    """
+
+    def __init__(self, transport, window=BATCH_WINDOW, max_concurrency=MAX_CONCURRENCY):
+        self.transport = transport
+        self.window = window
+        self.max_concurrency = max_concurrency
+        self._pending = []
+        self._flush = None
+        self._tasks = set()
+        # Metrics
+        self.queued = 0
+        self.sent = 0
+        self.merged = 0
+        self.failed = 0
+
+    def submit(self, action):
+        self.queued += 1
+        self._pending.append(action)
+        if self._flush is None:
+            self._flush = asyncio.get_running_loop().call_later(self.window, self._start_flush)
+
+    def _start_flush(self):
+        self._flush = None
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._send(self._merge(batch)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _merge(self, batch):
+        strongest = {}
+        deletions = []
+        for action in batch:
+            key = (action.broadcaster_id, action.user_id)
+            if action.action == 'delete':
+                deletions.append(action)
+                continue
+            current = strongest.get(key)
+            if current is None or _SEVERITY[action.action] > _SEVERITY[current.action] or (
+                    action.action == current.action and (action.duration or 0) > (current.duration or 0)):
+                strongest[key] = action
+        actions = list(strongest.values())
+        actions += [action for action in deletions
+                    if (action.broadcaster_id, action.user_id) not in strongest]
+        self.merged += len(batch) - len(actions)
+        return actions
+
+    async def _send(self, actions):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def send(action):
+            async with semaphore:
+                try:
+                    response = await self.transport(action)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Moderation {action.action} for user {action.user_id} failed: {str(e)}")
+                    return
+                if response.ok:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                    logger.error(f"Moderation {action.action} for user {action.user_id} failed: "
+                                 f"{response.status_code} {response.text}")
+
+        await asyncio.gather(*(send(action) for action in actions))
+
+    def stats(self):
+        return {'queued': self.queued, 'sent': self.sent, 'merged': self.merged, 'failed': self.failed,
+                'pending': len(self._pending)}
+
+    async def close(self):
+        if self._flush is not None:
+            self._flush.cancel()
+            self._flush = None
+            self._start_flush()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class ModerationEngine:
+    """Message listener that checks chat against a RuleSet and acts on matches.
+
+    Register it with bot.add_message_listener(engine). Moderators, the
+    broadcaster and VIPs are exempt unless exempt_privileged is False; their
+    roles come from the ChatterRegistry given as chatters, or from the tags.
+    """
+
+    def __init__(self, rules, actions, exempt_privileged=True, chatters=None):
+        self.rules = rules if isinstance(rules, RuleSet) else RuleSet(rules)
+        self.actions = actions
+        self.exempt_privileged = exempt_privileged
+        self.chatters = chatters
+        self.checked = 0
+        self.matched = 0
+
+    def check(self, text):
+        return self.rules.match(text)
+
+    def _exempt(self, message):
+        if self.chatters is not None:
+            chatter = self.chatters.observe(message)
+            return chatter is not None and bool(chatter.roles & PRIVILEGED)
+        badges = (message.tags or {}).get('badges') or ''
+        return bool(getattr(message.author, 'is_mod', False)) or any(
+            badge.startswith(('broadcaster/', 'vip/')) for badge in badges.split(','))
+
+    async def __call__(self, message):
+        # Whispers have no channel to moderate
+        if message.channel is None:
+            return None
+        self.checked += 1
+        if self.exempt_privileged and self._exempt(message):
+            return None
+        rule = self.rules.match(message.content or '')
+        if rule is None:
+            return None
+        self.matched += 1
+        tags = message.tags or {}
+        logger.info(f"Moderation: {rule.action} for {message.author.name} in #{message.channel.name} ({rule.reason})")
+        self.actions.submit(ModerationAction(
+            rule.action, tags.get('room-id'), message.author.id,
+            message_id=message.id if rule.action == 'delete' else None,
+            duration=rule.duration if rule.action == 'timeout' else None,
+            reason=rule.reason
+        ))
+        return rule
+
+    def stats(self):
+        return {'rules': len(self.rules), 'checked': self.checked, 'matched': self.matched,
+                **self.actions.stats()}
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""Provision or rotate OAuth credentials for many bot accounts without prompts.
+
+    python oauth_provision.py accounts.json [--store credentials] [--no-browser]
+    python oauth_provision.py --rotate [--store credentials]
+
+accounts.json lists the accounts to authorize:
+
+    [{"bot_username": "mybot", "channel_name": "mychannel"}, ...]
+
+CLIENT_ID and CLIENT_SECRET come from the environment or .env. Every
+account's authorization URL is opened (or only logged, with --no-browser);
+a local server on the redirect URI (http://localhost:3000) captures each
+code as it arrives, and tokens are exchanged, validated and written to
+<store>/<login>.env. Run a bot from one of them with ENV_FILE=<that path>.
+--rotate refreshes every stored account's tokens instead.
+"""
+import os
+import re
+import sys
+import json
+import asyncio
+import logging
+import secrets
+import argparse
+import webbrowser
+from urllib.parse import urlencode
+from aiohttp import web
+from dotenv import dotenv_values, load_dotenv
+from http_client import HttpClient, OAUTH_URL
+from token_manager import TokenManager, write_env
+
+logger = logging.getLogger('twitch_bot')
+
+# Must match an OAuth Redirect URL registered for the app
+REDIRECT_HOST = 'localhost'
+REDIRECT_PORT = 3000
+REDIRECT_URI = f'http://{REDIRECT_HOST}:{REDIRECT_PORT}'
+SCOPES = ('chat:read', 'chat:edit', 'channel:moderate', 'moderator:manage:chat_messages',
+          'moderator:manage:banned_users', 'moderator:read:followers', 'whispers:edit', 'whispers:read',
+          'user:manage:whispers')
+# The bot does not work without these
+REQUIRED_SCOPES = ('chat:read', 'chat:edit', 'channel:moderate')
+# Seconds to wait for an account to be authorized in the browser
+AUTHORIZE_TIMEOUT = 300
+# Token exchanges and validations in flight at once
+PROVISION_CONCURRENCY = 10
+CREDENTIALS_DIR = os.path.join(os.path.dirname(__file__), 'credentials')
+# Twitch logins; also keeps credential file names inside the store
+LOGIN_PATTERN = re.compile(r'^[a-z0-9_]{1,25}$')
+
+
+class ProvisionError(Exception):
+    """An account could not be authorized, exchanged or validated"""
+
+
+def error_fields(body):
+    """The status and error fields of an OAuth response, leaving out anything that may be a credential"""
+    if not isinstance(body, dict):
+        return {}
+    return {key: body[key] for key in ('status', 'error', 'message', 'error_description') if key in body}
+
+
+def authorize_url(client_id, redirect_uri=REDIRECT_URI, state=None, scopes=SCOPES):
+    """The URL a bot account opens to grant the app access"""
+    query = {'response_type': 'code', 'client_id': client_id, 'redirect_uri': redirect_uri,
+             'scope': ' '.join(scopes), 'force_verify': 'true'}
+    if state:
+        query['state'] = state
+    return f"{OAUTH_URL}/authorize?{urlencode(query)}"
+
+
+class CallbackServer:
+    """Serves the redirect URI and hands each authorization code to whoever expects its state.
+
+    Any number of authorizations can be pending at once; the state parameter
+    tells their redirects apart and rejects ones this server did not ask for.
+    """
+
+    def __init__(self, host=REDIRECT_HOST, port=REDIRECT_PORT):
+        self.host = host
+        self.port = port
+        self.redirect_uri = f'http://{host}:{port}'
+        self._pending = {}
+        self._runner = None
+        # Metrics
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Port 0 picks a free port, as the benchmarks do
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.redirect_uri = f'http://{self.host}:{self.port}'
+        return self.redirect_uri
+
+    def expect(self, state=None):
+        """A state parameter (new unless given) whose redirect wait() will return"""
+        state = state or secrets.token_urlsafe(16)
+        self._pending[state] = asyncio.get_running_loop().create_future()
+        return state
+
+    async def wait(self, state, timeout=AUTHORIZE_TIMEOUT):
+        """The authorization code for state, or ProvisionError if denied or not authorized in time"""
+        try:
+            return await asyncio.wait_for(self._pending[state], timeout)
+        except asyncio.TimeoutError:
+            raise ProvisionError(f"Not authorized within {timeout:.0f}s") from None
+        finally:
+            self._pending.pop(state, None)
+
+    async def handle(self, request):
+        query = request.query
+        future = self._pending.get(query.get('state'))
+        if future is None or future.done():
+            self.rejected += 1
+            return web.Response(status=400, text="Unknown or expired authorization request.")
+        self.received += 1
+        if 'code' not in query:
+            error = query.get('error_description') or query.get('error') or 'no authorization code'
+            future.set_exception(ProvisionError(f"Authorization denied: {error}"))
+            return web.Response(text="Authorization was denied. You can close this tab.")
+        future.set_result(query['code'])
+        return web.Response(text="Authorized. You can close this tab.")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def capture_code(url, state, host=REDIRECT_HOST, port=REDIRECT_PORT, timeout=AUTHORIZE_TIMEOUT,
+                 open_url=webbrowser.open):
+    """Open url and wait for its redirect on the callback server, from synchronous code"""
+    async def run():
+        server = CallbackServer(host, port)
+        await server.start()
+        try:
+            server.expect(state)
+            open_url(url)
+            return await server.wait(state, timeout)
+        finally:
+            await server.stop()
+    return asyncio.run(run())
+
+
+class CredentialStore:
+    """One .env file per bot account, in the format the bot reads (ENV_FILE=<path>)"""
+
+    def __init__(self, directory=CREDENTIALS_DIR):
+        self.directory = directory
+
+    def path(self, login):
+        login = login.lower()
+        if not LOGIN_PATTERN.match(login):
+            raise ProvisionError(f"Not a Twitch login: {login!r}")
+        return os.path.join(self.directory, f'{login}.env')
+
+    def save(self, login, values):
+        """Set values in the account's file atomically, readable by its owner only"""
+        path = self.path(login)
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        write_env(path, values)
+        os.chmod(path, 0o600)
+        return path
+
+    def load(self, login):
+        path = self.path(login)
+        if not os.path.exists(path):
+            raise ProvisionError(f"No stored credentials for {login}")
+        return dotenv_values(path)
+
+    def accounts(self):
+        """Logins with stored credentials"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-len('.env')] for name in os.listdir(self.directory)
+                      if name.endswith('.env') and LOGIN_PATTERN.match(name[:-len('.env')]))
+
+
+def open_in_browser(login, url):
+    logger.info(f"Authorize {login} at: {url}")
+    webbrowser.open(url)
+
+
+def log_url(login, url):
+    logger.info(f"Authorize {login} at: {url}")
+
+
+class Provisioner:
+    """Authorizes bot accounts through one CallbackServer and stores their tokens.
+
+    Authorizations wait on the callback server concurrently; token exchanges
+    and validations share one pooled HttpClient, at most `concurrency` at a
+    time. on_authorize(login, url) gets each account's authorization URL to
+    a browser (or whatever completes the login in tests).
+    """
+
+    def __init__(self, client_id, client_secret, store=None, callback_server=None, http_client=None,
+                 on_authorize=open_in_browser, concurrency=PROVISION_CONCURRENCY,
+                 timeout=AUTHORIZE_TIMEOUT, scopes=SCOPES):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.store = store or CredentialStore()
+        self.callback_server = callback_server or CallbackServer()
+        self.http_client = http_client or HttpClient()
+        self.on_authorize = on_authorize
+        self.timeout = timeout
+        self.scopes = scopes
+        self._limit = asyncio.Semaphore(concurrency)
+        # Metrics
+        self.provisioned = 0
+        self.rotated = 0
+        self.failures = 0
+
+    async def start(self):
+        await self.callback_server.start()
+
+    async def provision(self, account):
+        """Authorize, exchange and validate one account, then store its credentials"""
+        login = account['bot_username'].lower()
+        path = self.store.path(login)
+        state = self.callback_server.expect()
+        self.on_authorize(login, authorize_url(self.client_id, self.callback_server.redirect_uri,
+                                               state, self.scopes))
+        code = await self.callback_server.wait(state, self.timeout)
+        async with self._limit:
+            tokens = await self._exchange(code)
+            identity = await self._validate(tokens['access_token'])
+        if identity.get('login') != login:
+            raise ProvisionError(f"Authorized as {identity.get('login')}, not {login}; "
+                                 f"log in to the right account and try again")
+        missing = [scope for scope in REQUIRED_SCOPES if scope not in tokens.get('scope', [])]
+        if missing:
+            logger.warning(f"{login} did not grant {', '.join(missing)}; the bot may not work correctly")
+        self.store.save(login, {
+            'BOT_USERNAME': login,
+            'CHANNEL_NAME': account.get('channel_name') or login,
+            'CLIENT_ID': self.client_id,
+            'CLIENT_SECRET': self.client_secret,
+            'ACCESS_TOKEN': tokens['access_token'],
+            'REFRESH_TOKEN': tokens['refresh_token'],
+        })
+        self.provisioned += 1
+        logger.info(f"Provisioned {login} (user ID {identity.get('user_id')}) into {path}")
+        return identity
+
+    async def _exchange(self, code):
+        try:
+            response = await self.http_client.post(f'{OAUTH_URL}/token', data={
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'code': code,
+                'grant_type': 'authorization_code',
+                'redirect_uri': self.callback_server.redirect_uri
+            })
+            response.raise_for_status()
+            tokens = response.json()
+        except Exception as e:
+            raise ProvisionError(f"Token exchange failed: {str(e)}") from e
+        if 'access_token' not in tokens or 'refresh_token' not in tokens:
+            raise ProvisionError(f"Token exchange returned no tokens: {error_fields(tokens)}")
+        return tokens
+
+    async def _validate(self, access_token):
+        try:
+            response = await self.http_client.get(f'{OAUTH_URL}/validate', headers={
+                'Authorization': f'Bearer {access_token}'
+            })
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            raise ProvisionError(f"Token validation failed: {str(e)}") from e
+
+    async def rotate(self, login):
+        """Refresh a stored account's tokens and check they still belong to it"""
+        values = self.store.load(login)
+        manager = TokenManager(values.get('CLIENT_ID') or self.client_id,
+                               values.get('CLIENT_SECRET') or self.client_secret,
+                               values.get('ACCESS_TOKEN'), values.get('REFRESH_TOKEN'),
+                               http_client=self.http_client, env_path=self.store.path(login))
+        async with self._limit:
+            # TokenManager writes the new pair to the account's file
+            if not await manager.refresh():
+                raise ProvisionError(f"Could not refresh {login}; provision it again")
+            valid = await manager.validate()
+        if not valid or manager.login != login.lower():
+            raise ProvisionError(f"Refreshed token for {login} did not validate as {login}")
+        self.rotated += 1
+        return {'login': manager.login, 'user_id': manager.user_id}
+
+    async def _each(self, method, items, names):
+        results = await asyncio.gather(*(method(item) for item in items), return_exceptions=True)
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                self.failures += 1
+                logger.error(f"{name}: {str(result)}")
+        return dict(zip(names, results))
+
+    async def provision_all(self, accounts):
+        """Provision accounts concurrently; login -> identity, or the exception it failed with"""
+        return await self._each(self.provision, accounts, [account['bot_username'].lower() for account in accounts])
+
+    async def rotate_all(self, logins=None):
+        """Rotate the given (default: every stored) account concurrently"""
+        logins = list(logins if logins is not None else self.store.accounts())
+        return await self._each(self.rotate, logins, logins)
+
+    def stats(self):
+        return {'provisioned': self.provisioned, 'rotated': self.rotated, 'failures': self.failures,
+                'callbacks': self.callback_server.received, 'rejected_callbacks': self.callback_server.rejected}
+
+    async def close(self):
+        await self.callback_server.stop()
+        await self.http_client.close()
+
+
+def load_accounts(path):
+    with open(path, encoding='utf-8') as f:
+        accounts = json.load(f)
+    # Plain logins are accounts that moderate their own channel
+    return [{'bot_username': account} if isinstance(account, str) else account for account in accounts]
+
+
+async def run(args):
+    provisioner = Provisioner(os.getenv('CLIENT_ID'), os.getenv('CLIENT_SECRET'), CredentialStore(args.store),
+                              CallbackServer(port=args.port), on_authorize=log_url if args.no_browser else open_in_browser,
+                              concurrency=args.concurrency, timeout=args.timeout)
+    try:
+        if args.rotate:
+            results = await provisioner.rotate_all()
+        else:
+            await provisioner.start()
+            results = await provisioner.provision_all(load_accounts(args.accounts))
+    finally:
+        await provisioner.close()
+    failed = [login for login, result in results.items() if isinstance(result, BaseException)]
+    logger.info(f"{len(results) - len(failed)} of {len(results)} accounts done"
+                + (f"; failed: {', '.join(failed)}" if failed else ""))
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('accounts', nargs='?', help="JSON list of accounts to authorize")
+    parser.add_argument('--store', default=CREDENTIALS_DIR, help="directory of per-account .env files")
+    parser.add_argument('--rotate', action='store_true', help="refresh every stored account instead")
+    parser.add_argument('--no-browser', action='store_true', help="only log the authorization URLs")
+    parser.add_argument('--port', type=int, default=REDIRECT_PORT)
+    parser.add_argument('--concurrency', type=int, default=PROVISION_CONCURRENCY)
+    parser.add_argument('--timeout', type=float, default=AUTHORIZE_TIMEOUT)
+    args = parser.parse_args()
+    if not args.rotate and not args.accounts:
+        parser.error("an accounts file is required unless --rotate is given")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    # Rotation reads them from each account's file
+    if not args.rotate and not (os.getenv('CLIENT_ID') and os.getenv('CLIENT_SECRET')):
+        parser.error("CLIENT_ID and CLIENT_SECRET must be set in the environment or .env")
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+
+logger = logging.getLogger('twitch_bot')
+
+# A command or listener call taking longer than this gets its stack captured
+SLOW_CALL_MS = 500
+# A single step of a coroutine holding the loop longer than this counts as blocking it
+BLOCK_MS = 100
+# Where profiler.dump() writes when no path is given
+DUMP_PATH = os.getenv('PERF_DUMP', os.path.join(os.path.dirname(__file__), 'perf_report.json'))
+# How many slow-call traces and loop stalls are kept for the report
+KEEP_TRACES = 20
+
+
+def coroutine_stack(coro):
+    """Where a suspended coroutine is waiting, outermost frame first.
+
+    Follows cr_await/gi_yieldfrom down the await chain; the last entry names
+    the future or awaitable at the bottom.
+    """
+    lines = []
+    obj = coro
+    while obj is not None:
+        frame = getattr(obj, 'cr_frame', None) or getattr(obj, 'gi_frame', None)
+        if frame is None:
+            if obj is not coro:
+                lines.append(f'  waiting on {obj!r}'[:200])
+            break
+        code = frame.f_code
+        lines.append(f'  File "{code.co_filename}", line {frame.f_lineno}, in {code.co_name}')
+        obj = getattr(obj, 'cr_await', None) or getattr(obj, 'gi_yieldfrom', None)
+    return lines
+
+
+class CallStats:
+    """Timings for one command or listener"""
+
+    __slots__ = ('calls', 'errors', 'wall', 'cpu', 'max_wall', 'max_step', 'slow', 'blocked')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+        self.max_step = 0.0
+        self.slow = 0
+        self.blocked = 0
+
+    def as_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['avg_wall'] = self.wall / self.calls if self.calls else 0.0
+        data['avg_cpu'] = self.cpu / self.calls if self.calls else 0.0
+        return data
+
+
+class _TimedCoroutine:
+    """Drives a coroutine step by step, timing each step on the loop thread.
+
+    A step is the stretch between two awaits that really suspend, so the
+    sum of steps is the call's CPU time on the loop and the longest step is
+    how long it held the loop at once.
+    """
+
+    __slots__ = ('coro', 'name', 'profiler', 'started', 'traced', 'cpu', 'max_step')
+
+    def __init__(self, coro, name, profiler):
+        self.coro = coro
+        self.name = name
+        self.profiler = profiler
+        self.started = time.perf_counter()
+        self.traced = False
+        self.cpu = 0.0
+        self.max_step = 0.0
+
+    def __await__(self):
+        coro = self.coro
+        profiler = self.profiler
+        value = None
+        error = None
+        while True:
+            previous = profiler.current
+            profiler.current = self.name
+            started = time.perf_counter()
+            cpu_started = time.thread_time()
+            try:
+                if error is not None:
+                    yielded = coro.throw(error)
+                else:
+                    yielded = coro.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.cpu += time.thread_time() - cpu_started
+                step = time.perf_counter() - started
+                if step > self.max_step:
+                    self.max_step = step
+                profiler.current = previous
+            try:
+                value = yield yielded
+                error = None
+            except BaseException as e:
+                value = None
+                error = e
+
+
+class LoopWatchdog:
+    """Thread that notices when the event loop stops turning and grabs its stack.
+
+    A heartbeat task on the loop stamps the time every `interval`; when the
+    stamp is more than `threshold` late, the loop thread's current stack is
+    what is blocking it.
+    """
+
+    def __init__(self, profiler, threshold, interval=0.02):
+        self.profiler = profiler
+        self.threshold = threshold
+        self.interval = interval
+        self._beat = time.perf_counter()
+        self._reported = False
+        self._loop_thread = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.perf_counter()
+            self._reported = False
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            stalled = time.perf_counter() - self._beat - self.interval
+            if stalled < self.threshold or self._reported:
+                continue
+            self._reported = True
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            self.profiler.record_stall(self.profiler.current, stalled, stack)
+
+    def start(self, loop):
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stop.clear()
+        self._task = loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._thread = None
+
+
+class Profiler:
+    """Opt-in wall/CPU timing of commands and listeners, with slow-call tracing.
+
+    While enabled, run(name, coro) times a call step by step. A call still
+    running after slow_threshold has the stack it is waiting in captured by
+    a sweep over the calls in flight (cheaper than a timer per call); a
+    step holding the loop longer than block_threshold counts as blocking,
+    and the watchdog thread records the stack it was blocked in.
+    """
+
+    def __init__(self, slow_threshold=SLOW_CALL_MS / 1000, block_threshold=BLOCK_MS / 1000,
+                 dump_path=DUMP_PATH):
+        self.slow_threshold = slow_threshold
+        self.block_threshold = block_threshold
+        self.dump_path = dump_path
+        self.enabled = False
+        self.stats = {}
+        # Name of the profiled coroutine currently running on the loop, read by the watchdog
+        self.current = None
+        self.slow_traces = deque(maxlen=KEEP_TRACES)
+        self.stalls = deque(maxlen=KEEP_TRACES)
+        self.stall_count = 0
+        self._running = set()
+        self._sweeper = None
+        self._watchdog = None
+
+    def enable(self, loop=None):
+        if self.enabled:
+            return
+        self.enabled = True
+        loop = loop or asyncio.get_event_loop()
+        self._sweeper = loop.create_task(self._sweep())
+        if self.block_threshold:
+            self._watchdog = LoopWatchdog(self, self.block_threshold)
+            self._watchdog.start(loop)
+        logger.info(f"Profiling commands and listeners (slow > {self.slow_threshold * 1000:.0f}ms, "
+                    f"blocking > {self.block_threshold * 1000:.0f}ms)")
+
+    def disable(self):
+        self.enabled = False
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self._watchdog is not None:
+            self._watchdog.stop()
+            self._watchdog = None
+
+    def reset(self):
+        self.stats = {}
+        self.slow_traces.clear()
+        self.stalls.clear()
+        self.stall_count = 0
+
+    async def run(self, name, coro):
+        """Await coro, recording its wall and CPU time under name"""
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = CallStats()
+        timed = _TimedCoroutine(coro, name, self)
+        running = self._running
+        running.add(timed)
+        try:
+            return await timed
+        except BaseException:
+            stats.errors += 1
+            raise
+        finally:
+            running.discard(timed)
+            wall = time.perf_counter() - timed.started
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += timed.cpu
+            if wall > stats.max_wall:
+                stats.max_wall = wall
+            if timed.max_step > stats.max_step:
+                stats.max_step = timed.max_step
+            if wall >= self.slow_threshold:
+                stats.slow += 1
+                logger.warning(f"{name} took {wall * 1000:.0f}ms "
+                               f"({timed.cpu * 1000:.0f}ms CPU, longest step {timed.max_step * 1000:.0f}ms)")
+            if self.block_threshold and timed.max_step >= self.block_threshold:
+                stats.blocked += 1
+                logger.warning(f"{name} blocked the event loop for {timed.max_step * 1000:.0f}ms")
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(min(0.1, self.slow_threshold / 4))
+            now = time.perf_counter()
+            for timed in [timed for timed in self._running
+                          if not timed.traced and now - timed.started >= self.slow_threshold]:
+                timed.traced = True
+                self._capture(timed, now)
+
+    def _capture(self, timed, now):
+        stack = coroutine_stack(timed.coro)
+        self.slow_traces.append({'name': timed.name, 'after': now - timed.started, 'stack': stack})
+        logger.warning(f"{timed.name} still running after {self.slow_threshold * 1000:.0f}ms, waiting in:\n"
+                       + '\n'.join(stack))
+
+    def record_stall(self, name, stalled, stack):
+        """Called from the watchdog thread while the loop is blocked"""
+        self.stall_count += 1
+        self.stalls.append({'name': name, 'after': stalled, 'stack': stack})
+        logger.warning(f"Event loop blocked for {stalled * 1000:.0f}ms+ in {name or 'unprofiled code'}:\n"
+                       + ''.join(stack[-8:]))
+
+    def top(self, count=5, key='wall'):
+        """(name, stats) pairs with the highest total `key` first"""
+        return sorted(self.stats.items(), key=lambda item: getattr(item[1], key), reverse=True)[:count]
+
+    def summary(self, count=3):
+        """One chat-sized line naming the top offenders"""
+        if not self.stats:
+            return "No calls profiled yet"
+        parts = []
+        for name, stats in self.top(count):
+            parts.append(f"{name}: {stats.calls}x avg {stats.wall / stats.calls * 1000:.1f}ms "
+                         f"max {stats.max_wall * 1000:.0f}ms cpu {stats.cpu / stats.calls * 1000:.1f}ms"
+                         + (f" {stats.slow} slow" if stats.slow else '')
+                         + (f" {stats.blocked} blocking" if stats.blocked else ''))
+        if self.stall_count:
+            parts.append(f"{self.stall_count} loop stalls")
+        return ' | '.join(parts)
+
+    def report(self):
+        return {
+            'slow_threshold': self.slow_threshold,
+            'block_threshold': self.block_threshold,
+            'calls': {name: stats.as_dict() for name, stats in self.top(len(self.stats))},
+            'slow_traces': list(self.slow_traces),
+            'stalls': list(self.stalls)
+        }
+
+    def dump(self, path=None):
+        """Write the full report as JSON and return the path"""
+        return self.write_report(self.report(), path)
+
+    def write_report(self, report, path=None):
+        """Write a report() taken earlier; safe to run off the loop, as report() is not"""
+        path = path or self.dump_path
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, path)
+        return path
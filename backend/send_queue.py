@@ -0,0 +1,285 @@
+import time
+import uuid
+import asyncio
+import logging
+import itertools
+from collections import deque
+from dedup import SeenSet
+
+logger = logging.getLogger('twitch_bot')
+
+# Twitch chat limits: messages per window, in seconds
+MOD_LIMIT = (100, 30.0)
+USER_LIMIT = (20, 30.0)
+
+# Priority lanes, lowest number goes out first
+PRIORITY_MODERATION = 0
+PRIORITY_COMMAND = 1
+PRIORITY_CHAT = 2
+LANES = 3
+
+MAX_MESSAGE_LENGTH = 500
+
+# Writes of a message before it is reported as not sent; the first retry waits
+# RETRY_DELAY seconds, doubling after that, while the connection reconnects
+SEND_ATTEMPTS = 5
+RETRY_DELAY = 0.1
+# Idempotency keys of delivered messages that are remembered
+DELIVERED_SIZE = 4096
+
+
+class TokenBucket:
+    """Token bucket where each spent token returns ``per`` seconds after use.
+
+    Unlike a continuously refilled bucket this never allows more than
+    ``capacity`` sends in any window of ``per`` seconds, which is how Twitch
+    counts them.
+    """
+
+    __slots__ = ('capacity', 'per', '_spent')
+
+    def __init__(self, capacity, per):
+        self.capacity = capacity
+        self.per = per
+        self._spent = deque()
+
+    def _expire(self, now):
+        spent = self._spent
+        while spent and spent[0] + self.per <= now:
+            spent.popleft()
+
+    @property
+    def tokens(self):
+        return self.capacity - len(self._spent)
+
+    def delay(self, now):
+        """Seconds until a token is available"""
+        self._expire(now)
+        if len(self._spent) < self.capacity:
+            return 0.0
+        return self._spent[0] + self.per - now
+
+    def take(self, now):
+        """Take a token if one is available; returns False otherwise"""
+        self._expire(now)
+        if len(self._spent) < self.capacity:
+            self._spent.append(now)
+            return True
+        return False
+
+
+class OutboundMessage:
+    __slots__ = ('channel', 'content', 'reply_to', 'priority', 'future', 'queued_at', 'key', 'nonce', 'attempts')
+
+    def __init__(self, channel, content, reply_to, priority, future, queued_at, key=None, nonce=None):
+        self.channel = channel
+        self.content = content
+        self.reply_to = reply_to
+        self.priority = priority
+        self.future = future
+        self.queued_at = queued_at
+        self.key = key
+        self.nonce = nonce
+        self.attempts = 0
+
+
+class SendQueue:
+    """Paces every outbound chat message through Twitch's rate limits.
+
+    Messages wait in priority lanes (moderation ahead of command replies
+    ahead of chatter). Channels where the bot is a moderator or broadcaster
+    draw from the moderator bucket, all others from the normal bucket.
+    Identical messages still waiting to go out are coalesced into one send,
+    and a message submitted with the idempotency key of one already
+    delivered is not sent again. Failed writes are retried with backoff.
+
+    transport is ``async transport(channel, content, reply_to, nonce)``,
+    where nonce is unique per message and stays the same across retries (it
+    goes out as the client-nonce tag); clock and sleep can be replaced with
+    fakes to drive the queue deterministically.
+    """
+
+    def __init__(self, transport, is_mod=None, clock=time.monotonic, sleep=asyncio.sleep,
+                 mod_limit=MOD_LIMIT, user_limit=USER_LIMIT, max_depth=500, attempts=SEND_ATTEMPTS):
+        self.transport = transport
+        self.is_mod = is_mod or (lambda channel: False)
+        self.clock = clock
+        self.sleep = sleep
+        self.max_depth = max_depth
+        self.attempts = attempts
+        self.mod_bucket = TokenBucket(*mod_limit)
+        self.user_bucket = TokenBucket(*user_limit)
+        self._lanes = [deque() for _ in range(LANES)]
+        self._pending = {}
+        self._delivered = SeenSet(DELIVERED_SIZE)
+        self._nonce_prefix = uuid.uuid4().hex[:12]
+        self._nonces = itertools.count(1)
+        self._wakeup = None
+        self._worker = None
+        # Backoff timers of messages waiting to be retried
+        self._retries = set()
+        # Metrics
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.coalesced = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.peak_depth = 0
+        self.total_wait = 0.0
+
+    @property
+    def depth(self):
+        return sum(len(lane) for lane in self._lanes)
+
+    def submit(self, channel, content, priority=PRIORITY_COMMAND, reply_to=None, key=None):
+        """Queue a message and return a future resolved once it is sent.
+
+        key is an optional idempotency key: a message whose key was already
+        delivered resolves to True without being sent again.
+        """
+        content = content.strip().replace('\n', ' ')
+        if len(content) > MAX_MESSAGE_LENGTH:
+            raise ValueError(f"Content must not exceed {MAX_MESSAGE_LENGTH} characters.")
+        priority = min(max(priority, 0), LANES - 1)
+        loop = asyncio.get_running_loop()
+        if key is not None and key in self._delivered:
+            self.deduplicated += 1
+            future = loop.create_future()
+            future.set_result(True)
+            return future
+        pending = self._pending.get((channel, content, reply_to))
+        if pending is not None:
+            self.coalesced += 1
+            return pending.future
+
+        future = loop.create_future()
+        lane = self._lanes[priority]
+        if priority != PRIORITY_MODERATION and len(lane) >= self.max_depth:
+            self.dropped += 1
+            logger.warning(f"Send queue lane {priority} full, dropping message to #{channel}")
+            future.set_result(False)
+            return future
+
+        message = OutboundMessage(channel, content, reply_to, priority, future, self.clock(),
+                                  key, f'{self._nonce_prefix}{next(self._nonces):x}')
+        lane.append(message)
+        self._pending[(channel, content, reply_to)] = message
+        depth = self.depth
+        if depth > self.peak_depth:
+            self.peak_depth = depth
+
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+        self._wakeup.set()
+        return future
+
+    async def send(self, channel, content, priority=PRIORITY_COMMAND, reply_to=None, wait=False, key=None):
+        """Queue a message; with wait=True, return only once it has gone out"""
+        future = self.submit(channel, content, priority, reply_to, key)
+        if wait:
+            return await future
+        return True
+
+    def _next(self):
+        for lane in self._lanes:
+            if lane:
+                return lane
+        return None
+
+    async def _run(self):
+        while True:
+            lane = self._next()
+            if lane is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            message = lane[0]
+            bucket = self.mod_bucket if self.is_mod(message.channel) else self.user_bucket
+            now = self.clock()
+            if not bucket.take(now):
+                # Re-pick after waiting, a higher priority message may have arrived
+                # (floored so float rounding can never turn this into a busy loop)
+                await self.sleep(max(bucket.delay(now), 0.001))
+                continue
+
+            lane.popleft()
+            pending_key = (message.channel, message.content, message.reply_to)
+            del self._pending[pending_key]
+            message.attempts += 1
+            try:
+                await self.transport(message.channel, message.content, message.reply_to, message.nonce)
+            except Exception as e:
+                if message.attempts < self.attempts:
+                    # Most likely the connection is failing over or reconnecting; the nonce
+                    # stays the same, so the retry cannot be posted twice
+                    delay = RETRY_DELAY * 2 ** (message.attempts - 1)
+                    self.retried += 1
+                    logger.warning(f"Failed to send message to #{message.channel}: {str(e)}, "
+                                   f"retrying in {delay:.1f}s")
+                    # Other channels keep sending while this one backs off
+                    self._pending.setdefault(pending_key, message)
+                    task = asyncio.get_running_loop().create_task(self._retry_later(message, delay))
+                    self._retries.add(task)
+                    task.add_done_callback(self._retries.discard)
+                    continue
+                self.failed += 1
+                logger.error(f"Failed to send message to #{message.channel}: {str(e)}")
+                if not message.future.done():
+                    message.future.set_result(False)
+            else:
+                self.sent += 1
+                self.total_wait += now - message.queued_at
+                if message.key is not None:
+                    self._delivered.add(message.key)
+                if not message.future.done():
+                    message.future.set_result(True)
+
+    async def _retry_later(self, message, delay):
+        """Put a failed message back at the front of its lane once its backoff has passed"""
+        await self.sleep(delay)
+        self._lanes[message.priority].appendleft(message)
+        self._wakeup.set()
+
+    def stats(self):
+        """Queue depth and delivery counters"""
+        return {
+            'depth': self.depth,
+            'depth_by_priority': [len(lane) for lane in self._lanes],
+            'peak_depth': self.peak_depth,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'backing_off': len(self._retries),
+            'coalesced': self.coalesced,
+            'deduplicated': self.deduplicated,
+            'dropped': self.dropped,
+            'avg_wait': self.total_wait / self.sent if self.sent else 0.0,
+            'mod_tokens': self.mod_bucket.tokens,
+            'user_tokens': self.user_bucket.tokens
+        }
+
+    async def close(self):
+        """Stop the sender; messages still queued are reported as not sent"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in self._retries:
+            task.cancel()
+        await asyncio.gather(*self._retries, return_exceptions=True)
+        # Messages backing off are only in _pending, the rest are in both
+        for message in self._pending.values():
+            if not message.future.done():
+                message.future.set_result(False)
+        for lane in self._lanes:
+            for message in lane:
+                if not message.future.done():
+                    message.future.set_result(False)
+            lane.clear()
+        self._pending.clear()
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('twitch_bot')
+
+# SQLite database holding command state; the WAL files sit next to it
+STORE_PATH = os.getenv('STATE_STORE', os.path.join(os.path.dirname(__file__), 'bot_state.db'))
+# Seconds between a write and the batch that carries it to disk
+FLUSH_INTERVAL = 0.5
+# Values kept in memory for reads, least recently used dropped first
+CACHE_SIZE = 10000
+
+# Cached marker for a key known not to be stored
+_ABSENT = object()
+# Pending marker for a key deleted since the last flush
+_DELETED = object()
+
+
+class Namespace:
+    """A command module's view of the store: store.namespace('points')"""
+
+    __slots__ = ('store', 'name')
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    async def get(self, key, default=None):
+        return await self.store.get(self.name, key, default)
+
+    def set(self, key, value):
+        self.store.set(self.name, key, value)
+
+    def delete(self, key):
+        self.store.delete(self.name, key)
+
+    async def incr(self, key, amount=1):
+        return await self.store.incr(self.name, key, amount)
+
+    async def items(self):
+        return await self.store.items(self.name)
+
+
+class StateStore:
+    """Persistent key/value state for command modules, backed by SQLite in WAL mode.
+
+    Values are anything JSON can hold, keyed by (namespace, key); keys are
+    stored as strings, so user IDs work as ints or strs. Values are
+    serialized when they are set, so one JSON can't hold raises TypeError
+    to the caller. Writes return at once: they update the in-memory cache
+    and are coalesced per key until the next flush, which writes the whole
+    batch in one transaction. Every database call runs on one dedicated thread, in
+    order, so a read that misses the cache always sees earlier flushes and
+    the event loop never waits on the disk.
+    """
+
+    def __init__(self, path=STORE_PATH, flush_interval=FLUSH_INTERVAL, cache_size=CACHE_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._executor = None
+        self._conn = None
+        self._flush_task = None
+        self.updates = 0
+        self.coalesced = 0
+        self.rows_written = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.hits = 0
+        self.misses = 0
+        self.last_flush_time = 0.0
+
+    def namespace(self, name):
+        return Namespace(self, name)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    # Database side: only ever called on the writer thread
+
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # With WAL, NORMAL keeps the database consistent across crashes and only fsyncs at checkpoints
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=5000')
+            conn.execute('CREATE TABLE IF NOT EXISTS state (namespace TEXT NOT NULL, key TEXT NOT NULL, '
+                         'value TEXT NOT NULL, PRIMARY KEY (namespace, key)) WITHOUT ROWID')
+            self._conn = conn
+        return self._conn
+
+    def _read(self, namespace, key):
+        row = self._db().execute('SELECT value FROM state WHERE namespace = ? AND key = ?',
+                                 (namespace, key)).fetchone()
+        return _ABSENT if row is None else json.loads(row[0])
+
+    def _read_all(self, namespace):
+        rows = self._db().execute('SELECT key, value FROM state WHERE namespace = ?', (namespace,))
+        return {key: json.loads(value) for key, value in rows}
+
+    def _write(self, rows, deletes):
+        conn = self._db()
+        with conn:
+            if rows:
+                conn.executemany('INSERT INTO state (namespace, key, value) VALUES (?, ?, ?) '
+                                 'ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value', rows)
+            if deletes:
+                conn.executemany('DELETE FROM state WHERE namespace = ? AND key = ?', deletes)
+
+    def _snapshot(self, path):
+        tmp_path = f"{path}.tmp"
+        target = sqlite3.connect(tmp_path)
+        try:
+            self._db().backup(target)
+        finally:
+            target.close()
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _close_db(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _call(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state-store')
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # Loop side
+
+    def _remember(self, item, value):
+        cache = self._cache
+        cache[item] = value
+        cache.move_to_end(item)
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _known(self, item):
+        """The current value of an item if it is pending or cached, else None"""
+        text = self._pending.get(item)
+        if text is _DELETED:
+            return _ABSENT
+        value = self._cache.get(item)
+        if value is not None:
+            self._cache.move_to_end(item)
+        elif text is not None:
+            # Dropped from the cache while its write is still pending
+            value = json.loads(text)
+            self._remember(item, value)
+        return value
+
+    async def _load(self, item):
+        self.misses += 1
+        value = await self._call(self._read, *item)
+        # A write may have landed while the read was queued
+        known = self._known(item)
+        if known is not None:
+            return known
+        self._remember(item, value)
+        return value
+
+    async def get(self, namespace, key, default=None):
+        item = (namespace, str(key))
+        value = self._known(item)
+        if value is None:
+            value = await self._load(item)
+        else:
+            self.hits += 1
+        return default if value is _ABSENT else value
+
+    def set(self, namespace, key, value):
+        """Store a value; it reaches the disk with the next flush"""
+        if value is None:
+            raise ValueError("None can't be stored; use delete()")
+        # Serialized now, so a value JSON can't hold fails here rather than in the flush
+        self._put((namespace, str(key)), value, json.dumps(value))
+
+    def delete(self, namespace, key):
+        self._put((namespace, str(key)), _ABSENT, _DELETED)
+
+    def _put(self, item, value, text):
+        if item in self._pending:
+            self.coalesced += 1
+        self._pending[item] = text
+        self._remember(item, value)
+        self.updates += 1
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def incr(self, namespace, key, amount=1):
+        """Add to a numeric value (missing counts as 0) and return the new value"""
+        item = (namespace, str(key))
+        value = self._known(item)
+        if value is None:
+            loaded = await self._load(item)
+            # Another incr may have moved it while this one waited
+            value = self._known(item)
+            if value is None:
+                value = loaded
+        value = (0 if value is _ABSENT else value) + amount
+        self._put(item, value, json.dumps(value))
+        return value
+
+    async def items(self, namespace):
+        """Everything stored under a namespace, including unflushed writes"""
+        values = await self._call(self._read_all, namespace)
+        for (name, key), text in self._pending.items():
+            if name != namespace:
+                continue
+            if text is _DELETED:
+                values.pop(key, None)
+            else:
+                values[key] = json.loads(text)
+        return values
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        # Writes made during this flush schedule the next one
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """Write everything pending in one transaction"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        rows = []
+        deletes = []
+        for (namespace, key), text in batch.items():
+            if text is _DELETED:
+                deletes.append((namespace, key))
+            else:
+                rows.append((namespace, key, text))
+        start = time.perf_counter()
+        try:
+            await self._call(self._write, rows, deletes)
+        except Exception as e:
+            self.flush_errors += 1
+            logger.error(f"Could not write {len(batch)} state updates: {str(e)}")
+            # Keep them for the next flush, behind anything written since
+            for item, text in batch.items():
+                self._pending.setdefault(item, text)
+            if self._flush_task is None:
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+            return
+        self.last_flush_time = time.perf_counter() - start
+        self.flushes += 1
+        self.rows_written += len(batch)
+
+    async def snapshot(self, path):
+        """Flush, then copy the database to path atomically"""
+        await self.flush()
+        await self._call(self._snapshot, path)
+
+    def stats(self):
+        return {
+            'pending': self.pending,
+            'cached': len(self._cache),
+            'updates': self.updates,
+            'coalesced': self.coalesced,
+            'rows_written': self.rows_written,
+            'flushes': self.flushes,
+            'flush_errors': self.flush_errors,
+            'hits': self.hits,
+            'misses': self.misses,
+            'last_flush_time': self.last_flush_time
+        }
+
+    async def close(self):
+        """Flush what is pending and close the database"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        if self._executor is not None:
+            await self._call(self._close_db)
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,355 @@
+import os
+import json
+import bisect
+import signal
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from token_manager import TokenManager
+
+logger = logging.getLogger('twitch_bot')
+
+# Points per worker on the hash ring; more points spread channels more evenly
+VNODES = 160
+# Seconds before a dead worker is replaced; None leaves its channels with the survivors
+RESTART_DELAY = 5.0
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring mapping channel names to worker ids.
+
+    Removing a worker only moves the channels it owned, spread over the
+    remaining workers; adding it back moves the same channels home again.
+    """
+
+    def __init__(self, nodes=(), vnodes=VNODES):
+        self.vnodes = vnodes
+        self._points = []
+        self._owners = {}
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self):
+        return set(self._owners.values())
+
+    def add(self, node):
+        for replica in range(self.vnodes):
+            point = _hash(f"{node}:{replica}")
+            if point not in self._owners:
+                self._owners[point] = node
+                bisect.insort(self._points, point)
+
+    def remove(self, node):
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: self._owners[point] for point in self._points}
+
+    def node_for(self, key):
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+    def assign(self, keys):
+        """Return {node: [keys]} for every node on the ring"""
+        assignment = {node: [] for node in self.nodes}
+        if not assignment:
+            return assignment
+        for key in keys:
+            assignment[self.node_for(key)].append(key)
+        return assignment
+
+
+class WorkerLink:
+    """Worker end of the pipe to the supervisor.
+
+    Messages are (kind, *args) tuples: the supervisor sends 'token', 'join',
+    'part' and 'stop'; the worker sends 'ready' and 'refresh'.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.bot = None
+        self._token_waiter = None
+        self._stopping = None
+
+    def attach(self, bot):
+        self.bot = bot
+        bot.loop.add_reader(self.conn.fileno(), self._on_readable)
+        bot.loop.create_task(self._announce_ready())
+
+    def send(self, kind, *args):
+        try:
+            self.conn.send((kind, *args))
+        except OSError as e:
+            logger.error(f"Lost connection to supervisor: {str(e)}")
+
+    async def _announce_ready(self):
+        await self.bot.wait_for_ready()
+        await self.bot.channels.wait_until_joined()
+        self.send('ready')
+
+    def _on_readable(self):
+        try:
+            kind, *args = self.conn.recv()
+        except (EOFError, OSError):
+            # The supervisor is gone; shut down with it
+            logger.warning("Supervisor connection closed, stopping worker")
+            self.bot.loop.remove_reader(self.conn.fileno())
+            self.stop()
+            return
+
+        if kind == 'token':
+            self.bot.set_tokens(*args)
+            if self._token_waiter is not None and not self._token_waiter.done():
+                self._token_waiter.set_result(True)
+        elif kind == 'join':
+            self.bot.channels.join(*args[0])
+        elif kind == 'part':
+            self.bot.loop.create_task(self.bot.channels.part(*args[0]))
+        elif kind == 'stop':
+            self.stop()
+
+    def stop(self):
+        """Close the bot (draining the send queue, flushing the store) and then end its loop"""
+        if self._stopping is None:
+            self._stopping = self.bot.loop.create_task(self._shutdown())
+
+    async def _shutdown(self):
+        try:
+            await self.bot.close()
+        except Exception as e:
+            logger.error(f"Error closing worker bot: {str(e)}")
+        finally:
+            # bot.run() sees the bot closed and only closes the loop
+            self.bot.loop.stop()
+
+    async def request_token(self, timeout=60.0):
+        """Ask the supervisor for a fresh token; True once it has arrived"""
+        if self._token_waiter is None or self._token_waiter.done():
+            self._token_waiter = self.bot.loop.create_future()
+            self.send('refresh')
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._token_waiter), timeout)
+        except asyncio.TimeoutError:
+            logger.error("Supervisor did not send a new token in time")
+            return False
+
+
+def run_worker(index, auth_creds, channels, conn):
+    """Worker process entry point: one CustomBot serving its share of the channels"""
+    # Importing main configures logging for this process
+    from main import load_commands
+    from bot import CustomBot
+
+    logger.info(f"Worker {index} starting with {len(channels)} channels")
+    # Each worker serves its own /metrics, on METRICS_PORT plus its index
+    if os.getenv('METRICS_PORT'):
+        os.environ['METRICS_PORT'] = str(int(os.environ['METRICS_PORT']) + index)
+    link = WorkerLink(conn)
+    bot = CustomBot(auth_creds, channels=channels, token_source=link.request_token)
+    link.attach(bot)
+    load_commands(bot)
+    bot.run()
+
+
+class WorkerHandle:
+    """A worker process and the supervisor's end of its pipe"""
+
+    __slots__ = ('index', 'process', 'conn', 'ready')
+
+    def __init__(self, index, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.ready = False
+
+
+class Supervisor:
+    """Runs one bot per worker process and spreads channels over them.
+
+    Channels are assigned by consistent hashing. When a worker dies its
+    channels are handed to the survivors straight away; after restart_delay
+    a replacement starts, and the survivors leave those channels again once
+    it reports ready. The supervisor is the only token refresher and pushes
+    new tokens to every worker.
+    """
+
+    def __init__(self, auth_creds, channels, workers=None, target=run_worker,
+                 restart_delay=RESTART_DELAY, token_manager=None):
+        self.auth_creds = dict(auth_creds)
+        self.channels = list(dict.fromkeys(channels))
+        self.workers = workers or os.cpu_count() or 1
+        self.target = target
+        self.restart_delay = restart_delay
+        self.ring = HashRing(range(self.workers))
+        self.assignment = {}
+        self.handles = {}
+        self.tokens = token_manager or TokenManager.from_credentials(self.auth_creds)
+        self.tokens.subscribe(self.broadcast_token)
+        # Called as on_message(index, kind, *args) for messages the supervisor doesn't handle itself
+        self.on_message = None
+        self._context = multiprocessing.get_context('spawn')
+        self._loop = None
+        self._stopping = False
+
+    def start(self):
+        """Start every worker with its share of the channels"""
+        self._loop = asyncio.get_running_loop()
+        assignment = self.ring.assign(self.channels)
+        for index in range(self.workers):
+            self.start_worker(index, assignment.get(index, []))
+
+    def start_worker(self, index, channels):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=self.target,
+            args=(index, dict(self.auth_creds), channels, child_conn),
+            name=f"bot-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self.handles[index] = WorkerHandle(index, process, parent_conn)
+        self.assignment[index] = set(channels)
+        self._loop.add_reader(parent_conn.fileno(), self._on_readable, index)
+        self._loop.add_reader(process.sentinel, self._on_exit, index)
+        logger.info(f"Started worker {index} (pid {process.pid}) with {len(channels)} channels")
+
+    def send(self, index, kind, *args):
+        handle = self.handles.get(index)
+        if handle is None:
+            return
+        try:
+            handle.conn.send((kind, *args))
+        except OSError as e:
+            logger.error(f"Failed to message worker {index}: {str(e)}")
+
+    def broadcast_token(self, access_token, refresh_token):
+        # Workers started later get the new tokens from auth_creds
+        self.auth_creds['access_token'] = access_token
+        self.auth_creds['refresh_token'] = refresh_token
+        for index in list(self.handles):
+            self.send(index, 'token', access_token, refresh_token)
+
+    def join(self, *names):
+        """Add channels and hand them to whichever workers own them"""
+        for name in names:
+            if name not in self.channels:
+                self.channels.append(name)
+        self.rebalance()
+
+    def rebalance(self):
+        """Move channels to match the hash ring, for every running worker"""
+        wanted = self.ring.assign(self.channels)
+        for index in list(self.handles):
+            current = self.assignment.get(index, set())
+            target = set(wanted.get(index, ()))
+            added = sorted(target - current)
+            removed = sorted(current - target)
+            if added:
+                self.send(index, 'join', added)
+            if removed:
+                self.send(index, 'part', removed)
+            self.assignment[index] = target
+            if added or removed:
+                logger.info(f"Worker {index}: +{len(added)} / -{len(removed)} channels")
+
+    def _on_readable(self, index):
+        handle = self.handles.get(index)
+        if handle is None:
+            return
+        try:
+            kind, *args = handle.conn.recv()
+        except (EOFError, OSError):
+            # The sentinel callback deals with the exit
+            self._loop.remove_reader(handle.conn.fileno())
+            return
+
+        if kind == 'refresh':
+            self._loop.create_task(self.tokens.refresh())
+        elif kind == 'ready':
+            handle.ready = True
+            logger.info(f"Worker {index} is ready")
+            # A replacement is up: survivors can now give its channels back
+            self.rebalance()
+        elif self.on_message is not None:
+            self.on_message(index, kind, *args)
+
+    def _on_exit(self, index):
+        handle = self.handles.pop(index, None)
+        if handle is None:
+            return
+        self._loop.remove_reader(handle.process.sentinel)
+        self._loop.remove_reader(handle.conn.fileno())
+        handle.conn.close()
+        # The sentinel is readable, so the process has ended and this only reaps it
+        handle.process.join(1)
+        self.assignment.pop(index, None)
+        if self._stopping:
+            return
+
+        logger.warning(f"Worker {index} exited with code {handle.process.exitcode}, rebalancing its channels")
+        self.ring.remove(index)
+        self.rebalance()
+        if self.restart_delay is not None:
+            self._loop.call_later(self.restart_delay, self._restart, index)
+
+    def _restart(self, index):
+        if self._stopping or index in self.handles:
+            return
+        self.ring.add(index)
+        channels = self.ring.assign(self.channels).get(index, [])
+        self.start_worker(index, channels)
+
+    async def stop(self, timeout=5.0):
+        """Ask every worker to stop, terminating those that don't in time"""
+        self._stopping = True
+        handles = list(self.handles.values())
+        for handle in handles:
+            self.send(handle.index, 'stop')
+        for handle in handles:
+            await self._loop.run_in_executor(None, handle.process.join, timeout)
+            if handle.process.is_alive():
+                handle.process.terminate()
+            self._on_exit(handle.index)
+        await self.tokens.close()
+
+    async def run(self):
+        """Validate the token, start the workers and supervise them until SIGINT/SIGTERM"""
+        self._loop = asyncio.get_running_loop()
+        if not await self.tokens.ensure_valid():
+            logger.error("Failed to validate or refresh token. Please run twitch_oauth_setup.py to get new tokens.")
+            return
+        self.start()
+        self.tokens.start(self._loop)
+
+        stopped = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            self._loop.add_signal_handler(sig, stopped.set)
+        await stopped.wait()
+        logger.info("Stopping workers...")
+        await self.stop()
+
+
+def configured_channels(auth_creds):
+    """Channels from CHANNEL_NAME (comma-separated) and the CHANNELS_CONFIG file"""
+    from channel_manager import normalize
+
+    names = [normalize(name) for name in (auth_creds.get('channel_name') or '').split(',')]
+    if os.getenv('CHANNELS_CONFIG'):
+        with open(os.getenv('CHANNELS_CONFIG'), encoding='utf-8') as f:
+            names += [normalize(name) for name in json.load(f)]
+    return [name for name in dict.fromkeys(names) if name]
+
+
+def run_supervisor(auth_creds, workers=None, token_manager=None):
+    supervisor = Supervisor(auth_creds, configured_channels(auth_creds), workers=workers,
+                            token_manager=token_manager)
+    logger.info(f"Starting {supervisor.workers} workers for {len(supervisor.channels)} channels")
+    asyncio.run(supervisor.run())
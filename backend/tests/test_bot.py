@@ -0,0 +1,94 @@
+import asyncio
+
+from twitchio.chatter import WhisperChatter
+from twitchio.message import Message
+
+from bot import CustomBot
+
+CREDENTIALS = {
+    'bot_username': 'testbot',
+    'channel_name': 'testchannel',
+    'client_id': 'test-client-id',
+    'client_secret': 'test-client-secret',
+    'access_token': 'test-access-token',
+    'refresh_token': 'test-refresh-token'
+}
+
+WHISPER_TAGS = {'badges': '', 'display-name': 'Viewer', 'message-id': '1', 'thread-id': '1_2',
+                'turbo': '0', 'user-id': '87654321', 'user-type': ''}
+
+
+def whisper(bot, content):
+    """A Message shaped as twitchio builds it for an IRC WHISPER: no channel"""
+    author = WhisperChatter(websocket=bot._connection, name='viewer')
+    return Message(raw_data='', content=content, author=author, channel=None,
+                   tags=dict(WHISPER_TAGS), echo=False)
+
+
+def run(scenario, **kwargs):
+    """Build a bot that stays offline, run scenario(bot) and shut its workers down"""
+    async def main():
+        bot = CustomBot(CREDENTIALS, channels=[], **kwargs)
+        bot.token_check_task.cancel()
+        try:
+            await scenario(bot)
+        finally:
+            bot.lag_monitor.stop()
+            await bot.listener_engine.close()
+            await bot.send_queue.close()
+            await bot.http_client.close()
+    asyncio.run(main())
+
+
+def test_whispers_reach_listeners():
+    async def scenario(bot):
+        received = asyncio.get_running_loop().create_future()
+        bot.add_message_listener(received.set_result)
+        message = whisper(bot, 'hello there')
+        await bot.event_message(message)
+        assert await asyncio.wait_for(received, 1) is message
+        record = bot.chatters.get(None, '87654321')
+        assert record is not None and record.channel is None
+    run(scenario)
+
+
+def test_moderation_passes_over_whispers():
+    from moderation import ActionBatcher, ModerationEngine, Rule
+
+    async def scenario(bot):
+        actions = ActionBatcher(lambda action: None)
+        engine = ModerationEngine([Rule(term='spam')], actions, chatters=bot.chatters)
+        assert await engine(whisper(bot, 'spam')) is None
+        assert actions.queued == 0
+    run(scenario)
+
+
+def test_token_manager_shares_the_bot_pool():
+    from token_manager import TokenManager
+
+    async def scenario(bot):
+        assert bot.tokens.http_client is bot.http_client
+    run(scenario)
+
+    shared = TokenManager('id', 'secret', 'access', 'refresh')
+
+    async def injected(bot):
+        assert bot.tokens is shared
+        assert shared.http_client is bot.http_client
+    run(injected, token_manager=shared)
+
+
+def test_whispered_commands_run_and_respect_cooldowns():
+    async def scenario(bot):
+        calls = []
+
+        @bot.command(name='roll')
+        async def roll(ctx):
+            calls.append(ctx.message.content)
+        bot.command_router.rebuild(bot.commands)
+        bot.cooldowns.add('roll', 1, 60, scope='user')
+        await bot.event_message(whisper(bot, '!roll 20'))
+        await bot.event_message(whisper(bot, '!roll 6'))
+        assert calls == ['!roll 20']
+        assert bot._command_errors.labels('roll').value == 0
+    run(scenario)
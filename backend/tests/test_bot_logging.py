@@ -0,0 +1,22 @@
+import logging
+
+from bot_logging import setup_logging, stop_logging
+
+
+def test_arguments_are_captured_when_logged(tmp_path):
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    log_file = tmp_path / 'bot.log'
+    try:
+        setup_logging(level='INFO', log_file=str(log_file), console=False)
+        state = ['before']
+        logging.getLogger('twitch_bot').info("state: %s", state)
+        state[0] = 'after'
+        stop_logging()
+    finally:
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in saved_handlers:
+            root.addHandler(handler)
+        root.setLevel(saved_level)
+    assert "state: ['before']" in log_file.read_text(encoding='utf-8')
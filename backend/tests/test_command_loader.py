@@ -0,0 +1,97 @@
+import pytest
+
+import command_loader
+from command_loader import CommandManifest, index_module
+
+MODULE = '''
+from twitchio.ext import commands
+
+class Dice:
+    @commands.command(name='roll', aliases=['dice', 'r'])
+    async def roll(self, ctx):
+        pass
+
+    @commands.command()
+    async def coin(self, ctx):
+        pass
+'''
+
+LISTENER_MODULE = '''
+class Watcher:
+    def __init__(self, bot):
+        bot.add_message_listener(self.on_message)
+'''
+
+
+def write(path, source):
+    path.write_text(source, encoding='utf-8')
+    return str(path)
+
+
+def test_index_module_reads_names_and_aliases(tmp_path):
+    path = write(tmp_path / 'command.py', MODULE)
+    assert index_module(path) == [['roll', ['dice', 'r']], ['coin', []]]
+
+
+def test_index_module_refuses_listener_modules(tmp_path):
+    path = write(tmp_path / 'command.py', LISTENER_MODULE)
+    assert index_module(path) is None
+
+
+def test_manifest_caches_by_mtime(tmp_path, monkeypatch):
+    path = write(tmp_path / 'command.py', MODULE)
+    calls = []
+
+    def counting_index(module_path):
+        calls.append(module_path)
+        return index_module(module_path)
+
+    monkeypatch.setattr(command_loader, 'index_module', counting_index)
+    manifest = CommandManifest(str(tmp_path / 'manifest.json'))
+    first = manifest.commands('dice', path, 1)
+    assert manifest.commands('dice', path, 1) == first
+    assert len(calls) == 1
+    write(tmp_path / 'command.py', LISTENER_MODULE)
+    assert manifest.commands('dice', path, 2) is None
+    assert len(calls) == 2
+
+
+def test_manifest_round_trips_through_disk(tmp_path, monkeypatch):
+    path = write(tmp_path / 'command.py', MODULE)
+    manifest_path = tmp_path / 'manifest.json'
+    manifest = CommandManifest(str(manifest_path))
+    manifest.commands('dice', path, 1)
+    manifest.save()
+
+    monkeypatch.setattr(command_loader, 'index_module', lambda module_path: pytest.fail("re-indexed a cached module"))
+    reloaded = CommandManifest(str(manifest_path))
+    assert reloaded.commands('dice', path, 1) == [['roll', ['dice', 'r']], ['coin', []]]
+
+
+def test_manifest_only_writes_when_changed(tmp_path):
+    path = write(tmp_path / 'command.py', MODULE)
+    manifest_path = tmp_path / 'manifest.json'
+    manifest = CommandManifest(str(manifest_path))
+    manifest.save()
+    assert not manifest_path.exists()
+    manifest.commands('dice', path, 1)
+    manifest.save()
+    written = manifest_path.stat().st_mtime_ns
+    manifest.commands('dice', path, 1)
+    manifest.save()
+    assert manifest_path.stat().st_mtime_ns == written
+
+
+def test_manifest_prunes_removed_modules(tmp_path):
+    path = write(tmp_path / 'command.py', MODULE)
+    manifest = CommandManifest(str(tmp_path / 'manifest.json'))
+    manifest.commands('dice', path, 1)
+    manifest.commands('coin', path, 1)
+    manifest.prune({'coin'})
+    assert set(manifest.entries) == {'coin'}
+
+
+def test_unreadable_manifest_starts_empty(tmp_path):
+    manifest_path = tmp_path / 'manifest.json'
+    manifest_path.write_text('{not json', encoding='utf-8')
+    assert CommandManifest(str(manifest_path)).entries == {}
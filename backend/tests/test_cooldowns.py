@@ -0,0 +1,95 @@
+import pytest
+
+from cooldowns import CooldownManager
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_user_scope_is_per_user(clock):
+    manager = CooldownManager(clock)
+    manager.add('dice', 1, 30, scope='user')
+    assert manager.check('dice', 'chan', 'alice') == 0.0
+    assert manager.check('dice', 'chan', 'alice') == 30
+    assert manager.check('dice', 'chan', 'bob') == 0.0
+    clock.now += 30
+    assert manager.check('dice', 'chan', 'alice') == 0.0
+
+
+def test_rate_counts_uses_within_window(clock):
+    manager = CooldownManager(clock)
+    manager.add('dice', 2, 10, scope='channel')
+    assert manager.check('dice', 'chan', 'alice') == 0.0
+    clock.now += 4
+    assert manager.check('dice', 'chan', 'bob') == 0.0
+    assert manager.check('dice', 'chan', 'carol') == 6
+    assert manager.check('dice', 'other', 'carol') == 0.0
+
+
+def test_refused_use_is_not_recorded(clock):
+    manager = CooldownManager(clock)
+    manager.add('dice', 1, 10, scope='user')
+    manager.add('dice', 1, 60, scope='global')
+    assert manager.check('dice', 'chan', 'alice') == 0.0
+    clock.now += 10
+    # The user rule allows alice again but the global rule refuses
+    assert manager.check('dice', 'chan', 'alice') == 50
+    clock.now += 50
+    assert manager.check('dice', 'chan', 'alice') == 0.0
+
+
+def test_shared_rules_apply_to_every_command(clock):
+    manager = CooldownManager(clock)
+    manager.add(None, 1, 5, scope='user')
+    assert manager.check('dice', 'chan', 'alice') == 0.0
+    assert manager.check('Greet', 'chan', 'alice') == 5
+    assert manager.check('unlimited', 'chan', 'bob') == 0.0
+
+
+def test_commands_without_rules_always_run(clock):
+    manager = CooldownManager(clock)
+    for _ in range(3):
+        assert manager.check('dice', 'chan', 'alice') == 0.0
+
+
+def test_expired_keys_are_pruned(clock):
+    manager = CooldownManager(clock, prune_interval=60)
+    rule = manager.add('dice', 1, 10, scope='user')
+    for user in range(100):
+        manager.check('dice', 'chan', user)
+    assert len(rule) == 100
+    clock.now += 60
+    manager.check('dice', 'chan', 'alice')
+    assert len(rule) == 1
+    assert manager.stats() == {'dice:user': 1}
+
+
+def test_invalid_rules_are_rejected():
+    manager = CooldownManager()
+    with pytest.raises(ValueError):
+        manager.add('dice', 1, 10, scope='room')
+    with pytest.raises(ValueError):
+        manager.add('dice', 0, 10)
+
+
+def test_tracked_keys_are_capped(clock):
+    manager = CooldownManager(clock, max_keys=3)
+    rule = manager.add('dice', 1, 30, scope='user')
+    for user in 'abcd':
+        manager.check('dice', 'chan', user)
+        clock.now += 1
+    assert len(rule) == 3
+    assert rule.evictions == 1
+    # The oldest window went first; the others still hold
+    assert manager.check('dice', 'chan', 'a') == 0.0
+    assert manager.check('dice', 'chan', 'd') > 0
@@ -0,0 +1,30 @@
+from dedup import SeenSet
+
+
+def test_add_reports_duplicates():
+    seen = SeenSet(10)
+    assert seen.add('a')
+    assert not seen.add('a')
+    assert 'a' in seen
+    assert len(seen) == 1
+
+
+def test_oldest_ids_are_forgotten_first():
+    seen = SeenSet(3)
+    for message_id in 'abcd':
+        seen.add(message_id)
+    assert len(seen) == 3
+    assert 'a' not in seen
+    assert all(message_id in seen for message_id in 'bcd')
+    # A forgotten ID counts as new again
+    assert seen.add('a')
+    assert 'b' not in seen
+
+
+def test_duplicate_does_not_refresh_age():
+    seen = SeenSet(2)
+    seen.add('a')
+    seen.add('b')
+    seen.add('a')
+    seen.add('c')
+    assert 'a' not in seen
@@ -0,0 +1,37 @@
+import asyncio
+
+from helix_cache import HelixCache
+
+
+def fetches_for(requests):
+    """Run GETs through a HelixCache in turn and return the params of each fetch it made"""
+    fetched = []
+
+    async def fetch(path, params):
+        fetched.append(params)
+        return {'data': []}
+
+    async def main():
+        cache = HelixCache(fetch)
+        for path, params in requests:
+            await cache.get(path, params)
+    asyncio.run(main())
+    return fetched
+
+
+def test_parameter_name_order_shares_an_entry():
+    fetched = fetches_for([('streams', {'user_login': 'a', 'first': 20}),
+                           ('streams', {'first': 20, 'user_login': 'a'})])
+    assert len(fetched) == 1
+
+
+def test_value_order_of_repeated_names_is_kept():
+    fetched = fetches_for([('users', [('id', 'b'), ('id', 'a')]),
+                           ('users', [('id', 'a'), ('id', 'b')]),
+                           ('users', {'id': ['b', 'a']})])
+    assert fetched == [[('id', 'b'), ('id', 'a')], [('id', 'a'), ('id', 'b')]]
+
+
+def test_set_values_are_order_free():
+    fetched = fetches_for([('users', {'login': {'b', 'a', 'c'}}), ('users', {'login': {'c', 'a', 'b'}})])
+    assert fetched == [[('login', 'a'), ('login', 'b'), ('login', 'c')]]
@@ -0,0 +1,96 @@
+import logging
+
+import pytest
+
+from moderation import Rule, RuleSet, clean, normalize
+
+
+def test_normalize_folds_lookalikes_and_invisible_characters():
+    assert normalize('H3LL0') == 'hello'
+    assert normalize('s​p​a​m') == 'spam'
+    # Cyrillic а and е
+    assert normalize('bаd wеird') == 'bad weird'
+    assert normalize('ｆｕｌｌｗｉｄｔｈ') == 'fullwidth'
+    assert normalize('café') == 'cafe'
+
+
+def test_normalize_collapses_spacing_and_repeats():
+    assert normalize('  so    nooooo  ') == 'so noo'
+
+
+def test_clean_keeps_digits_and_symbols():
+    assert clean('Call 555-0100 @Me $5') == 'call 555-0100 @me $5'
+    assert clean('ｆｒｅｅ​ $５') == 'free $5'
+
+
+def test_terms_match_whole_words_of_folded_text():
+    rules = RuleSet([Rule(term='spam')])
+    assert rules.match('this is $P4M') is not None
+    assert rules.match('sp​am!') is not None
+    assert rules.match('spammer') is None
+
+
+def test_word_false_matches_inside_words():
+    rules = RuleSet([Rule(term='spam', word=False)])
+    assert rules.match('spammer') is not None
+
+
+def test_patterns_see_digits_and_symbols():
+    rules = RuleSet([Rule(pattern=r'\d{3}-\d{4}'), Rule(pattern=r'@everyone')])
+    assert rules.match('call 555-0100') is not None
+    assert rules.match('hey @EVERYONE') is not None
+    assert rules.match('hey everyone') is None
+
+
+def test_strongest_rule_wins():
+    rules = RuleSet([
+        Rule(term='spam', action='delete'),
+        Rule(term='scam', action='timeout', duration=60),
+        Rule(pattern='scam', action='timeout', duration=600),
+        Rule(term='slur', action='ban'),
+    ])
+    assert rules.match('spam').action == 'delete'
+    assert rules.match('spam scam').duration == 600
+    assert rules.match('scam slur spam').action == 'ban'
+    assert rules.match('hello') is None
+
+
+def test_bad_patterns_are_rejected():
+    with pytest.raises(ValueError):
+        Rule(pattern='(')
+    with pytest.raises(ValueError):
+        Rule(pattern='x*')
+    with pytest.raises(ValueError):
+        Rule()
+
+
+def test_pattern_that_cannot_match_warns(caplog):
+    with caplog.at_level(logging.WARNING, logger='twitch_bot'):
+        Rule(pattern='ｆree')
+    assert 'can never match' in caplog.text
+
+
+def test_strongest_pattern_wins_anywhere_in_the_message():
+    rules = RuleSet([Rule(pattern='foo', action='delete'), Rule(pattern='bar', action='ban')])
+    assert rules.match('foo bar').action == 'ban'
+    assert rules.match('bar foo').action == 'ban'
+    assert rules.match('just foo').action == 'delete'
+
+
+def test_overlapping_patterns_keep_the_strongest():
+    rules = RuleSet([Rule(pattern='foobar', action='delete'),
+                     Rule(pattern='oob', action='timeout', duration=60)])
+    assert rules.match('foobar').action == 'timeout'
+
+
+def test_backreferences_keep_their_own_numbering():
+    rules = RuleSet([Rule(pattern=r'(x)y', action='delete'), Rule(pattern=r'(a)\1{3}', action='timeout')])
+    assert rules.match('baaaad').action == 'timeout'
+    assert rules.match('xy').action == 'delete'
+    assert rules.match('abab') is None
+
+
+def test_named_groups_shared_between_rules():
+    rules = RuleSet([Rule(pattern=r'(?P<word>spam)'), Rule(pattern=r'(?P<word>scam)', action='ban')])
+    assert rules.match('a scam').action == 'ban'
+    assert rules.match('spam').action == 'delete'
@@ -0,0 +1,76 @@
+import asyncio
+
+from send_queue import SendQueue, TokenBucket
+
+
+def test_bucket_allows_capacity_per_window():
+    bucket = TokenBucket(3, 10)
+    assert all(bucket.take(now) for now in (0, 1, 2))
+    assert not bucket.take(3)
+    assert bucket.tokens == 0
+
+
+def test_bucket_delay_is_until_oldest_token_returns():
+    bucket = TokenBucket(2, 10)
+    bucket.take(0)
+    bucket.take(4)
+    assert bucket.delay(5) == 5
+    assert bucket.delay(10) == 0.0
+    assert bucket.take(10)
+    assert not bucket.take(13)
+    assert bucket.delay(13) == 1
+
+
+def test_bucket_never_exceeds_capacity_in_any_window():
+    bucket = TokenBucket(5, 3)
+    sent = [now / 10 for now in range(200) if bucket.take(now / 10)]
+    for index, start in enumerate(sent):
+        in_window = [at for at in sent[index:] if at < start + 3]
+        assert len(in_window) <= 5
+
+
+def test_retry_backoff_does_not_hold_up_other_channels():
+    async def main():
+        sent = []
+        failures = {'a': 1}
+        backoff_over = asyncio.Event()
+
+        async def transport(channel, content, reply_to, nonce):
+            if failures.get(channel):
+                failures[channel] -= 1
+                raise ConnectionError('reconnecting')
+            sent.append(channel)
+
+        async def sleep(delay):
+            await backoff_over.wait()
+
+        queue = SendQueue(transport, sleep=sleep)
+        first = queue.submit('a', 'hello')
+        second = queue.submit('b', 'hi')
+        assert await asyncio.wait_for(second, 1)
+        assert sent == ['b'] and not first.done()
+        # A duplicate of the message backing off joins it rather than queueing again
+        assert queue.submit('a', 'hello') is first
+        backoff_over.set()
+        assert await asyncio.wait_for(first, 1)
+        assert sent == ['b', 'a']
+        assert queue.stats()['retried'] == 1
+        await queue.close()
+    asyncio.run(main())
+
+
+def test_close_resolves_messages_backing_off():
+    async def main():
+        async def transport(channel, content, reply_to, nonce):
+            raise ConnectionError('down')
+
+        async def sleep(delay):
+            await asyncio.Event().wait()
+
+        queue = SendQueue(transport, sleep=sleep)
+        future = queue.submit('a', 'hello')
+        while not queue.stats()['backing_off']:
+            await asyncio.sleep(0)
+        await queue.close()
+        assert future.result() is False
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from store import StateStore
+
+
+def run(scenario, path):
+    async def main():
+        store = StateStore(str(path), flush_interval=0.01)
+        try:
+            await scenario(store)
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_values_json_cannot_hold_fail_in_set(tmp_path):
+    async def scenario(store):
+        store.set('a', 'k', 1)
+        with pytest.raises(TypeError):
+            store.set('a', 'bad', {1, 2})
+        await store.flush()
+        assert store.stats()['pending'] == 0
+        assert store.stats()['flush_errors'] == 0
+        assert await store.items('a') == {'k': 1}
+    run(scenario, tmp_path / 'state.db')
+
+    async def reopened(store):
+        assert await store.get('a', 'k') == 1
+        assert await store.get('a', 'bad') is None
+    run(reopened, tmp_path / 'state.db')
+
+
+def test_writes_survive_reopening(tmp_path):
+    async def scenario(store):
+        points = store.namespace('points')
+        points.set(42, {'total': 3})
+        assert await points.incr('alice', 5) == 5
+        assert await points.incr('alice') == 6
+        points.set('gone', 1)
+        points.delete('gone')
+    run(scenario, tmp_path / 'state.db')
+
+    async def reopened(store):
+        points = store.namespace('points')
+        assert await points.get('42') == {'total': 3}
+        assert await points.items() == {'42': {'total': 3}, 'alice': 6}
+        assert await points.get('gone', 'missing') == 'missing'
+    run(reopened, tmp_path / 'state.db')
+
+
+def test_pending_writes_read_back_after_cache_eviction(tmp_path):
+    async def scenario(store):
+        store.cache_size = 2
+        for index in range(5):
+            store.set('n', index, [index])
+        assert [await store.get('n', index) for index in range(5)] == [[index] for index in range(5)]
+    run(scenario, tmp_path / 'state.db')
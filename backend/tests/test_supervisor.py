@@ -0,0 +1,43 @@
+from supervisor import HashRing
+
+CHANNELS = [f'channel{index}' for index in range(2000)]
+
+
+def owners(ring):
+    return {channel: ring.node_for(channel) for channel in CHANNELS}
+
+
+def test_every_node_gets_a_share():
+    ring = HashRing(range(4))
+    assignment = ring.assign(CHANNELS)
+    assert set(assignment) == {0, 1, 2, 3}
+    assert sum(len(channels) for channels in assignment.values()) == len(CHANNELS)
+    assert all(len(channels) > len(CHANNELS) / 8 for channels in assignment.values())
+
+
+def test_removing_a_node_only_moves_its_channels():
+    ring = HashRing(range(4))
+    before = owners(ring)
+    ring.remove(2)
+    after = owners(ring)
+    for channel in CHANNELS:
+        if before[channel] != 2:
+            assert after[channel] == before[channel]
+        else:
+            assert after[channel] in {0, 1, 3}
+    # The removed node's channels spread over more than one survivor
+    assert len({after[channel] for channel in CHANNELS if before[channel] == 2}) > 1
+
+
+def test_adding_a_node_back_restores_the_assignment():
+    ring = HashRing(range(4))
+    before = owners(ring)
+    ring.remove(1)
+    ring.add(1)
+    assert owners(ring) == before
+
+
+def test_empty_ring():
+    ring = HashRing()
+    assert ring.node_for('channel0') is None
+    assert ring.assign(CHANNELS) == {}
@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from http_client import HttpResponse
+from token_manager import TokenManager
+
+
+class FakeHttp:
+    """Answers /validate and /token from canned results; an exception is raised"""
+
+    def __init__(self, validate, token):
+        self.results = {'validate': validate, 'token': token}
+        self.calls = []
+        self.closed = False
+
+    def _answer(self, path):
+        self.calls.append(path)
+        result = self.results[path]
+        if isinstance(result, Exception):
+            raise result
+        status, body = result
+        return HttpResponse(status, {}, json.dumps(body).encode(), 0.0)
+
+    async def get(self, url, **kwargs):
+        return self._answer(url.rsplit('/', 1)[-1])
+
+    async def post(self, url, **kwargs):
+        return self._answer(url.rsplit('/', 1)[-1])
+
+    async def close(self):
+        self.closed = True
+
+
+def manager(tmp_path, http):
+    return TokenManager('id', 'secret', 'old-access', 'old-refresh', http_client=http,
+                        env_path=str(tmp_path / '.env'))
+
+
+NEW_TOKENS = (200, {'access_token': 'new-access', 'refresh_token': 'new-refresh', 'expires_in': 14400})
+
+
+def test_unreachable_validate_falls_back_to_refresh(tmp_path):
+    http = FakeHttp(validate=ConnectionError('unreachable'), token=NEW_TOKENS)
+    tokens = manager(tmp_path, http)
+    assert asyncio.run(tokens.ensure_valid())
+    assert http.calls == ['validate', 'token']
+    assert tokens.access_token == 'new-access'
+
+
+def test_unreachable_validate_and_refresh_fails(tmp_path):
+    http = FakeHttp(validate=ConnectionError('unreachable'), token=ConnectionError('unreachable'))
+    tokens = manager(tmp_path, http)
+    assert not asyncio.run(tokens.ensure_valid())
+    assert tokens.access_token == 'old-access'
+
+
+def test_valid_token_is_not_refreshed(tmp_path):
+    http = FakeHttp(validate=(200, {'login': 'bot', 'user_id': '1', 'expires_in': 14400}), token=NEW_TOKENS)
+    tokens = manager(tmp_path, http)
+    assert asyncio.run(tokens.ensure_valid())
+    assert http.calls == ['validate']
+
+
+def test_rejected_token_is_refreshed(tmp_path):
+    http = FakeHttp(validate=(401, {'status': 401}), token=NEW_TOKENS)
+    tokens = manager(tmp_path, http)
+    assert asyncio.run(tokens.ensure_valid())
+    assert tokens.refresh_token == 'new-refresh'
+
+
+def test_close_leaves_a_passed_in_client_open(tmp_path):
+    http = FakeHttp(validate=ConnectionError('unused'), token=NEW_TOKENS)
+    asyncio.run(manager(tmp_path, http).close())
+    assert not http.closed
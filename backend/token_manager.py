@@ -0,0 +1,216 @@
+import os
+import time
+import asyncio
+import logging
+from http_client import HttpClient, OAUTH_URL
+
+logger = logging.getLogger('twitch_bot')
+
+# ENV_FILE runs the bot from another account's credentials, e.g. one written by oauth_provision.py
+ENV_PATH = os.getenv('ENV_FILE') or os.path.join(os.path.dirname(__file__), '.env')
+# Refresh once less than this many seconds of the token's lifetime remain
+REFRESH_MARGIN = 3600
+# Twitch asks apps using IRC to validate their token at least once an hour
+VALIDATE_INTERVAL = 3600
+# Wait before trying again after the token endpoint could not be reached
+RETRY_INTERVAL = 300
+# Never check more often than this, even for tokens shorter-lived than the margin
+MIN_CHECK_INTERVAL = 60
+
+
+def write_env(path, values):
+    """Set KEY=value lines in a .env file with a single atomic replace"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        lines = []
+    pending = dict(values)
+    for index, line in enumerate(lines):
+        key = line.split('=', 1)[0].strip()
+        if key in pending:
+            lines[index] = f"{key}={pending.pop(key)}"
+    lines += [f"{key}={value}" for key, value in pending.items()]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class TokenManager:
+    """Owns the OAuth access/refresh token pair for the whole process.
+
+    The next refresh is scheduled from the token's known expires_in rather
+    than found by polling, concurrent refresh() calls share a single request,
+    new tokens are written to .env atomically and handed to every subscriber
+    (IRC connections, HTTP clients, worker processes).
+    """
+
+    def __init__(self, client_id, client_secret, access_token, refresh_token, http_client=None,
+                 env_path=ENV_PATH, refresh_margin=REFRESH_MARGIN, clock=time.monotonic,
+                 sleep=asyncio.sleep):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        # A client passed in belongs to its caller, usually the bot's shared pool, and is left open
+        self.http_client = http_client or HttpClient()
+        self._owns_client = http_client is None
+        self.env_path = env_path
+        self.refresh_margin = refresh_margin
+        self.clock = clock
+        self.sleep = sleep
+        self.expires_at = None
+        self.login = None
+        self.user_id = None
+        self.validations = 0
+        self.refreshes = 0
+        self._subscribers = []
+        self._refreshing = None
+        self._task = None
+
+    @classmethod
+    def from_credentials(cls, auth_creds, **kwargs):
+        return cls(auth_creds['client_id'], auth_creds['client_secret'],
+                   auth_creds['access_token'], auth_creds['refresh_token'], **kwargs)
+
+    def use_http_client(self, http_client):
+        """Send OAuth calls through a client owned elsewhere, such as the bot's pool"""
+        self.http_client = http_client
+        self._owns_client = False
+
+    def subscribe(self, callback):
+        """Call callback(access_token, refresh_token) after every refresh"""
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def expires_in(self):
+        """Seconds of lifetime left, or None if unknown"""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - self.clock()
+
+    async def validate(self):
+        """Check the token with Twitch; True if valid, False if rejected, None if unreachable"""
+        self.validations += 1
+        try:
+            response = await self.http_client.get(f'{OAUTH_URL}/validate', headers={
+                'Authorization': f'Bearer {self.access_token}',
+                'Client-Id': self.client_id
+            })
+        except Exception as e:
+            logger.error(f"Error validating token: {str(e)}")
+            return None
+        if response.status_code != 200:
+            logger.warning(f"Token validation failed: {response.status_code}")
+            return False if response.status_code == 401 else None
+        data = response.json()
+        self.login = data.get('login')
+        self.user_id = data.get('user_id')
+        self.expires_at = self.clock() + data.get('expires_in', 0)
+        logger.info(f"Token validated successfully. User: {self.login}, expires in: {data.get('expires_in')} seconds")
+        return True
+
+    def refresh(self):
+        """Refresh the token; callers arriving while a refresh runs share its result"""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._refresh())
+        return asyncio.shield(self._refreshing)
+
+    async def _refresh(self):
+        self.refreshes += 1
+        try:
+            response = await self.http_client.post(f'{OAUTH_URL}/token', data={
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'refresh_token': self.refresh_token,
+                'grant_type': 'refresh_token'
+            })
+            response.raise_for_status()
+            token_data = response.json()
+        except Exception as e:
+            logger.error(f"Failed to refresh OAuth token: {str(e)}")
+            return False
+
+        self.access_token = token_data['access_token']
+        self.refresh_token = token_data['refresh_token']
+        if token_data.get('expires_in'):
+            self.expires_at = self.clock() + token_data['expires_in']
+
+        try:
+            write_env(self.env_path, {'ACCESS_TOKEN': self.access_token, 'REFRESH_TOKEN': self.refresh_token})
+        except OSError as e:
+            logger.error(f"Could not save refreshed tokens to {self.env_path}: {str(e)}")
+
+        logger.info("OAuth token refreshed successfully")
+        for callback in list(self._subscribers):
+            try:
+                callback(self.access_token, self.refresh_token)
+            except Exception as e:
+                logger.error(f"Error applying refreshed token: {str(e)}")
+        return True
+
+    async def ensure_valid(self):
+        """Validate the token and refresh it if it was rejected, could not be checked or is close to expiry"""
+        valid = await self.validate()
+        if valid is False:
+            return await self.refresh()
+        if valid is None:
+            # The token may have expired while Twitch was unreachable; a refresh settles it either way
+            logger.info("Token could not be validated, refreshing...")
+            return await self.refresh()
+        remaining = self.expires_in()
+        if remaining is not None and remaining < self.refresh_margin:
+            logger.info("Token is close to expiry, refreshing...")
+            return await self.refresh()
+        return True
+
+    def next_check_delay(self):
+        """Seconds until the token needs attention again"""
+        remaining = self.expires_in()
+        if remaining is None:
+            return RETRY_INTERVAL
+        return max(MIN_CHECK_INTERVAL, min(VALIDATE_INTERVAL, remaining - self.refresh_margin))
+
+    async def run(self):
+        """Keep the token fresh until cancelled"""
+        # A token validated before the loop started needs no immediate check
+        delay = self.next_check_delay() if self.expires_at is not None else 0
+        while True:
+            await self.sleep(delay)
+            try:
+                ok = await self.ensure_valid()
+                delay = self.next_check_delay() if ok else RETRY_INTERVAL
+            except Exception as e:
+                logger.error(f"Error in token check loop: {str(e)}")
+                delay = RETRY_INTERVAL
+
+    def start(self, loop=None):
+        loop = loop or asyncio.get_event_loop()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self.run())
+        return self._task
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._owns_client:
+            await self.http_client.close()
+
+    def run_sync(self, method):
+        """Run a coroutine method from synchronous code, e.g. before the bot's loop exists"""
+        async def run():
+            try:
+                return await method()
+            finally:
+                # The pooled session belongs to this temporary loop
+                await self.http_client.close()
+        return asyncio.run(run())
@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 import os
 import sys
-import webbrowser
 import requests
-import json
-import time
+import secrets
 from urllib.parse import urlparse, parse_qs
+from oauth_provision import REDIRECT_URI, ProvisionError, authorize_url, capture_code, error_fields
 
 print("Twitch OAuth Token Setup Script for Moderator Bot")
 print("=========================================================")
@@ -22,6 +21,7 @@ print("5. Click 'Create'")
 print("6. You will see your Client ID")
 print("7. Click 'New Secret' to generate your Client Secret")
 print("   (Save both Client ID and Secret - you won't see the Secret again!)\n")
+print("To set up many bot accounts without prompts, use oauth_provision.py instead.\n")
 print("=========================================================\n")
 
 # Function to get user input
@@ -53,9 +53,9 @@ temp_env_data = {
     'CLIENT_SECRET': client_secret,
 }
 
-# Generate authorization URL
-scopes = 'chat:read+chat:edit+channel:moderate+moderator:manage:chat_messages+moderator:manage:banned_users+moderator:read:followers+whispers:edit+whispers:read+user:manage:whispers'
-auth_url = f"https://id.twitch.tv/oauth2/authorize?response_type=code&client_id={client_id}&redirect_uri=http://localhost:3000&scope={scopes}&force_verify=true"
+# Generate authorization URL; state ties the redirect to this request
+state = secrets.token_urlsafe(16)
+auth_url = authorize_url(client_id, state=state)
 
 print("\n============ IMPORTANT ============")
 print("1. Before continuing, LOG OUT of your main Twitch account")
@@ -73,18 +73,26 @@ input("After completing these steps, press Enter to continue...")
 # Opening authorization URL in browser
 print(f"\nOpening authorization URL. Log in to the BOT account ({bot_username}) and allow access.")
 print(f"Authorization URL: {auth_url}")
-webbrowser.open(auth_url)
 
-# Wait for authorization code input
-print("\nAfter authorization, you will be redirected to localhost with a 'This site can't be reached' error.")
-print("Copy the entire URL from your browser's address bar (it contains the authorization code).")
+# A local server on the redirect URL picks up the code; pasting the URL is the fallback
+auth_code = None
+try:
+    print(f"Waiting for the redirect to {REDIRECT_URI}...")
+    auth_code = capture_code(auth_url, state)
+except (OSError, ProvisionError) as e:
+    print(f"Could not capture the redirect automatically: {e}")
+
+if not auth_code:
+    print("\nIf no browser tab opened, open the authorization URL above yourself.")
+    print("After authorization, you will be redirected to localhost with a 'This site can't be reached' error.")
+    print("Copy the entire URL from your browser's address bar (it contains the authorization code).")
 
-redirect_url = get_input("Paste the full URL you were redirected to")
+    redirect_url = get_input("Paste the full URL you were redirected to")
 
-# Extract authorization code from URL
-parsed_url = urlparse(redirect_url)
-query_params = parse_qs(parsed_url.query)
-auth_code = query_params.get('code', [None])[0]
+    # Extract authorization code from URL
+    parsed_url = urlparse(redirect_url)
+    query_params = parse_qs(parsed_url.query)
+    auth_code = query_params.get('code', [None])[0]
 
 if not auth_code:
     print("Error: Could not extract authorization code from URL.")
@@ -101,7 +109,7 @@ payload = {
     'client_secret': client_secret,
     'code': auth_code,
     'grant_type': 'authorization_code',
-    'redirect_uri': 'http://localhost:3000'
+    'redirect_uri': REDIRECT_URI
 }
 
 try:
@@ -112,7 +120,7 @@ try:
     # Check if the response contains the required tokens
     if 'access_token' not in token_data or 'refresh_token' not in token_data:
         print("Error: Failed to get access tokens. Server response:")
-        print(json.dumps(token_data, indent=2))
+        print(error_fields(token_data))
         sys.exit(1)
     
     access_token = token_data['access_token']
@@ -169,31 +177,18 @@ try:
             env_file.write(f"{key}={value}\n")
     
     print("\nSetup completed successfully! .env file created/updated.")
-    print("Now you need to modify the bot code for proper message deletion.")
-    
-    # Instructions for code modification
-    print("\nRECOMMENDED CHANGES IN BOT CODE:")
-    print("Replace the corresponding part of the event_message method in main.py with:")
+    print("\nTo delete or time out messages automatically (spoilers, banned words), list the terms")
+    print("or patterns in a rules file and point MODERATION_RULES at it in .env, for example:")
     print("""
-    if is_spoiler:
-        logger.info(f"Spoiler detected in message from {message.author.name}: {message.content}")
-        logger.info(f"Message ID: {message.id}")
-        
-        try:
-            # Correct way to delete messages in twitchio
-            logger.info(f"Attempting to delete message with ID: {message.id}")
-            await message.channel.send(f"/delete {message.id}")
-            logger.info(f"Successfully sent delete command for message from {message.author.name}")
-            
-            # Notify about deletion reason
-            await message.channel.send(f"@{message.author.name}, your message was deleted because it contains a spoiler.")
-            logger.info(f"Notified user about spoiler message from {message.author.name}")
-        except Exception as e:
-            logger.error(f"Failed to delete message: {str(e)}")
-            # Send warning if we can't delete
-            await message.channel.send(f"@{message.author.name}, your message contains a spoiler! Please don't reveal spoilers in chat.")
-            logger.info(f"Warned user about spoiler message from {message.author.name}")
+    MODERATION_RULES=moderation_rules.json
+
+    [
+        {"term": "the ending", "action": "delete", "reason": "Spoiler"},
+        {"term": "bad word", "action": "timeout", "duration": 600},
+        {"pattern": "free\\\\s*v?bucks", "action": "ban"}
+    ]
     """)
+    print("A plain text file with one term per line works too; every term then deletes the message.")
     
 except requests.exceptions.RequestException as e:
     print(f"Error requesting tokens: {e}")
@@ -0,0 +1,360 @@
+import time
+import asyncio
+import logging
+from functools import partial
+from collections import OrderedDict, deque
+from send_queue import TokenBucket
+
+logger = logging.getLogger('twitch_bot')
+
+# Helix whisper limits for the sending user: (whispers, seconds)
+WHISPER_LIMITS = ((3, 1.0), (100, 60.0))
+# Twitch allows whispering at most 40 recipients per day that were never whispered before
+NEW_RECIPIENT_LIMIT = (40, 86400.0)
+# Pacing of back-to-back whispers to the same recipient
+RECIPIENT_LIMIT = (1, 1.0)
+# GET /users accepts up to 100 login parameters
+USERS_BATCH = 100
+# Latencies kept for percentiles
+LATENCY_SAMPLES = 1000
+# Recipients remembered as already whispered; one forgotten only counts as new again
+KNOWN_RECIPIENTS = 10000
+
+
+def _track(tasks, coro):
+    """Run coro as a task held in tasks until it finishes, logging what it raises"""
+    task = asyncio.ensure_future(coro)
+    tasks.add(task)
+    task.add_done_callback(partial(_task_done, tasks))
+    return task
+
+
+def _task_done(tasks, task):
+    tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Whisper task failed: {task.exception()!r}")
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class UserCache:
+    """LRU/TTL cache of login name -> user ID.
+
+    Lookups that miss are collected for one loop iteration and resolved
+    with batched ``fetch(logins)`` calls of up to 100 names, so a burst of
+    whispers to new recipients costs one Helix request per hundred names.
+    Unknown logins are remembered for a shorter negative_ttl.
+    """
+
+    def __init__(self, fetch, maxsize=10000, ttl=3600.0, negative_ttl=300.0, clock=time.monotonic):
+        self.fetch = fetch
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._waiting = {}
+        self._flush = None
+        self._tasks = set()
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, login, user_id, ttl=None):
+        login = login.lower()
+        self._entries[login] = (user_id, self.clock() + (ttl or self.ttl))
+        self._entries.move_to_end(login)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _cached(self, login):
+        entry = self._entries.get(login)
+        if entry is None:
+            return False, None
+        if entry[1] <= self.clock():
+            del self._entries[login]
+            return False, None
+        self._entries.move_to_end(login)
+        return True, entry[0]
+
+    def resolve(self, login):
+        """Return a future for the user ID of a login (None if the user does not exist)"""
+        login = login.lower().lstrip('@')
+        loop = asyncio.get_running_loop()
+        found, user_id = self._cached(login)
+        if found:
+            self.hits += 1
+            future = loop.create_future()
+            future.set_result(user_id)
+            return future
+        self.misses += 1
+        future = self._waiting.get(login)
+        if future is None:
+            future = self._waiting[login] = loop.create_future()
+            if self._flush is None:
+                # Everything that misses during this iteration goes into the same requests
+                self._flush = loop.call_soon(self._start_fetch)
+        return future
+
+    def _start_fetch(self):
+        self._flush = None
+        waiting, self._waiting = self._waiting, {}
+        logins = list(waiting)
+        for start in range(0, len(logins), USERS_BATCH):
+            batch = {login: waiting[login] for login in logins[start:start + USERS_BATCH]}
+            _track(self._tasks, self._fetch_batch(batch))
+
+    async def _fetch_batch(self, batch):
+        self.requests += 1
+        try:
+            found = await self.fetch(list(batch))
+        except Exception as e:
+            logger.error(f"Failed to look up {len(batch)} user IDs: {str(e)}")
+            found = None
+        for login, future in batch.items():
+            if found is None:
+                user_id = None
+            else:
+                user_id = found.get(login)
+                self.put(login, user_id, None if user_id else self.negative_ttl)
+            if not future.done():
+                future.set_result(user_id)
+
+
+class Whisper:
+    __slots__ = ('recipient', 'user_id', 'message', 'future', 'queued_at', 'attempts')
+
+    def __init__(self, recipient, user_id, message, future, queued_at):
+        self.recipient = recipient
+        self.user_id = user_id
+        self.message = message
+        self.future = future
+        self.queued_at = queued_at
+        self.attempts = 0
+
+
+class WhisperQueue:
+    """Delivers whispers in the background within Twitch's whisper limits.
+
+    ``transport(user_id, message)`` performs the Helix call and returns its
+    response. Whispers to one recipient keep their order and are paced by
+    recipient_limit; all whispers share the global limits. A 429 pauses
+    delivery until its Ratelimit-Reset and puts the whisper back in front.
+    Recipients without a known user ID are resolved through ``resolve``.
+    """
+
+    def __init__(self, transport, resolve=None, clock=time.monotonic, sleep=asyncio.sleep,
+                 limits=WHISPER_LIMITS, recipient_limit=RECIPIENT_LIMIT,
+                 new_recipient_limit=NEW_RECIPIENT_LIMIT, max_attempts=3, max_depth=1000):
+        self.transport = transport
+        self.resolve = resolve
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = [TokenBucket(*limit) for limit in limits]
+        self.recipient_limit = recipient_limit
+        self.new_recipients = TokenBucket(*new_recipient_limit) if new_recipient_limit else None
+        self.max_attempts = max_attempts
+        self.max_depth = max_depth
+        self._queue = deque()
+        self._recipients = {}
+        self._known = OrderedDict()
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._worker = None
+        self._tasks = set()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        # Optional histogram observing submit-to-delivery latency
+        self.latency = None
+        # Metrics
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.dropped = 0
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def submit(self, recipient, message, user_id=None):
+        """Queue a whisper and return a future resolved with True once delivered"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if len(self._queue) >= self.max_depth:
+            self.dropped += 1
+            logger.warning(f"Whisper queue full, dropping whisper to {recipient}")
+            future.set_result(False)
+            return future
+        whisper = Whisper(recipient.lower().lstrip('@'), user_id, message, future, self.clock())
+        if user_id is None:
+            if self.resolve is None:
+                raise ValueError("A user ID is required when no resolver is configured")
+            self._spawn(self._resolve_and_queue(whisper))
+        else:
+            self._enqueue(whisper)
+        return future
+
+    async def _resolve_and_queue(self, whisper):
+        try:
+            whisper.user_id = await self.resolve(whisper.recipient)
+        except asyncio.CancelledError:
+            self._finish(whisper, False)
+            raise
+        if whisper.user_id is None:
+            logger.error(f"Cannot whisper {whisper.recipient}: unknown user")
+            self._finish(whisper, False)
+            return
+        self._enqueue(whisper)
+
+    def _enqueue(self, whisper, front=False):
+        if front:
+            self._queue.appendleft(whisper)
+        else:
+            self._queue.append(whisper)
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        self._wakeup.set()
+
+    def _spawn(self, coro):
+        _track(self._tasks, coro)
+
+    def _finish(self, whisper, delivered):
+        if delivered:
+            self.sent += 1
+            latency = self.clock() - whisper.queued_at
+            self._latencies.append(latency)
+            if self.latency is not None:
+                self.latency.observe(latency)
+        else:
+            self.failed += 1
+        if not whisper.future.done():
+            whisper.future.set_result(delivered)
+
+    def _recipient_bucket(self, user_id):
+        bucket = self._recipients.get(user_id)
+        if bucket is None:
+            if len(self._recipients) >= 10 * self.max_depth:
+                # Forget recipients whose pacing window has passed
+                now = self.clock()
+                self._recipients = {key: value for key, value in self._recipients.items()
+                                    if value.delay(now) or value.tokens < value.capacity}
+            bucket = self._recipients[user_id] = TokenBucket(*self.recipient_limit)
+        return bucket
+
+    def _pick(self, now):
+        """The first whisper whose recipient may receive now, keeping per-recipient order"""
+        blocked = set()
+        soonest = None
+        for whisper in self._queue:
+            if whisper.user_id in blocked:
+                continue
+            delay = self._recipient_bucket(whisper.user_id).delay(now)
+            if not delay:
+                return whisper, 0.0
+            blocked.add(whisper.user_id)
+            soonest = delay if soonest is None else min(soonest, delay)
+        return None, soonest
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = self.clock()
+            wait = max([self._paused_until - now] + [bucket.delay(now) for bucket in self.buckets])
+            if wait > 0:
+                await self.sleep(max(wait, 0.001))
+                continue
+            whisper, wait = self._pick(now)
+            if whisper is None:
+                await self.sleep(max(wait, 0.001))
+                continue
+
+            self._queue.remove(whisper)
+            if self.new_recipients is not None:
+                if whisper.user_id in self._known:
+                    self._known.move_to_end(whisper.user_id)
+                elif not self.new_recipients.take(now):
+                    logger.error(f"Daily limit of new whisper recipients reached, not whispering {whisper.recipient}")
+                    self._finish(whisper, False)
+                    continue
+                else:
+                    self._known[whisper.user_id] = None
+                    if len(self._known) > KNOWN_RECIPIENTS:
+                        self._known.popitem(last=False)
+            for bucket in self.buckets:
+                bucket.take(now)
+            self._recipient_bucket(whisper.user_id).take(now)
+            self._spawn(self._deliver(whisper))
+
+    async def _deliver(self, whisper):
+        whisper.attempts += 1
+        try:
+            response = await self.transport(whisper.user_id, whisper.message)
+        except asyncio.CancelledError:
+            self._finish(whisper, False)
+            raise
+        except Exception as e:
+            logger.error(f"Error sending whisper to {whisper.recipient}: {str(e)}")
+            self._finish(whisper, False)
+            return
+
+        if response.status_code == 204:
+            self._finish(whisper, True)
+        elif response.status_code == 429 and whisper.attempts < self.max_attempts:
+            self.rate_limited += 1
+            self.retried += 1
+            self._paused_until = max(self._paused_until, self.clock() + self._reset_delay(response))
+            self._enqueue(whisper, front=True)
+        else:
+            logger.error(f"Failed to send whisper to {whisper.recipient}: {response.status_code} {response.text}")
+            self._finish(whisper, False)
+
+    def _reset_delay(self, response):
+        reset = response.headers.get('Ratelimit-Reset')
+        if reset:
+            try:
+                return max(0.0, float(reset) - time.time())
+            except ValueError:
+                pass
+        return 1.0
+
+    def stats(self):
+        """Delivery counters and latency percentiles (seconds from submit to delivery)"""
+        ordered = sorted(self._latencies)
+        return {
+            'depth': self.depth,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'rate_limited': self.rate_limited,
+            'dropped': self.dropped,
+            'latency_p50': _percentile(ordered, 50),
+            'latency_p95': _percentile(ordered, 95),
+            'latency_p99': _percentile(ordered, 99),
+            'latency_max': ordered[-1] if ordered else 0.0
+        }
+
+    async def close(self):
+        """Stop delivery; whispers still queued are reported as not delivered"""
+        tasks = list(self._tasks)
+        if self._worker is not None:
+            tasks.append(self._worker)
+            self._worker = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for whisper in self._queue:
+            if not whisper.future.done():
+                whisper.future.set_result(False)
+        self._queue.clear()